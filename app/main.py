@@ -1,22 +1,59 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from dotenv import load_dotenv
+
+# Before the app imports: service modules read their tuning knobs from the environment at import time
+load_dotenv()
+
 from app.routers import intake
 from app.routers import ask
+from app.routers import audit
+from app.routers import jobs
+from app.routers import metrics
 
 
-from app.utils.logging import new_request_id, audit_log
+from app.services.clients import aclose_clients
+from app.services.jobs import start_workers, stop_workers
+from app.services.sop_ingest import warm_vector_store
+from app.services.todoist import warm_project_directory
+from app.services.todoist_writer import todoist_writer
+from app.utils.logging import new_request_id, audit_log, shutdown_audit_writer, start_audit_writer
+from app.utils.metrics import HTTP_SECONDS, begin_request
+from app.utils.profiler import profile_if_slow, start_profiler, stop_profiler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_audit_writer()
+    start_profiler()  # no-op unless PROFILE_SLOW_MS is set
+    # Load the SOP index once; searches then serve from memory
+    warm_vector_store()
+    await warm_project_directory()
+    todoist_writer.start()
+    start_workers()  # JOB_WORKERS=0 when workers run as their own service
+    yield
+    stop_workers()
+    await todoist_writer.stop()  # flush queued task writes before the HTTP clients go away
+    await aclose_clients()
+    stop_profiler()
+    shutdown_audit_writer()  # last: everything above may still emit audit records
 
-load_dotenv()
 
-app = FastAPI(title="Pillar 2 Ops Automation PoC")
+app = FastAPI(title="Pillar 2 Ops Automation PoC", lifespan=lifespan)
 app.include_router(intake.router)
 app.include_router(ask.router)
+app.include_router(audit.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
 
 
 @app.middleware("http")
 async def add_request_id_and_audit(request: Request, call_next):
     request_id = new_request_id()
     request.state.request_id = request_id
+    # Shared with the route (and anything it spawns): spans add their time per stage
+    timings = begin_request()
 
     audit_log(
         request_id=request_id,
@@ -26,23 +63,37 @@ async def add_request_id_and_audit(request: Request, call_next):
 
     try:
         response = await call_next(request)
-        audit_log(
-            request_id=request_id,
-            event="http_response",
-            payload={"status_code": response.status_code, "path": request.url.path},
-        )
-        response.headers["X-Request-Id"] = request_id
-        return response
     except Exception as e:
+        HTTP_SECONDS.observe(timings.elapsed_ms() / 1000, request.method, _route(request), "500")
         audit_log(
             request_id=request_id,
             event="http_exception",
             status="error",
-            payload={"path": request.url.path},
+            payload={"path": request.url.path, "stages": timings.stage_ms()},
             error=str(e),
         )
         raise
 
+    elapsed_ms = timings.elapsed_ms()
+    HTTP_SECONDS.observe(elapsed_ms / 1000, request.method, _route(request), str(response.status_code))
+    payload = {"status_code": response.status_code, "path": request.url.path, "stages": timings.stage_ms()}
+    if timings.counts:
+        payload["counts"] = dict(timings.counts)
+    profile = await profile_if_slow(request_id, timings.started, elapsed_ms)
+    if profile:
+        payload["profile"] = profile
+    audit_log(request_id=request_id, event="http_response", payload=payload, duration_ms=elapsed_ms)
+    response.headers["X-Request-Id"] = request_id
+    response.headers["Server-Timing"] = ", ".join(
+        f"{stage};dur={ms}" for stage, ms in [*timings.stage_ms().items(), ("total", elapsed_ms)]
+    )
+    return response
+
+def _route(request: Request) -> str:
+    # Path template, not the raw path: keeps /jobs/{job_id} one series
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -14,3 +14,5 @@ class TaskPayload(BaseModel):
     needs_escalation: bool = False
     sop_confidence: float = 0.0
     sop_citations: List[dict] = []
+    matched_rules: List[str] = []
+    routing_stage: str = "keywords"
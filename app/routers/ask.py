@@ -1,29 +1,55 @@
+import json
+from typing import Dict, Optional
+
 from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from app.services.rag import answer_from_sops
+from app.services.rag import answer_from_sops_async, stream_answer_from_sops
 
 
-from app.services.sop_ingest import ingest_expenses_sop, search_sops
+from app.services.sop_ingest import SOP_DIR, search_sops_async
+from app.services.jobs import enqueue
+from app.services.answer_cache import answer_cache
+from app.services.clients import connection_stats
+from app.services.embed_cache import query_cache
+from app.services.embeddings import get_embedder
 from app.utils.logging import audit_log
+from app.utils.metrics import current_timings
 
 router = APIRouter()
 
-class SearchRequest(BaseModel):
+class SearchFilters(BaseModel):
+    # Exact-match restrictions on which chunks can be retrieved (all optional)
+    source: Optional[str] = None
+    document: Optional[str] = None
+    section: Optional[str] = None
+
+    def as_filters(self) -> Optional[Dict[str, str]]:
+        filters = {k: getattr(self, k) for k in ("source", "document", "section") if getattr(self, k) is not None}
+        return filters or None
+
+class SearchRequest(SearchFilters):
     query: str
     top_k: int = 4
 
 @router.post("/sop/ingest")
 def sop_ingest(request: Request):
+    """
+    Queue a (re)ingest and respond 202 with its job id; poll /jobs/{job_id}.
+    Only one ingest runs at a time; calls while one is queued join that job.
+    """
     request_id = request.state.request_id
-    result = ingest_expenses_sop()
-    audit_log(request_id, "sop_ingested", payload=result)
-    return result
+    job = enqueue("sop_ingest", {"root": str(SOP_DIR)}, lock_key=f"sop_ingest:{SOP_DIR}")
+    audit_log(request_id, "sop_ingest_queued", payload={"job_id": job["id"]})
+    return JSONResponse(status_code=202, content={"ok": True, "job_id": job["id"], "status": job["status"]})
 
 @router.post("/sop/search")
-def sop_search(body: SearchRequest, request: Request):
+async def sop_search(body: SearchRequest, request: Request):
     request_id = request.state.request_id
-    result = search_sops(query=body.query, top_k=body.top_k)
-    audit_log(request_id, "sop_search", payload={"query": body.query, "top_k": body.top_k})
+    result = await search_sops_async(query=body.query, top_k=body.top_k, filters=body.as_filters())
+    audit_log(
+        request_id, "sop_search", payload={"query": body.query, "top_k": body.top_k, "filters": body.as_filters()}
+    )
     return result
 
 @router.get("/debug/env")
@@ -33,19 +59,62 @@ def debug_env(request: Request):
         "has_openai_key": bool(os.getenv("OPENAI_API_KEY", "").strip()),
         "has_todoist_token": bool(os.getenv("TODOIST_API_TOKEN", "").strip()),
         "cwd": os.getcwd(),
-        "sop_exists": __import__("pathlib").Path("data/sops/expenses_sop.txt").exists(),
+        "sop_exists": SOP_DIR.exists(),
+        "embed_provider": get_embedder().name,
     }
 
-class AskRequest(BaseModel):
+@router.get("/debug/cache")
+def debug_cache():
+    return {"query_embeddings": query_cache.stats(), "answers": answer_cache.stats()}
+
+@router.get("/debug/connections")
+def debug_connections():
+    return connection_stats()
+
+class AskRequest(SearchFilters):
     question: str
     top_k: int = 4
 
 @router.post("/ask")
-def ask(body: AskRequest, request: Request):
+async def ask(body: AskRequest, request: Request):
     request_id = request.state.request_id
-    result = answer_from_sops(question=body.question, top_k=body.top_k)
+    result = await answer_from_sops_async(question=body.question, top_k=body.top_k, filters=body.as_filters())
 
     audit_log(request_id, "rag_answer", payload={"question": body.question, "confidence": result.get("confidence")})
     return result
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/ask/stream")
+async def ask_stream(body: AskRequest, request: Request):
+    """
+    Server-Sent Events version of /ask: `retrieval` (citations + confidence) first,
+    then `token` deltas, then `answer` (structured), then `done`.
+    """
+    request_id = request.state.request_id
+
+    async def events():
+        confidence = None
+        try:
+            async for event, data in stream_answer_from_sops(
+                question=body.question, top_k=body.top_k, filters=body.as_filters()
+            ):
+                if event == "retrieval":
+                    confidence = data["confidence"]
+                yield _sse(event, data)
+        except Exception as e:
+            audit_log(request_id, "rag_answer_stream", status="error", payload={"question": body.question}, error=str(e))
+            yield _sse("error", {"error": str(e)})
+            return
+        # The http_response record is written before the body streams, so token counts go here
+        timings = current_timings()
+        counts = dict(timings.counts) if timings is not None else {}
+        audit_log(request_id, "rag_answer_stream", payload={"question": body.question, "confidence": confidence, **counts})
+        yield _sse("done", {})
 
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,24 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from app.utils.logging import search_audit
+
+router = APIRouter()
+
+@router.get("/audit/search")
+def audit_search(
+    request_id: Optional[str] = None,
+    event: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 100,
+):
+    try:
+        records = search_audit(
+            request_id=request_id, event=event, status=status, since=since, until=until, limit=min(limit, 1000)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"since/until must be ISO-8601 dates or times: {e}")
+    return {"count": len(records), "records": records}
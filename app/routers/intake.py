@@ -1,103 +1,166 @@
+import asyncio
+import json
 import os
-from fastapi import APIRouter, Request
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
 
 from app.models.schemas import IntakeRequest, TaskPayload
-from app.services.router import classify, make_title
-from app.services.todoist import get_project_id_by_name, create_task, add_comment
-from app.services.rag import answer_from_sops
+from app.services.embed_cache import normalize_query
+from app.services.intake import audit_created, prepare_intake, submit_task
+from app.services.jobs import enqueue, get_write_status
+from app.services.intent import classify_many_async
+from app.services.router import Classification
+from app.services.sop_ingest import embed_queries_async
+from app.services.todoist_writer import todoist_writer
 from app.utils.logging import audit_log
+from app.utils.metrics import span
 
 router = APIRouter()
 
-def _build_sop_checklist() -> str:
-    # Static checklist extracted from SOP (deterministic, reliable)
-    return (
-        "SOP Checklist (Expenses):\n"
-        "- Payment: ONLY use the SFO card (no personal cards)\n"
-        "- Buyer name: QUANT LAB SFO FZCO\n"
-        "- TRN: 105069744800001\n"
-        "- Billing address: DMCC Business Centre, UT-11-CO-190, Uptown Tower, JLT, Dubai, UAE\n"
-        "- Shipping address: Villa 47A, Frond N, Palm Jumeirah, Dubai, UAE\n"
-        "- Valid tax invoice required (seller + buyer + TRN + date + amount)\n"
-        "- Upload invoice to: SFO Purchases – Invoices (Google Drive)\n"
-        "- No mixing personal and company items\n"
-    )
+BULK_MAX_ITEMS = int(os.getenv("INTAKE_BULK_MAX_ITEMS", "5000"))
+BULK_CONCURRENCY = int(os.getenv("INTAKE_BULK_CONCURRENCY", "8"))  # concurrent RAG enrichments per bulk call
+
+def _audit_when_written(request_id: str, payload: TaskPayload):
+    def done(fut: asyncio.Future) -> None:
+        if fut.cancelled():
+            return
+        if fut.exception() is not None:
+            audit_log(request_id, "intake_task_failed", status="error", error=str(fut.exception()))
+        else:
+            audit_created(request_id, payload, fut.result())
+    return done
 
 @router.post("/intake")
-def intake(body: IntakeRequest, request: Request):
+async def intake(body: IntakeRequest, request: Request, wait: bool = True, background: bool = False):
+    """
+    wait=true (default): respond once the task + comment exist in Todoist.
+    wait=false: respond 202 with an accepted_id as soon as the write is queued;
+    poll /intake/status/{accepted_id} for the Todoist ids.
+    background=true: respond 202 with a job_id before any enrichment; a job worker
+    classifies, enriches and writes the task. Poll /jobs/{job_id}.
+    """
     request_id = request.state.request_id
 
-    category, needs_approval = classify(body.message)
-
-    title = make_title(body.message)
-    description = f"Channel: {body.channel}\nRaw request: {body.message}"
-
-    # RAG enrichment only for expense/purchase category
-    sop_confidence = 0.0
-    sop_citations = []
-    rag_summary = None
-    needs_escalation = False
-
-    if category == "expense_purchase":
-        rag = answer_from_sops(question=body.message, top_k=4)
-        sop_confidence = rag.get("confidence", 0.0)
-        sop_citations = rag.get("citations", [])
-        needs_escalation = rag.get("needs_escalation", False)
-        rag_summary = rag.get("result") or rag.get("answer")
-
-    payload = TaskPayload(
-        title=title,
-        description=description,
-        category=category,
-        priority="high",
-        needs_approval=needs_approval,
-        needs_escalation=needs_escalation,
-        sop_confidence=sop_confidence,
-        sop_citations=sop_citations,
-    )
-
-    # Create Todoist task
-    project_name = os.getenv("TODOIST_PROJECT_NAME", "Inbox")
-    project_id = get_project_id_by_name(project_name)
-
-    task = create_task(content=payload.title, description=payload.description, project_id=project_id)
-
-    # Build comment (enrichment)
-    comment_parts = [
-        "Auto-enrichment (Pillar 2 PoC):",
-        f"- Category: {payload.category}",
-        f"- Priority: {payload.priority}",
-        f"- Needs approval: {payload.needs_approval}",
-        f"- SOP confidence: {payload.sop_confidence:.2f}",
-    ]
-
-    if payload.category == "expense_purchase":
-        comment_parts.append("")
-        comment_parts.append(_build_sop_checklist())
-        comment_parts.append("RAG Guidance (JSON):")
-        comment_parts.append(str(rag_summary))
-        comment_parts.append("")
-        comment_parts.append("Citations:")
-        for c in payload.sop_citations[:4]:
-            comment_parts.append(f"- {c.get('source')} | chunk {c.get('chunk')} | score {c.get('score'):.3f}")
-
-        if payload.needs_escalation:
-            comment_parts.append("")
-            comment_parts.append("⚠️ Escalation Required: SOP signal is low or SOP does not cover this request confidently.")
-
-    comment_text = "\n".join(comment_parts)
-    comment = add_comment(task_id=task["id"], content=comment_text)
-
-    audit_log(
-        request_id,
-        "intake_created_task",
-        payload={
+    if background:
+        job = enqueue("intake", {"body": body.model_dump(), "request_id": request_id})
+        audit_log(request_id, "intake_job_queued", payload={"job_id": job["id"]})
+        return JSONResponse(status_code=202, content={"ok": True, "job_id": job["id"], "status": job["status"]})
+
+    payload, comment_text = await prepare_intake(body)
+    accepted_id, written = await submit_task(payload, comment_text)
+
+    if not wait:
+        audit_log(request_id, "intake_queued_task", payload={"category": payload.category, "accepted_id": accepted_id})
+        written.add_done_callback(_audit_when_written(request_id, payload))
+        return JSONResponse(
+            status_code=202,
+            content={"ok": True, "accepted_id": accepted_id, "status": "queued", "payload": payload.model_dump()},
+        )
+
+    # shield: a client disconnect must not cancel a write other intakes are batched with
+    with span("todoist_write"):  # queue wait + Sync API call for the batch this task went out in
+        ids = await asyncio.shield(written)
+    audit_created(request_id, payload, ids)
+
+    return {"ok": True, "task_id": ids.get("task_id"), "comment_id": ids.get("comment_id"), "payload": payload.model_dump()}
+
+async def _parse_bulk(request: Request) -> List[IntakeRequest]:
+    raw = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", "") or "jsonl" in request.headers.get("content-type", ""):
+            rows = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+        else:
+            rows = json.loads(raw)
+        if not isinstance(rows, list):
+            raise ValueError("expected a JSON array of intake items")
+        return [IntakeRequest.model_validate(r) for r in rows]
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid bulk intake body: {e}")
+
+@router.post("/intake/bulk")
+async def intake_bulk(request: Request):
+    """
+    Many intakes in one call: a JSON array of {channel, message}, or NDJSON
+    (Content-Type: application/x-ndjson). Identical messages are processed once,
+    expense messages are embedded in one batched call (per item if that call fails),
+    enrichment runs with bounded concurrency and tasks coalesce into Sync API batches.
+    Responds with NDJSON: one line per item as it completes, then a summary line.
+    """
+    request_id = request.state.request_id
+    items = await _parse_bulk(request)
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per bulk intake")
+
+    # Deduplicate: later copies reuse the first one's result
+    first_by_key: Dict[Tuple[str, str], int] = {}
+    duplicates: Dict[int, List[int]] = {}
+    for i, item in enumerate(items):
+        key = (item.channel, normalize_query(item.message))
+        if key in first_by_key:
+            duplicates[first_by_key[key]].append(i)
+        else:
+            first_by_key[key] = i
+            duplicates[i] = []
+    unique = list(duplicates)
+
+    # Batched routing + embeddings are a shortcut only: if either call fails (no key, 429s
+    # exhausted), each item classifies / embeds on its own and reports its own error
+    classifications: Dict[int, Classification] = {}
+    q_embs: Dict[int, np.ndarray] = {}
+    try:
+        classified = await classify_many_async([items[i].message for i in unique])
+        classifications = dict(zip(unique, classified))
+        expense = [i for i in unique if classifications[i].category == "expense_purchase"]
+        if expense:
+            embeddings = await embed_queries_async([items[i].message for i in expense])
+            q_embs = {i: embeddings[j:j + 1] for j, i in enumerate(expense)}
+    except Exception as e:
+        audit_log(request_id, "intake_bulk_batch_failed", status="error", error=str(e))
+
+    sem = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def process(i: int) -> Tuple[int, Dict[str, Any]]:
+        try:
+            async with sem:
+                payload, comment_text = await prepare_intake(items[i], classifications.get(i), q_embs.get(i))
+            _, written = await submit_task(payload, comment_text)
+            ids = await asyncio.shield(written)
+        except Exception as e:
+            return i, {"ok": False, "error": str(e)}
+        audit_created(request_id, payload, ids)
+        return i, {
+            "ok": True,
+            "task_id": ids.get("task_id"),
+            "comment_id": ids.get("comment_id"),
             "category": payload.category,
             "needs_approval": payload.needs_approval,
             "needs_escalation": payload.needs_escalation,
-            "task_id": task.get("id"),
-            "comment_id": comment.get("id"),
-        },
-    )
-
-    return {"ok": True, "task_id": task.get("id"), "comment_id": comment.get("id"), "payload": payload.model_dump()}
+            "sop_confidence": payload.sop_confidence,
+        }
+
+    async def results():
+        failed = 0
+        for done in asyncio.as_completed([asyncio.create_task(process(i)) for i in unique]):
+            i, result = await done
+            failed += 0 if result["ok"] else 1 + len(duplicates[i])
+            yield json.dumps({"index": i, **result}, ensure_ascii=False) + "\n"
+            for d in duplicates[i]:
+                yield json.dumps({"index": d, "duplicate_of": i, **result}, ensure_ascii=False) + "\n"
+
+        summary = {"total": len(items), "unique": len(unique), "failed": failed}
+        audit_log(request_id, "intake_bulk", status="ok" if not failed else "error", payload=summary)
+        yield json.dumps({"done": True, **summary}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@router.get("/intake/status/{accepted_id}")
+def intake_status(accepted_id: str):
+    # This worker's own writes from memory; writes queued by other API workers from the jobs DB
+    status = todoist_writer.status(accepted_id) or get_write_status(accepted_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown accepted_id")
+    return {"accepted_id": accepted_id, **status}
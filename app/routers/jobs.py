@@ -0,0 +1,18 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from app.services.jobs import get_job, list_jobs
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
+
+@router.get("/jobs")
+def jobs(status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50):
+    return {"jobs": list_jobs(status=status, kind=kind, limit=min(limit, 500))}
@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services.answer_cache import answer_cache
+from app.services.embed_cache import query_cache
+from app.utils.metrics import render
+
+router = APIRouter()
+
+def _cache_metrics():
+    caches = {"query_embeddings": query_cache.stats(), "answers": answer_cache.stats()}
+    return [
+        (
+            "pillar2_cache_lookups_total",
+            "Cache lookups by result.",
+            "counter",
+            [
+                ({"cache": name, "result": result}, stats[key])
+                for name, stats in caches.items()
+                for result, key in (("hit", "hits"), ("miss", "misses"))
+            ],
+        ),
+        (
+            "pillar2_cache_entries",
+            "Entries currently cached.",
+            "gauge",
+            [({"cache": name}, stats["size"]) for name, stats in caches.items()],
+        ),
+    ]
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text format: request, stage and upstream latency histograms, retries, cache hit counts."""
+    return PlainTextResponse(render(_cache_metrics()), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine, question vs cached question
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+MAX_PER_CHUNK_SET = 8  # paraphrases kept per retrieved-chunk set
+
+def chunk_set(matches: List[Dict[str, Any]]) -> FrozenSet[str]:
+    return frozenset(m["id"] for m in matches)
+
+
+class AnswerCache:
+    """
+    Caches the LLM answer for /ask. A hit needs the same index generation, the exact
+    same set of retrieved chunks (so the prompt context is identical) and a question
+    embedding within ANSWER_CACHE_SIMILARITY of a cached one (same question or a
+    close paraphrase). Any ingest bumps the generation and empties the cache; requests
+    still finishing against the previous generation are ignored rather than refilling it.
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, similarity: float = ANSWER_CACHE_SIMILARITY,
+                 ttl_s: float = ANSWER_CACHE_TTL_S) -> None:
+        self.max_size = max_size
+        self.similarity = similarity
+        self.ttl_s = ttl_s
+        self._generation: Optional[int] = None
+        # chunk set -> [(question vec, answer content, stored at)], LRU by chunk set
+        self._buckets: "OrderedDict[FrozenSet[str], List[Tuple[np.ndarray, str, float]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _sync_generation(self, generation: int) -> bool:
+        """Empty the cache when the generation goes up. False for a request that retrieved
+        from an older snapshot than the cache has seen: it must neither read nor write."""
+        if self._generation is not None and generation < self._generation:
+            return False
+        if generation != self._generation:
+            if self._buckets:
+                self.invalidations += 1
+            self._buckets.clear()
+            self._size = 0
+            self._generation = generation
+        return True
+
+    def get(self, generation: int, chunks: FrozenSet[str], q_vec: np.ndarray) -> Optional[str]:
+        q = q_vec.reshape(-1)
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(chunks) if self._sync_generation(generation) else None
+            if bucket:
+                live = [e for e in bucket if now - e[2] <= self.ttl_s]
+                self._size -= len(bucket) - len(live)
+                self._buckets[chunks] = live
+                if live:
+                    sims = np.stack([e[0] for e in live]) @ q
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.similarity:
+                        self._buckets.move_to_end(chunks)
+                        self.hits += 1
+                        return live[best][1]
+            self.misses += 1
+            return None
+
+    def put(self, generation: int, chunks: FrozenSet[str], q_vec: np.ndarray, content: str) -> None:
+        with self._lock:
+            if not self._sync_generation(generation):
+                return
+            bucket = self._buckets.setdefault(chunks, [])
+            bucket.append((q_vec.reshape(-1).copy(), content, time.time()))
+            self._size += 1
+            if len(bucket) > MAX_PER_CHUNK_SET:
+                bucket.pop(0)
+                self._size -= 1
+            self._buckets.move_to_end(chunks)
+            while self._size > self.max_size and self._buckets:
+                _, evicted = self._buckets.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,155 @@
+import os
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from app.services.tokens import count_tokens
+
+# Structure-aware chunking. A document is cut into blocks at its structure (headings,
+# numbered rules, bullets, blank lines; wrapped lines stay with their block), and blocks
+# are packed into chunks of up to CHUNK_MAX_TOKENS. A heading starts a new chunk once the
+# current one holds CHUNK_MIN_TOKENS; neither a heading nor a lead-in line ("Conditions:")
+# is left dangling at the end of a chunk.
+# Chunks are exact, non-overlapping (start, end) character spans of the document, so a
+# citation can point at the passage and no text is stored or embedded twice.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "350"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "120"))
+CHUNKER = f"structured-1|{CHUNK_MAX_TOKENS}|{CHUNK_MIN_TOKENS}"  # part of every chunk hash: changing it re-embeds
+
+_HEADING = re.compile(
+    r"#{1,6}\s"                                  # markdown heading
+    r"|\d+(\.\d+)*\.?\s+[^.!?]{1,80}$"          # "2.1 Employee Assets" (short, no sentence end)
+    r"|[^a-z\n]{4,80}$"                          # ALL CAPS TITLE
+)
+_LEAD_IN = re.compile(r"[^.!?\n]{1,60}:$")      # "Conditions (mandatory):"
+_NUMBERED = re.compile(r"\d+(\.\d+)*[.)]?\s")               # "3." rule or "2.1" heading
+_ITEM = re.compile(r"([•*\-–·]|[a-zA-Z][.)]|\(\w{1,3}\))\s")  # bullet, "a)", "(ii)"
+_LINE = re.compile(r"[^\n]*\n?")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class _Block(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    kind: str  # heading, lead, item or text
+
+
+def _kind(line: str, prev_kind: str, prev_line: str) -> str:
+    if not line:
+        return "blank"
+    if line.startswith("#"):
+        return "heading"
+    if _NUMBERED.match(line):
+        return "heading" if _HEADING.match(line) else "item"
+    if _ITEM.match(line):
+        return "item"
+    if (prev_kind == "text" and not prev_line.endswith((".", "!", "?", ":"))) or (
+        prev_kind == "item" and line[0].islower()
+    ):
+        return "wrap"  # the sentence above continues (even when this line is all caps)
+    if prev_line.endswith(":"):
+        return "text"  # "Billing Address:" then "QUANT LAB SFO FZCO" is a value, not a title
+    if _HEADING.match(line):
+        return "heading"
+    return "lead" if _LEAD_IN.match(line) else "text"
+
+def _blocks(text: str) -> List[Tuple[int, int, str]]:
+    """(start, end, kind): a heading, lead-in, list item or paragraph, wrapped lines included."""
+    blocks: List[List] = []
+    prev_kind, prev_line = "blank", ""
+    for m in _LINE.finditer(text):
+        if m.start() == m.end():
+            break
+        line = m.group().strip()
+        kind = _kind(line, prev_kind, prev_line)
+        if kind == "wrap" or (kind == "text" and prev_kind == "text"):
+            blocks[-1][1] = m.end()
+            kind = prev_kind
+        elif kind != "blank":
+            blocks.append([m.start(), m.end(), kind])
+        prev_kind, prev_line = kind, line
+    return [(s, e, k) for s, e, k in blocks]
+
+def _split_long(text: str, start: int, end: int, max_tokens: int) -> List[Tuple[int, int, int]]:
+    """(start, end, tokens) pieces of an oversized block: at sentence ends, then at whitespace."""
+    pieces: List[Tuple[int, int, int]] = []
+    cut = start
+    for m in _SENTENCE_END.finditer(text, start, end):
+        pieces.append((cut, m.end()))
+        cut = m.end()
+    pieces.append((cut, end))
+
+    out: List[Tuple[int, int, int]] = []
+    for s, e in pieces:
+        n = count_tokens(text[s:e])
+        if n <= max_tokens:
+            out.append((s, e, n))
+            continue
+        # One long run-on sentence: even cuts at whitespace, sized by its chars per token
+        step = max(1, int((e - s) * max_tokens * 0.9 / n))
+        while s < e:
+            stop = min(e, s + step)
+            if stop < e:
+                space = text.rfind(" ", s + 1, stop)
+                stop = space + 1 if space > s else stop
+            out.append((s, stop, count_tokens(text[s:stop])))
+            s = stop
+    return out
+
+def _fit(text: str, block: _Block, room: int) -> Tuple[Optional[_Block], _Block]:
+    """`block` cut at a sentence end (else whitespace) into a head of at most `room` tokens and the rest."""
+    cuts = [e for _, e, _ in _split_long(text, block.start, block.end, room)]
+    for cut in reversed(cuts[:-1]):
+        n = count_tokens(text[block.start:cut])
+        if n <= room:
+            rest = _Block(cut, block.end, count_tokens(text[cut:block.end]), "text")
+            return _Block(block.start, cut, n, block.kind), rest
+    return None, block
+
+def _pack(text: str, blocks: List[_Block], max_tokens: int, min_tokens: int) -> List[Tuple[int, int]]:
+    chunks: List[Tuple[int, int]] = []
+    current: List[_Block] = []
+    size = 0
+    queue = list(reversed(blocks))
+    while queue:
+        block = queue.pop()
+        if (
+            current and size + block.tokens > max_tokens and block.kind not in ("heading", "lead")
+            and all(b.kind in ("heading", "lead") for b in current)
+        ):
+            # Only a heading so far and the next block doesn't fit: it starts under the heading
+            head, rest = _fit(text, block, max_tokens - size)
+            if head is not None:
+                block = head
+                queue.append(rest)
+        if current and (size + block.tokens > max_tokens or (block.kind == "heading" and size >= min_tokens)):
+            carry: List[_Block] = []
+            while len(current) > 1 and current[-1].kind in ("heading", "lead"):  # they go with what follows
+                carry.insert(0, current.pop())
+            chunks.append((current[0].start, current[-1].end))
+            current, size = carry, sum(b.tokens for b in carry)
+        current.append(block)
+        size += block.tokens
+    if current:
+        chunks.append((current[0].start, current[-1].end))
+    return [_strip(text, s, e) for s, e in chunks]
+
+def _strip(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def chunk_spans(
+    text: str, max_tokens: int = CHUNK_MAX_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS
+) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of each chunk of `text`, in document order."""
+    blocks: List[_Block] = []
+    for start, end, kind in _blocks(text):
+        n = count_tokens(text[start:end])
+        if n <= max_tokens:
+            blocks.append(_Block(start, end, n, kind))
+        else:
+            blocks += [_Block(s, e, t, "text") for s, e, t in _split_long(text, start, end, max_tokens)]
+    return [(s, e) for s, e in _pack(text, blocks, max_tokens, min_tokens) if e > s]
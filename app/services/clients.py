@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.utils.metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+
+# One set of long-lived, pooled clients per process. Every upstream call goes through here
+# so connections (TCP + TLS) are reused across requests instead of re-handshaking each time.
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CONNECT_TIMEOUT_S", "5"))
+
+# Read timeouts per upstream host
+HOST_TIMEOUTS_S = {
+    "api.todoist.com": float(os.getenv("TODOIST_TIMEOUT_S", "20")),
+    "api.openai.com": float(os.getenv("OPENAI_TIMEOUT_S", "60")),
+}
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+_lock = threading.Lock()
+_async_http: Optional[httpx.AsyncClient] = None
+_openai: Optional[OpenAI] = None
+_async_openai: Optional[AsyncOpenAI] = None
+
+# host -> {"requests": n, "connections": n} across all clients
+_conn_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"requests": 0, "connections": 0})
+
+
+def timeout_for(host: str) -> httpx.Timeout:
+    return httpx.Timeout(HOST_TIMEOUTS_S.get(host, 20.0), connect=HTTP_CONNECT_TIMEOUT_S)
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+
+def _count(host: str, key: str) -> None:
+    with _lock:
+        _conn_stats[host][key] += 1
+
+# httpcore trace hooks: a "connect_tcp.complete" event means a fresh connection was opened
+def _trace_sync(host: str):
+    def trace(name: str, info: Dict[str, Any]) -> None:
+        if name == "connection.connect_tcp.complete":
+            _count(host, "connections")
+    return trace
+
+def _trace_async(host: str):
+    async def trace(name: str, info: Dict[str, Any]) -> None:
+        if name == "connection.connect_tcp.complete":
+            _count(host, "connections")
+    return trace
+
+def _on_request_sync(request: httpx.Request) -> None:
+    _count(request.url.host, "requests")
+    UPSTREAM_REQUESTS.inc(request.url.host)
+    request.extensions["trace"] = _trace_sync(request.url.host)
+    request.extensions["started"] = time.perf_counter()
+
+async def _on_request_async(request: httpx.Request) -> None:
+    _on_request_sync(request)
+    request.extensions["trace"] = _trace_async(request.url.host)
+
+def _on_response_sync(response: httpx.Response) -> None:
+    started = response.request.extensions.get("started")
+    if started is not None:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, response.request.url.host, str(response.status_code))
+
+async def _on_response_async(response: httpx.Response) -> None:
+    _on_response_sync(response)
+
+
+def _openai_key() -> str:
+    key = os.getenv("OPENAI_API_KEY", "").strip()
+    if not key:
+        raise RuntimeError("OPENAI_API_KEY is missing in environment/.env")
+    return key
+
+def get_openai_client() -> OpenAI:
+    global _openai
+    if _openai is None:
+        key = _openai_key()
+        with _lock:
+            if _openai is None:
+                _openai = OpenAI(
+                    api_key=key,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=httpx.Client(
+                        limits=_limits(),
+                        timeout=timeout_for("api.openai.com"),
+                        event_hooks={"request": [_on_request_sync], "response": [_on_response_sync]},
+                    ),
+                )
+    return _openai
+
+def get_async_openai_client() -> AsyncOpenAI:
+    global _async_openai
+    if _async_openai is None:
+        key = _openai_key()
+        with _lock:
+            if _async_openai is None:
+                _async_openai = AsyncOpenAI(
+                    api_key=key,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=httpx.AsyncClient(
+                        limits=_limits(),
+                        timeout=timeout_for("api.openai.com"),
+                        event_hooks={"request": [_on_request_async], "response": [_on_response_async]},
+                    ),
+                )
+    return _async_openai
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client for async callers. Retries cover connection failures only."""
+    global _async_http
+    if _async_http is None:
+        with _lock:
+            if _async_http is None:
+                _async_http = httpx.AsyncClient(
+                    timeout=httpx.Timeout(20.0, connect=HTTP_CONNECT_TIMEOUT_S),
+                    transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES, limits=_limits()),
+                    event_hooks={"request": [_on_request_async], "response": [_on_response_async]},
+                )
+    return _async_http
+
+async def aclose_clients() -> None:
+    """Close the async clients on shutdown (they are bound to the running event loop)."""
+    global _async_http, _async_openai
+    if _async_http is not None:
+        await _async_http.aclose()
+        _async_http = None
+    if _async_openai is not None:
+        await _async_openai.close()
+        _async_openai = None
+
+
+def connection_stats() -> Dict[str, Dict[str, Any]]:
+    stats: Dict[str, Dict[str, Any]] = {}
+    with _lock:
+        for host, c in _conn_stats.items():
+            stats[host] = dict(c)
+
+    for c in stats.values():
+        c["reuse_ratio"] = 1.0 - (c["connections"] / c["requests"]) if c["requests"] else 0.0
+    return stats
@@ -0,0 +1,181 @@
+import asyncio
+import contextvars
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from app.services.embed_cache import normalize_query, query_cache
+from app.services.embeddings import get_embedder
+from app.services.hybrid import SEARCH_POOL, vector_leg, vector_leg_many
+from app.utils.metrics import STAGE_SECONDS, Counter, Histogram
+
+# Bursts of concurrent queries (many /ask or expense /intake requests at once) are coalesced:
+# queries arriving within COALESCE_WINDOW_MS go out as one embeddings request and one
+# index.search over the stacked query matrix, and identical in-flight queries/answers are
+# computed once and shared (single-flight). A query whose embedding is already known joins
+# an open batch but never opens one, so cache hits don't wait for the window.
+COALESCE_QUERIES = os.getenv("COALESCE_QUERIES", "1") == "1"
+COALESCE_WINDOW_MS = float(os.getenv("COALESCE_WINDOW_MS", "2"))
+COALESCE_MAX_BATCH = int(os.getenv("COALESCE_MAX_BATCH", "64"))
+
+BATCH_SIZE = Histogram(
+    "pillar2_coalesced_batch_size", "Queries per coalesced embed + search batch.", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+SHARED = Counter("pillar2_singleflight_shared_total", "Callers served by an identical in-flight call.", ("kind",))
+
+T = TypeVar("T")
+Hits = List[Tuple[int, float]]
+
+
+class SingleFlight:
+    """Concurrent callers with the same key share one in-flight call (per event loop)."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._calls: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:  # job workers run each job in a fresh loop
+            self._loop, self._calls = loop, {}
+        task = self._calls.get(key)
+        if task is not None:
+            SHARED.inc(self.kind)
+        else:
+            # Own task: a caller that goes away (client disconnect) doesn't cancel it for the others
+            task = loop.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._calls.pop(key) if self._calls.get(key) is t else None)
+        return await asyncio.shield(task)
+
+
+class _Item:
+    __slots__ = ("query", "q_emb", "index", "kind", "limit", "allowed", "future")
+
+    def __init__(self, query, q_emb, index, kind, limit, allowed, future) -> None:
+        self.query, self.q_emb, self.index, self.kind = query, q_emb, index, kind
+        self.limit, self.allowed, self.future = limit, allowed, future
+
+
+class QueryCoalescer:
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._items: List[_Item] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flights = SingleFlight("query")
+
+    async def search(
+        self,
+        index,
+        kind: str,
+        generation: int,
+        query: str,
+        limit: int,
+        q_emb: Optional[np.ndarray] = None,
+        allowed: Optional[List[int]] = None,
+    ) -> Tuple[np.ndarray, Hits]:
+        """(query embedding (1, dim), vector hits) for `query` against `index`, batched with concurrent callers."""
+        if allowed is not None:  # filtered: batched embedding, but not shared (the id list would be the key)
+            return await self._enqueue(index, kind, query, limit, q_emb, allowed)
+        key = (generation, get_embedder().name, normalize_query(query), limit)
+        return await self._flights.do(key, lambda: self._enqueue(index, kind, query, limit, q_emb, None))
+
+    async def _enqueue(self, index, kind, query, limit, q_emb, allowed) -> Tuple[np.ndarray, Hits]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._items, self._timer = loop, [], None
+        if q_emb is None:
+            cached = await query_cache.get_async(get_embedder().name, query)
+            q_emb = cached.reshape(1, -1) if cached is not None else None
+        if q_emb is not None and not self._items:
+            # Nothing to share an embeddings call with: search now instead of opening a window
+            return q_emb, await loop.run_in_executor(SEARCH_POOL, vector_leg, index, kind, q_emb, limit, allowed)
+
+        item = _Item(query, q_emb, index, kind, limit, allowed, loop.create_future())
+        self._items.append(item)
+        if len(self._items) >= COALESCE_MAX_BATCH:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(COALESCE_WINDOW_MS / 1000.0, self._flush)
+        return await item.future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        if items:
+            # Empty context: the batch is shared work, not a stage of whichever request opened the window
+            contextvars.Context().run(self._loop.create_task, self._run(items))
+
+    async def _run(self, items: List[_Item]) -> None:
+        BATCH_SIZE.observe(len(items))
+        try:
+            await _embed_missing(items)
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        # Callers that cancelled (client went away) while the batch was embedding are skipped
+        live = [item for item in items if not item.future.done()]
+        if not live:
+            return
+        # A flat search over tens of thousands of vectors takes milliseconds: keep it off the event loop
+        results = await asyncio.get_running_loop().run_in_executor(SEARCH_POOL, _search_all, live)
+        for item, hits, error in results:
+            if item.future.done():
+                continue
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result((item.q_emb, hits))
+
+
+def _search_all(items: List[_Item]) -> List[Tuple[_Item, Optional[Hits], Optional[BaseException]]]:
+    """Vector hits (or the error) per item: unfiltered items sharing an index and limit in one search."""
+    started = time.perf_counter()
+    results: List[Tuple[_Item, Optional[Hits], Optional[BaseException]]] = []
+    groups: Dict[Tuple[int, int], List[_Item]] = {}
+    for item in items:
+        if item.allowed is None:
+            groups.setdefault((id(item.index), item.limit), []).append(item)
+            continue
+        try:
+            results.append((item, vector_leg(item.index, item.kind, item.q_emb, item.limit, item.allowed), None))
+        except Exception as e:
+            results.append((item, None, e))
+    for group in groups.values():
+        first = group[0]
+        try:
+            hits = vector_leg_many(first.index, np.vstack([item.q_emb for item in group]), first.limit)
+        except Exception as e:
+            results.extend((item, None, e) for item in group)
+        else:
+            results.extend((item, h, None) for item, h in zip(group, hits))
+    STAGE_SECONDS.observe(time.perf_counter() - started, "vector_search")
+    return results
+
+
+async def _embed_missing(items: List[_Item]) -> None:
+    """One embeddings call for every item without a vector (same normalized text embedded once)."""
+    embedder = get_embedder()
+    pending: Dict[str, List[_Item]] = {}
+    for item in items:
+        if item.q_emb is None:
+            pending.setdefault(normalize_query(item.query), []).append(item)
+    if not pending:
+        return
+    texts = [group[0].query for group in pending.values()]
+    emb = await embedder.embed_async(texts)
+    for (_, group), text, vec in zip(pending.items(), texts, emb):
+        query_cache.put(embedder.name, text, vec)
+        for item in group:
+            item.q_emb = vec.reshape(1, -1)
+
+
+query_coalescer = QueryCoalescer()
@@ -0,0 +1,109 @@
+import os
+import re
+from typing import Any, Dict, List, NamedTuple
+
+from app.services.tokens import count_tokens, truncate_tokens
+from app.utils.metrics import Histogram, add_count
+
+# Prompt context for /ask and /intake. Instead of every match verbatim, the excerpts are:
+#   1. cut to matches scoring at least CONTEXT_MIN_RELATIVE_SCORE x the best match,
+#   2. merged when they are adjacent chunks of one document,
+#   3. stripped of sentences an earlier (better-ranked) excerpt already contains,
+#   4. trimmed to CONTEXT_TOKEN_BUDGET tokens, best-ranked excerpts first.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MIN_RELATIVE_SCORE = float(os.getenv("CONTEXT_MIN_RELATIVE_SCORE", "0.5"))
+MIN_TRUNCATED_TOKENS = 40  # a shorter tail of a cut excerpt isn't worth its header
+
+PROMPT_TOKENS = Histogram(
+    "pillar2_prompt_tokens", "Tokens in the chat prompt (system + user message).",
+    buckets=(128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192),
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])(\s+)")
+
+
+class Excerpt(NamedTuple):
+    source: str
+    chunks: List[int]
+    score: float
+    text: str
+
+    def header(self) -> str:
+        span = f"chunk {self.chunks[0]}" if len(self.chunks) == 1 else f"chunks {self.chunks[0]}-{self.chunks[-1]}"
+        return f"[{self.source} | {span} | score {self.score:.3f}]"
+
+
+def _join(left: Dict[str, Any], right: Dict[str, Any]) -> str:
+    """The text between two consecutive chunks: none if they touch (a cut inside a long run), else a line break."""
+    if left.get("char_end") is not None and right.get("char_start") is not None and right["char_start"] <= left["char_end"]:
+        return ""
+    return "\n"
+
+def _merge_adjacent(matches: List[Dict[str, Any]]) -> List[Excerpt]:
+    """One excerpt per run of consecutive chunks of a document, placed at its best-ranked chunk."""
+    # Chunk numbers count within a document; source is only a display label two files can share
+    by_document: Dict[str, List[Dict[str, Any]]] = {}
+    for m in matches:
+        by_document.setdefault(m.get("document") or m["source"], []).append(m)
+    rank = {m["id"]: i for i, m in enumerate(matches)}
+
+    ranked = []
+    for ms in by_document.values():
+        ms.sort(key=lambda m: m["chunk"])
+        run = [ms[0]]
+        for m in ms[1:] + [None]:
+            if m is not None and m["chunk"] == run[-1]["chunk"] + 1:
+                run.append(m)
+                continue
+            text = run[0]["text"]
+            for prev, nxt in zip(run, run[1:]):
+                text += _join(prev, nxt) + nxt["text"]
+            excerpt = Excerpt(run[0]["source"], [r["chunk"] for r in run], max(r["score"] for r in run), text)
+            ranked.append((min(rank[r["id"]] for r in run), excerpt))
+            run = [m]
+    return [e for _, e in sorted(ranked, key=lambda x: x[0])]
+
+def _drop_seen_sentences(text: str, seen: set) -> str:
+    parts = _SENTENCE_END.split(text)  # sentence, whitespace, sentence, ...
+    kept = []
+    for i in range(0, len(parts), 2):
+        sentence = parts[i]
+        key = " ".join(sentence.lower().split())
+        if len(key) >= 20:  # short fragments ("Yes.", list markers) repeat legitimately
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(sentence + (parts[i + 1] if i + 1 < len(parts) else ""))
+    return "".join(kept).strip()
+
+def pack_context(matches: List[Dict[str, Any]], budget: int = CONTEXT_TOKEN_BUDGET) -> List[Excerpt]:
+    """The excerpts to put in the prompt for `matches` (retrieval order), within `budget` tokens."""
+    if not matches:
+        return []
+    best = max(m["score"] for m in matches)
+    kept = [m for m in matches if m["score"] >= best * CONTEXT_MIN_RELATIVE_SCORE] if best > 0 else matches
+
+    seen: set = set()
+    packed: List[Excerpt] = []
+    remaining = budget
+    for excerpt in _merge_adjacent(kept):
+        text = _drop_seen_sentences(excerpt.text, seen)
+        if not text:
+            continue
+        cost = count_tokens(excerpt.header()) + count_tokens(text) + 2
+        if cost > remaining:
+            room = remaining - count_tokens(excerpt.header()) - 2
+            if room >= MIN_TRUNCATED_TOKENS:
+                packed.append(excerpt._replace(text=truncate_tokens(text, room)))
+            break
+        packed.append(excerpt._replace(text=text))
+        remaining -= cost
+    return packed
+
+def record_prompt_tokens(matches: List[Dict[str, Any]], excerpts: List[Excerpt], messages: List[Dict[str, str]]) -> None:
+    """Token counts on the request's audit record, plus the prompt-size histogram."""
+    prompt = sum(count_tokens(m["content"]) for m in messages)
+    PROMPT_TOKENS.observe(prompt)
+    add_count("prompt_tokens", prompt)
+    add_count("context_tokens", sum(count_tokens(e.text) for e in excerpts))
+    add_count("retrieved_tokens", sum(count_tokens(m["text"]) for m in matches))
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# In-memory tier
+CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+CACHE_TTL_S = float(os.getenv("EMBED_CACHE_TTL_S", "86400"))
+
+# Optional persistent tier (sqlite); empty = memory only. Writes go to it from a background
+# thread (a crash can lose the last few, which only costs a re-embed); expired rows are
+# deleted on open and then every CACHE_PRUNE_INTERVAL_S.
+CACHE_DB = os.getenv("EMBED_CACHE_DB", "").strip()
+CACHE_PRUNE_INTERVAL_S = 3600.0
+
+def normalize_query(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    LRU + TTL cache of query embeddings keyed on (model, normalized text).
+    Vectors are stored already L2-normalized, exactly as the embedder returns them.
+    Async callers use get_async / get_many_async, which read the sqlite tier on a thread.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl_s: float = CACHE_TTL_S, db_path: str = CACHE_DB) -> None:
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._mem: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None  # lookups, under _db_lock
+        self._db_lock = threading.Lock()
+        self._db_path: Optional[Path] = None
+        self._pending: "queue.Queue[Tuple[str, str, float, bytes]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            self._open_db(Path(db_path))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self._db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _open_db(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db_path = path
+        self._db = self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            " model TEXT NOT NULL, text TEXT NOT NULL, ts REAL NOT NULL, vec BLOB NOT NULL,"
+            " PRIMARY KEY (model, text))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_ts ON query_embeddings (ts)")
+        self._prune(self._db)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM query_embeddings WHERE ts < ?", (time.time() - self.ttl_s,))
+        conn.commit()
+
+    def _get_mem(self, key: Tuple[str, str], now: float) -> Optional[np.ndarray]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                ts, vec = hit
+                if now - ts <= self.ttl_s:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return vec
+                del self._mem[key]
+            if self._db is None:
+                self.misses += 1
+            return None
+
+    def _get_disk(self, keys: Sequence[Tuple[str, str]], now: float) -> List[Optional[np.ndarray]]:
+        """sqlite tier lookups for memory misses (blocking: async callers run this on a thread)."""
+        with self._db_lock:
+            rows = [
+                self._db.execute("SELECT ts, vec FROM query_embeddings WHERE model = ? AND text = ?", key).fetchone()
+                for key in keys
+            ]
+        found: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key, row in zip(keys, rows):
+                if row is not None and now - row[0] <= self.ttl_s:
+                    vec = np.frombuffer(row[1], dtype="float32")
+                    self._put_mem(key, row[0], vec)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    found.append(vec)
+                else:
+                    self.misses += 1
+                    found.append(None)
+        return found
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = (model, normalize_query(text))
+        now = time.time()
+        vec = self._get_mem(key, now)
+        if vec is None and self._db is not None:
+            vec = self._get_disk([key], now)[0]
+        return vec
+
+    async def get_async(self, model: str, text: str) -> Optional[np.ndarray]:
+        return (await self.get_many_async(model, [text]))[0]
+
+    async def get_many_async(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """get() for many texts from the event loop: memory hits inline, all disk lookups in one thread hop."""
+        now = time.time()
+        keys = [(model, normalize_query(t)) for t in texts]
+        found = [self._get_mem(key, now) for key in keys]
+        missing = [i for i, vec in enumerate(found) if vec is None]
+        if missing and self._db is not None:
+            disk = await asyncio.to_thread(self._get_disk, [keys[i] for i in missing], now)
+            for i, vec in zip(missing, disk):
+                found[i] = vec
+        return found
+
+    def put(self, model: str, text: str, vec: np.ndarray) -> None:
+        """Memory now; the sqlite row is written behind, by the cache's writer thread."""
+        key = (model, normalize_query(text))
+        ts = time.time()
+        vec = np.ascontiguousarray(vec, dtype="float32").reshape(-1)
+        with self._lock:
+            self._put_mem(key, ts, vec)
+            if self._db is not None:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._write_behind, name="embed-cache-writer", daemon=True)
+                    self._writer.start()
+                self._pending.put((key[0], key[1], ts, vec.tobytes()))
+
+    def flush(self) -> None:
+        """Block until every put so far is in the sqlite tier."""
+        if self._db is not None:
+            self._pending.join()
+
+    def _write_behind(self) -> None:
+        conn = self._connect()
+        pruned_at = time.monotonic()
+        while True:
+            rows = [self._pending.get()]
+            while True:
+                try:
+                    rows.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings (model, text, ts, vec) VALUES (?, ?, ?, ?)", rows
+                )
+                conn.commit()
+                if time.monotonic() - pruned_at >= CACHE_PRUNE_INTERVAL_S:
+                    self._prune(conn)
+                    pruned_at = time.monotonic()
+            except sqlite3.Error as e:  # the memory tier still has them; a miss later only re-embeds
+                sys.stderr.write(f"embed_cache: dropped {len(rows)} writes: {e}\n")
+            finally:
+                for _ in rows:
+                    self._pending.task_done()
+
+    def _put_mem(self, key: Tuple[str, str], ts: float, vec: np.ndarray) -> None:
+        self._mem[key] = (ts, vec)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+
+    def clear(self) -> None:
+        self.flush()
+        with self._lock:
+            self._mem.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._mem),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
+
+
+query_cache = QueryEmbeddingCache()
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import re
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+import openai
+
+from app.services.clients import get_async_openai_client, get_openai_client
+from app.utils.metrics import UPSTREAM_RETRIES
+
+# Which backend embeds SOP chunks and queries. "openai" (network) or "local" (CPU, offline).
+# Switching providers changes every chunk hash, so the next ingest re-embeds the corpus.
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "openai").strip().lower()
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "16"))  # smaller batches reduce rate-limit risk
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RPM = float(os.getenv("EMBED_MAX_RPM", "0"))  # embeddings requests/minute; 0 = no client-side limit
+
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "512"))
+LOCAL_EMBED_BATCH_SIZE = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", "512"))
+
+
+def _normalize(arr: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (arr / norms).astype("float32", copy=False)
+
+
+class EmbeddingProvider(ABC):
+    """
+    Turns texts into L2-normalized float32 rows. `name` identifies the vector space:
+    it is part of every chunk hash and query-cache key, and is recorded with the index.
+    """
+
+    name: str = ""
+    dim: Optional[int] = None  # None until known (remote models report it on first call)
+    batch_size: int = EMBED_BATCH_SIZE
+    concurrency: int = 1  # parallel batches during ingest
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+    async def embed_async(self, texts: List[str]) -> np.ndarray:
+        return self.embed(texts)
+
+
+class _RateLimiter:
+    """Spaces out calls to at most `per_minute`, shared by all embedding threads."""
+
+    def __init__(self, per_minute: float) -> None:
+        self._interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def _reserve(self) -> float:
+        """Claims the next slot; returns the seconds to wait for it."""
+        if not self._interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        return slot - now
+
+    def wait(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def _is_rate_limited(e: Exception) -> bool:
+    return isinstance(e, openai.RateLimitError) or getattr(e, "status_code", None) == 429
+
+
+class OpenAIEmbeddings(EmbeddingProvider):
+    def __init__(self, model: str = EMBED_MODEL) -> None:
+        self.name = model  # plain model name: keeps hashes/cache keys of existing stores valid
+        self.model = model
+        self.batch_size = EMBED_BATCH_SIZE
+        self.concurrency = EMBED_CONCURRENCY
+        self._limiter = _RateLimiter(EMBED_MAX_RPM)
+
+    def _to_array(self, resp) -> np.ndarray:
+        arr = _normalize(np.array([d.embedding for d in resp.data], dtype="float32"))
+        self.dim = arr.shape[1]
+        return arr
+
+    # The loops below are the only retry layer: the clients are used with max_retries=0 here,
+    # otherwise every attempt would be retried again inside the SDK.
+    def embed(self, texts: List[str]) -> np.ndarray:
+        # retry with exponential backoff on 429
+        attempts = 5
+        for attempt in range(attempts):
+            self._limiter.wait()
+            try:
+                resp = get_openai_client().with_options(max_retries=0).embeddings.create(model=self.model, input=texts)
+                break
+            except Exception as e:
+                if _is_rate_limited(e) and attempt < attempts - 1:
+                    UPSTREAM_RETRIES.inc("openai_embeddings", "rate_limited")
+                    time.sleep(2 ** attempt)
+                    continue
+                raise  # non-429 errors should fail fast
+        return self._to_array(resp)
+
+    async def embed_async(self, texts: List[str]) -> np.ndarray:
+        attempts = 5
+        for attempt in range(attempts):
+            await self._limiter.wait_async()
+            try:
+                resp = await get_async_openai_client().with_options(max_retries=0).embeddings.create(model=self.model, input=texts)
+                break
+            except Exception as e:
+                if _is_rate_limited(e) and attempt < attempts - 1:
+                    UPSTREAM_RETRIES.inc("openai_embeddings", "rate_limited")
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                raise
+        return self._to_array(resp)
+
+
+# Function words: shared with the lexical leg (hybrid.query_terms), where they would match nearly every chunk
+STOPWORDS = frozenset(
+    "a about after all also am an and any are as at be been before being but by can could do does "
+    "for from had has have how i if in into is it its me my no not of on or our please should so "
+    "than that the their them then there these they this those to up us was we were what when "
+    "where which who why will with would you your".split()
+)
+_WORD = re.compile(r"\w+")
+
+class LocalHashEmbeddings(EmbeddingProvider):
+    """
+    Offline CPU embeddings: signed feature hashing of words and word bigrams into `dim`
+    buckets, sublinear term frequency, L2-normalized. No IDF: vectors stay a pure
+    function of the text, which incremental ingest and the query cache rely on.
+    A short query embeds in well under a millisecond.
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBED_DIM) -> None:
+        self.dim = dim
+        self.name = f"local-hash-v2-{dim}"  # v2: the longer stopword list; stores and cached queries from v1 re-embed
+        self.batch_size = LOCAL_EMBED_BATCH_SIZE
+        self.concurrency = 1  # CPU-bound; threads would only contend for the GIL
+
+    def _features(self, text: str) -> List[str]:
+        words = [w for w in _WORD.findall(text.casefold()) if w not in STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            counts = {}
+            for feat in self._features(text):
+                h = zlib.crc32(feat.encode("utf-8"))
+                counts[h] = counts.get(h, 0) + 1
+            for h, n in counts.items():
+                # top bit picks the sign so colliding features tend to cancel rather than pile up
+                out[row, h % self.dim] += (1.0 + np.log(n)) * (1.0 if h & 0x80000000 else -1.0)
+        return _normalize(out)
+
+
+_provider: Optional[EmbeddingProvider] = None
+
+def get_embedder() -> EmbeddingProvider:
+    global _provider
+    if _provider is None:
+        if EMBED_PROVIDER == "openai":
+            _provider = OpenAIEmbeddings()
+        elif EMBED_PROVIDER == "local":
+            _provider = LocalHashEmbeddings()
+        else:
+            raise RuntimeError(f"Unknown EMBED_PROVIDER: {EMBED_PROVIDER} (expected 'openai' or 'local')")
+    return _provider
@@ -0,0 +1,120 @@
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.embeddings import STOPWORDS
+from app.services.vector_index import exact_filtered_search, filtered_search_params
+
+# Hybrid retrieval: dense (FAISS) and lexical (BM25 via the FTS5 table in the metadata
+# store) candidates fused with reciprocal rank fusion. The lexical leg rescues exact-token
+# queries (TRN numbers, unit codes, vendor names) that embeddings rank poorly.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # per leg, before fusion
+RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# The MATCH only takes the query's rarest terms: a term in thousands of chunks (or in a large
+# share of a small corpus) makes FTS5 score every one of them (100+ ms at 100k chunks) and says
+# little that the dense leg doesn't. Common terms still count towards coverage in fuse().
+HYBRID_MATCH_MAX_DF = int(os.getenv("HYBRID_MATCH_MAX_DF", "1000"))
+HYBRID_MATCH_MAX_DF_RATIO = float(os.getenv("HYBRID_MATCH_MAX_DF_RATIO", "0.1"))
+HYBRID_MATCH_MAX_TERMS = int(os.getenv("HYBRID_MATCH_MAX_TERMS", "8"))
+_MATCH_MIN_DF = 20  # below this every term is cheap to match, whatever its share of the corpus
+# Term evidence lifts a chunk's cosine, within limits: score = max(cosine,
+# min(cosine + boost * coverage, cap)). Coverage is the share of the query's terms present,
+# each weighted by its rarity, so common terms add little. The cap sits just above the default
+# 0.45 confidence gate: a bare TRN or unit code can get an answer, but term overlap alone never
+# makes a confident match, and a low cosine still escalates.
+LEXICAL_BOOST = float(os.getenv("HYBRID_LEXICAL_BOOST", "0.25"))
+LEXICAL_CAP = float(os.getenv("HYBRID_LEXICAL_CAP", "0.5"))
+
+# Both legs (FAISS search, BM25) and fusion run here, off the request thread / event loop
+SEARCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sop-search")
+
+_TERM = re.compile(r"[^\W_]+")  # same split as the FTS5 unicode61 tokenizer
+
+def query_terms(text: str) -> List[str]:
+    # Function words match nearly every chunk: they only slow the MATCH and dilute coverage
+    return [t for t in dict.fromkeys(_TERM.findall(text.casefold())) if t not in STOPWORDS]
+
+def _idf(df: int, n: int) -> float:
+    return math.log(1.0 + (n - df + 0.5) / (df + 0.5))  # BM25 idf, always > 0
+
+def _coverage(terms: Sequence[str], text: str, idf: Dict[str, float], n: int) -> float:
+    """Rarity-weighted share of the query's terms present in `text` (1.0 = every term occurs
+    and each is in a single chunk; terms found in much of the corpus count for little)."""
+    if not terms:
+        return 0.0
+    present = set(_TERM.findall(text.casefold()))
+    return sum(idf[t] for t in terms if t in present) / (len(terms) * _idf(1, n))
+
+def lexical_leg(meta, query: str, limit: int, filters: Optional[Dict[str, str]] = None) -> List[Tuple[int, float]]:
+    if not HYBRID_SEARCH:
+        return []
+    terms = query_terms(query)
+    df = meta.doc_freq(terms)
+    max_df = min(HYBRID_MATCH_MAX_DF, max(_MATCH_MIN_DF, HYBRID_MATCH_MAX_DF_RATIO * len(meta)))
+    rare = sorted((t for t in terms if 0 < df.get(t, 0) <= max_df), key=df.get)
+    return meta.lexical_search(rare[:HYBRID_MATCH_MAX_TERMS], limit, filters)
+
+def vector_leg(
+    index, kind: str, q_emb: np.ndarray, limit: int, allowed: Optional[List[int]] = None
+) -> List[Tuple[int, float]]:
+    params = None
+    if allowed is not None:
+        exact = exact_filtered_search(index, kind, q_emb, allowed, limit)
+        if exact is not None:
+            return exact
+        params = filtered_search_params(index, kind, allowed)
+    scores, idxs = index.search(q_emb, limit, params=params)
+    return [(int(i), float(s)) for s, i in zip(scores[0], idxs[0]) if i != -1]
+
+def vector_leg_many(index, q_embs: np.ndarray, limit: int) -> List[List[Tuple[int, float]]]:
+    """vector_leg for a stack of unfiltered queries: one index.search over the whole matrix."""
+    scores, idxs = index.search(q_embs, limit)
+    return [[(int(i), float(s)) for s, i in zip(srow, irow) if i != -1] for srow, irow in zip(scores, idxs)]
+
+def fuse(
+    meta,
+    query: str,
+    vector_hits: List[Tuple[int, float]],
+    lexical_hits: List[Tuple[int, float]],
+    top_k: int,
+) -> List[Dict[str, Any]]:
+    """RRF over both rankings; returns match dicts for the top_k fused chunks."""
+    rrf: Dict[int, float] = {}
+    for hits in (vector_hits, lexical_hits):
+        for rank, (vid, _) in enumerate(hits):
+            rrf[vid] = rrf.get(vid, 0.0) + 1.0 / (RRF_K + rank + 1)
+    top = sorted(rrf, key=rrf.get, reverse=True)[:top_k]
+    rows = meta.get_many(top)
+
+    vector_score = dict(vector_hits)
+    terms = query_terms(query) if lexical_hits else []
+    df = meta.doc_freq(terms) if terms else {}
+    idf = {t: _idf(df.get(t, 0), len(meta)) for t in terms}
+
+    matches = []
+    for vid in top:
+        item = rows.get(vid)
+        if item is None:
+            continue
+        cosine = vector_score.get(vid)
+        lexical = _coverage(terms, item["text"], idf, len(meta))
+        score = cosine if cosine is not None else 0.0
+        matches.append({
+            "id": item["id"],
+            "source": item["source"],
+            "document": item.get("document"),
+            "section": item.get("section"),
+            "chunk": item["chunk"],
+            "char_start": item.get("char_start"),  # span in the document (None for stores built before offsets)
+            "char_end": item.get("char_end"),
+            "score": max(score, min(score + LEXICAL_BOOST * lexical, LEXICAL_CAP)),  # higher is more similar
+            "vector_score": cosine,
+            "lexical_score": lexical,
+            "text": item["text"],
+        })
+    return matches
@@ -0,0 +1,118 @@
+from typing import Optional, Tuple
+import asyncio
+
+import numpy as np
+
+from app.models.schemas import IntakeRequest, TaskPayload
+from app.services.rag import answer_from_sops_async
+from app.services.intent import classify_async
+from app.services.router import Classification, make_title
+from app.services.todoist import get_project_id_for_category_async
+from app.services.todoist_writer import todoist_writer
+from app.utils.logging import audit_log
+from app.utils.metrics import span
+
+def _build_sop_checklist() -> str:
+    # Static checklist extracted from SOP (deterministic, reliable)
+    return (
+        "SOP Checklist (Expenses):\n"
+        "- Payment: ONLY use the SFO card (no personal cards)\n"
+        "- Buyer name: QUANT LAB SFO FZCO\n"
+        "- TRN: 105069744800001\n"
+        "- Billing address: DMCC Business Centre, UT-11-CO-190, Uptown Tower, JLT, Dubai, UAE\n"
+        "- Shipping address: Villa 47A, Frond N, Palm Jumeirah, Dubai, UAE\n"
+        "- Valid tax invoice required (seller + buyer + TRN + date + amount)\n"
+        "- Upload invoice to: SFO Purchases – Invoices (Google Drive)\n"
+        "- No mixing personal and company items\n"
+    )
+
+async def prepare_intake(
+    body: IntakeRequest, classification: Optional[Classification] = None, q_emb: Optional[np.ndarray] = None
+) -> Tuple[TaskPayload, str]:
+    """Route + enrich one message. Returns the task payload and the enrichment comment."""
+    if classification is None:
+        with span("classify"):
+            classification = await classify_async(body.message)
+    category, needs_approval = classification.category, classification.needs_approval
+
+    title = make_title(body.message)
+    description = f"Channel: {body.channel}\nRaw request: {body.message}"
+
+    # RAG enrichment only for expense/purchase category
+    sop_confidence = 0.0
+    sop_citations = []
+    rag_summary = None
+    needs_escalation = False
+
+    if category == "expense_purchase":
+        rag = await answer_from_sops_async(question=body.message, top_k=4, q_emb=q_emb)
+        sop_confidence = rag.get("confidence", 0.0)
+        sop_citations = rag.get("citations", [])
+        needs_escalation = rag.get("needs_escalation", False)
+        rag_summary = rag.get("result") or rag.get("answer")
+
+    payload = TaskPayload(
+        title=title,
+        description=description,
+        category=category,
+        priority="high",
+        needs_approval=needs_approval,
+        needs_escalation=needs_escalation,
+        sop_confidence=sop_confidence,
+        sop_citations=sop_citations,
+        matched_rules=classification.rules,
+        routing_stage=classification.stage,
+    )
+    return payload, _build_comment(payload, rag_summary)
+
+def _build_comment(payload: TaskPayload, rag_summary: Optional[str]) -> str:
+    comment_parts = [
+        "Auto-enrichment (Pillar 2 PoC):",
+        f"- Category: {payload.category}",
+        f"- Priority: {payload.priority}",
+        f"- Needs approval: {payload.needs_approval}",
+        f"- Matched rules: {', '.join(payload.matched_rules) or 'none'} (routed by {payload.routing_stage})",
+        f"- SOP confidence: {payload.sop_confidence:.2f}",
+    ]
+
+    if payload.category == "expense_purchase":
+        comment_parts.append("")
+        comment_parts.append(_build_sop_checklist())
+        comment_parts.append("RAG Guidance (JSON):")
+        comment_parts.append(str(rag_summary))
+        comment_parts.append("")
+        comment_parts.append("Citations:")
+        for c in payload.sop_citations[:4]:
+            comment_parts.append(f"- {c.get('source')} | chunk {c.get('chunk')} | score {c.get('score'):.3f}")
+
+        if payload.needs_escalation:
+            comment_parts.append("")
+            comment_parts.append("⚠️ Escalation Required: SOP signal is low or SOP does not cover this request confidently.")
+
+    return "\n".join(comment_parts)
+
+async def submit_task(payload: TaskPayload, comment_text: str) -> Tuple[str, asyncio.Future]:
+    # Project ids come from the cached directory, no lookup call per request
+    with span("project_lookup"):
+        project_id = await get_project_id_for_category_async(payload.category)
+
+    # Task + comment go out together in the writer's next Sync API batch
+    return todoist_writer.submit(
+        content=payload.title, description=payload.description, project_id=project_id, comment=comment_text
+    )
+
+def audit_created(request_id: str, payload: TaskPayload, ids: dict) -> None:
+    """Audit record for a task written to Todoist (sync, queued and background intakes alike)."""
+    audit_log(
+        request_id,
+        "intake_created_task",
+        payload={
+            "category": payload.category,
+            "needs_approval": payload.needs_approval,
+            "needs_escalation": payload.needs_escalation,
+            "matched_rules": payload.matched_rules,
+            "routing_stage": payload.routing_stage,
+            "task_id": ids.get("task_id"),
+            "comment_id": ids.get("comment_id"),
+        },
+    )
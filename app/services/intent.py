@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.services.router import Classification, RuleTable, classify_message, get_rule_table
+from app.services.sop_ingest import embed_queries_async
+
+# Second routing stage: when the keyword rules are unsure, compare the message embedding
+# with per-category centroids built from the "examples" in the rules file. Embeddings go
+# through the query cache, so the SOP lookup that follows for expense intakes reuses them.
+# Messages no rule matches are embedded too: they are the ones phrased without any keyword.
+# The query cache, batching and the INTENT_RETRY_S backoff bound what that costs;
+# INTENT_FALLBACK_UNMATCHED=0 limits the stage to messages some rule partly matched.
+INTENT_FALLBACK = os.getenv("INTENT_FALLBACK", "1") == "1"
+INTENT_FALLBACK_UNMATCHED = os.getenv("INTENT_FALLBACK_UNMATCHED", "1") == "1"
+INTENT_KEYWORD_MIN_SCORE = float(os.getenv("INTENT_KEYWORD_MIN_SCORE", "1.0"))  # keyword score below this => fallback
+INTENT_RETRY_S = float(os.getenv("INTENT_RETRY_S", "60"))  # after an embedding failure, keywords only for this long
+INTENT_MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", "0.40"))
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.02"))  # best centroid must beat the runner-up by this
+
+
+class _Centroids:
+    """Unit-normalized centroid per category with examples, rebuilt when the rule table is reloaded."""
+
+    def __init__(self) -> None:
+        self._table: Optional[RuleTable] = None
+        self._labels: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        # An asyncio.Lock belongs to one event loop; job workers may run on another than the API
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _loop_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._lock = loop, asyncio.Lock()
+        return self._lock
+
+    async def get(self, table: RuleTable) -> Tuple[List[str], Optional[np.ndarray]]:
+        if self._table is table:
+            return self._labels, self._matrix
+        async with self._loop_lock():
+            if self._table is not table:
+                self._labels, self._matrix = await self._build(table)
+                self._table = table
+        return self._labels, self._matrix
+
+    @staticmethod
+    async def _build(table: RuleTable) -> Tuple[List[str], Optional[np.ndarray]]:
+        labelled = [(cat, ex) for cat, cfg in table.categories.items() for ex in cfg.get("examples", [])]
+        if not labelled:
+            return [], None
+        emb = await embed_queries_async([ex for _, ex in labelled])
+        labels = list(dict.fromkeys(cat for cat, _ in labelled))
+        rows = []
+        for cat in labels:
+            mean = emb[[i for i, (c, _) in enumerate(labelled) if c == cat]].mean(axis=0)
+            rows.append(mean / (np.linalg.norm(mean) or 1.0))
+        return labels, np.vstack(rows).astype("float32")
+
+
+_CENTROIDS = _Centroids()
+_retry_at = 0.0  # monotonic time before which the embedding stage is skipped (it just failed)
+
+def _pick(table: RuleTable, keyword: Classification, labels: List[str], sims: np.ndarray) -> Classification:
+    order = np.argsort(-sims)
+    best = int(order[0])
+    runner_up = float(sims[order[1]]) if len(order) > 1 else -1.0
+    if sims[best] < INTENT_MIN_SIMILARITY or sims[best] - runner_up < INTENT_MIN_MARGIN:
+        return keyword
+    category = labels[best]
+    if category == keyword.category:
+        return keyword
+    needs_approval = bool(table.categories.get(category, {}).get("needs_approval", False)) or keyword.needs_approval
+    return Classification(category, needs_approval, float(sims[best]), keyword.rules, stage="embedding")
+
+async def classify_many_async(messages: List[str]) -> List[Classification]:
+    """
+    Keyword routing for every message; the unsure ones are then embedded in one batched
+    (cache-aware) call and scored against all centroids with a single matrix product.
+    Any embedding failure (no key, upstream down) leaves the keyword result in place
+    and turns the embedding stage off for INTENT_RETRY_S.
+    """
+    global _retry_at
+    table = get_rule_table()
+    results = [table.classify(m) for m in messages]
+    unsure = [
+        i for i, r in enumerate(results)
+        if r.score < INTENT_KEYWORD_MIN_SCORE and (r.rules or INTENT_FALLBACK_UNMATCHED)
+    ]
+    if not INTENT_FALLBACK or not unsure or time.monotonic() < _retry_at:
+        return results
+
+    try:
+        labels, centroids = await _CENTROIDS.get(table)
+        if centroids is None:
+            return results
+        q = await embed_queries_async([messages[i] for i in unsure])
+    except Exception:
+        # Don't make every intake pay for a failing call (or a centroid rebuild) while upstream is down
+        _retry_at = time.monotonic() + INTENT_RETRY_S
+        return results
+
+    sims = q @ centroids.T  # (unsure, categories)
+    for row, i in enumerate(unsure):
+        results[i] = _pick(table, results[i], labels, sims[row])
+    return results
+
+async def classify_async(message: str) -> Classification:
+    if not INTENT_FALLBACK:
+        return classify_message(message)
+    return (await classify_many_async([message]))[0]
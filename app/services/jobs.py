@@ -0,0 +1,412 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.utils.metrics import begin_request
+
+# Background jobs (SOP ingest, /intake?background=true): a sqlite queue drained by worker
+# processes; the API answers 202 + job id. Standalone: python -m app.services.jobs --workers N
+# Every API process starts its own workers: `uvicorn --workers 4` with the defaults runs 4 * (1 + 1)
+# of them. To run a fixed number, set JOB_WORKERS=0 and start the standalone command once.
+JOBS_DB = Path(os.getenv("JOBS_DB", "data/jobs.sqlite"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))  # worker processes each API process starts; 0 = run them separately
+# Started on top of JOB_WORKERS and only take intake jobs, so an intake never waits behind an ingest
+JOB_INTAKE_WORKERS = int(os.getenv("JOB_INTAKE_WORKERS", "1"))
+JOB_POLL_S = float(os.getenv("JOB_POLL_S", "0.5"))
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "300"))  # running job without heartbeat this long => requeue
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", str(max(1.0, JOB_STALE_S / 10))))  # while a job runs
+JOB_DB_RETRY_MAX_S = 30.0  # longest wait between attempts while the jobs DB keeps failing
+
+logger = logging.getLogger(__name__)
+
+Progress = Callable[[float, str], None]
+
+
+def _connect() -> sqlite3.Connection:
+    JOBS_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(JOBS_DB), timeout=30, isolation_level=None)  # autocommit; explicit BEGIN where needed
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            args TEXT NOT NULL,
+            lock_key TEXT,
+            status TEXT NOT NULL,          -- queued | running | succeeded | failed
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            heartbeat_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+        CREATE INDEX IF NOT EXISTS jobs_lock_key ON jobs (lock_key, status);
+        CREATE TABLE IF NOT EXISTS write_status (
+            accepted_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,          -- JSON: {"state": queued | ok | error, ...}
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS write_status_updated ON write_status (updated_at);
+        """
+    )
+    return conn
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["args"] = json.loads(job["args"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def enqueue(kind: str, args: Optional[Dict[str, Any]] = None, lock_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Queue a job. With a lock_key (e.g. "corpus:sops") jobs are single-flight: at most one
+    runs at a time, and a request arriving while one is already queued joins that job.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if lock_key is not None:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE lock_key = ? AND status = 'queued' ORDER BY created_at LIMIT 1",
+                (lock_key,),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return _row_to_job(row)
+        job_id = str(uuid.uuid4())
+        conn.execute(
+            "INSERT INTO jobs (id, kind, args, lock_key, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+            (job_id, kind, json.dumps(args or {}), lock_key, time.time()),
+        )
+        conn.execute("COMMIT")
+        return get_job(job_id)
+    finally:
+        conn.close()
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+    finally:
+        conn.close()
+
+def list_jobs(status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    clauses, params = [], []
+    if status is not None:
+        clauses.append("status = ?")
+        params.append(status)
+    if kind is not None:
+        clauses.append("kind = ?")
+        params.append(kind)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = _connect()
+    try:
+        rows = conn.execute(f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)).fetchall()
+        return [_row_to_job(r) for r in rows]
+    finally:
+        conn.close()
+
+
+# States of queued Todoist writes (/intake?wait=false), kept here so any API worker can answer
+# /intake/status, not just the one whose write queue holds the write
+INTAKE_STATUS_KEEP_S = float(os.getenv("INTAKE_STATUS_KEEP_S", "86400"))
+
+def save_write_status(statuses: Dict[str, Dict[str, Any]]) -> None:
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR REPLACE INTO write_status (accepted_id, status, updated_at) VALUES (?, ?, ?)",
+            [(accepted_id, json.dumps(status), now) for accepted_id, status in statuses.items()],
+        )
+        conn.execute("DELETE FROM write_status WHERE updated_at < ?", (now - INTAKE_STATUS_KEEP_S,))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def get_write_status(accepted_id: str) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT status FROM write_status WHERE accepted_id = ?", (accepted_id,)).fetchone()
+        return json.loads(row["status"]) if row else None
+    finally:
+        conn.close()
+
+
+def _claim(conn: sqlite3.Connection, worker: str, kinds: Optional[Sequence[str]] = None) -> Optional[sqlite3.Row]:
+    """Atomically take the oldest runnable job of `kinds` (any if None) whose lock_key, if any, isn't held."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs whose worker died mid-run go back to the queue, unless running them twice has side
+        # effects: an intake may already have created its Todoist task, so it fails instead
+        retry = ", ".join("?" * len(RETRYABLE_KINDS))
+        conn.execute(
+            f"UPDATE jobs SET status = 'queued', worker = NULL"
+            f" WHERE status = 'running' AND heartbeat_at < ? AND kind IN ({retry})",
+            (now - JOB_STALE_S, *RETRYABLE_KINDS),
+        )
+        conn.execute(
+            f"UPDATE jobs SET status = 'failed', error = ?, finished_at = ?"
+            f" WHERE status = 'running' AND heartbeat_at < ? AND kind NOT IN ({retry})",
+            (
+                "worker stopped responding mid-run; not retried, it may already have had side effects",
+                now, now - JOB_STALE_S, *RETRYABLE_KINDS,
+            ),
+        )
+        only = f"AND kind IN ({', '.join('?' * len(kinds))})" if kinds else ""
+        row = conn.execute(
+            f"""
+            SELECT * FROM jobs j WHERE status = 'queued' {only} AND (
+                lock_key IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM jobs r WHERE r.lock_key = j.lock_key AND r.status = 'running'
+                )
+            )
+            ORDER BY created_at LIMIT 1
+            """,
+            tuple(kinds or ()),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (worker, now, now, row["id"]),
+            )
+        conn.execute("COMMIT")
+        return row
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _progress_reporter(conn: sqlite3.Connection, job_id: str) -> Progress:
+    def report(progress: float, message: str = "") -> None:
+        conn.execute(
+            "UPDATE jobs SET progress = ?, message = ?, heartbeat_at = ? WHERE id = ?",
+            (max(0.0, min(1.0, progress)), message, time.time(), job_id),
+        )
+    return report
+
+class _Heartbeat:
+    """
+    Refreshes heartbeat_at every JOB_HEARTBEAT_S while a job runs, so a stage that reports no
+    progress for a while (a large chunking or embedding pass) isn't taken for a dead worker
+    and run a second time. Own thread + connection; the job keeps the worker's connection.
+    """
+
+    def __init__(self, job_id: str) -> None:
+        self.job_id = job_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{job_id[:8]}", daemon=True)
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        conn = _connect()
+        try:
+            while not self._stop.wait(JOB_HEARTBEAT_S):
+                try:
+                    conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), self.job_id))
+                except sqlite3.Error:
+                    pass  # busy database: the next beat retries
+        finally:
+            conn.close()
+
+def _finish(conn: sqlite3.Connection, job_id: str, result: Any = None, error: Optional[str] = None) -> None:
+    conn.execute(
+        "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+        (
+            "failed" if error else "succeeded",
+            0.0 if error else 1.0,
+            None if error else json.dumps(result, default=str),
+            error,
+            time.time(),
+            job_id,
+        ),
+    )
+
+def run_one(conn: sqlite3.Connection, worker: str, kinds: Optional[Sequence[str]] = None) -> bool:
+    """Run a single job of `kinds` (any if None) if one is available. Returns False when there is none."""
+    row = _claim(conn, worker, kinds)
+    if row is None:
+        return False
+    report = _progress_reporter(conn, row["id"])
+    begin_request()  # audit events and spans inside the handler are timed from job start
+    try:
+        with _Heartbeat(row["id"]):
+            result = HANDLERS[row["kind"]](json.loads(row["args"]), report)
+    except Exception as e:
+        _finish(conn, row["id"], error=f"{e}\n{traceback.format_exc(limit=5)}")
+    else:
+        _finish(conn, row["id"], result=result)
+    return True
+
+def run_worker(stop: Optional[Any] = None, kinds: Optional[Sequence[str]] = None) -> None:
+    """Worker loop taking jobs of `kinds` (any if None); `stop` is an optional multiprocessing.Event checked between jobs."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from app.utils.logging import shutdown_audit_writer
+
+    worker = f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}:{os.getpid()}"
+    wait = stop.wait if stop is not None else time.sleep
+    conn: Optional[sqlite3.Connection] = None
+    failures = 0
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                if conn is None:
+                    conn = _connect()
+                ran = run_one(conn, worker, kinds)
+            except sqlite3.Error:
+                # Locked, full or missing DB: the worker outlives it, reconnecting with backoff
+                failures += 1
+                logger.exception("Job worker %s: jobs DB error (attempt %d)", worker, failures)
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                wait(min(JOB_POLL_S * 2 ** failures, JOB_DB_RETRY_MAX_S))
+                continue
+            failures = 0
+            if not ran:
+                wait(JOB_POLL_S)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if conn is not None:
+            conn.close()
+        _close_loop()
+        shutdown_audit_writer()  # spawned children exit without running atexit hooks
+
+
+# One event loop per worker process, reused by every async job: the shared HTTP clients,
+# the Todoist write queue and other loop-bound state stay valid from one job to the next.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _run_async(coro) -> Any:
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
+
+def _close_loop() -> None:
+    global _loop
+    if _loop is None or _loop.is_closed():
+        return
+    from app.services.clients import aclose_clients
+    from app.services.todoist_writer import todoist_writer
+
+    async def close() -> None:
+        await todoist_writer.stop()  # flush anything still queued
+        await aclose_clients()
+
+    try:
+        _loop.run_until_complete(close())
+    finally:
+        _loop.close()
+        _loop = None
+
+
+# --- job handlers: (args, report) -> JSON-serializable result ---
+
+def _run_sop_ingest(args: Dict[str, Any], report: Progress) -> Dict[str, Any]:
+    from app.services.sop_ingest import SOP_DIR, ingest_sops
+
+    return ingest_sops(Path(args.get("root") or SOP_DIR), progress=report)
+
+def _run_intake(args: Dict[str, Any], report: Progress) -> Dict[str, Any]:
+    from app.models.schemas import IntakeRequest
+    from app.services.intake import audit_created, prepare_intake, submit_task
+
+    async def run() -> Dict[str, Any]:
+        payload, comment_text = await prepare_intake(IntakeRequest(**args["body"]))
+        report(0.6, "enriched")
+        _, written = await submit_task(payload, comment_text)
+        ids = await written
+        audit_created(args.get("request_id", ""), payload, ids)
+        return {"payload": payload.model_dump(), **ids}
+
+    return _run_async(run())
+
+HANDLERS: Dict[str, Callable[[Dict[str, Any], Progress], Any]] = {
+    "sop_ingest": _run_sop_ingest,
+    "intake": _run_intake,
+}
+RETRYABLE_KINDS = ("sop_ingest",)  # safe to run again after a worker dies (ingest is incremental)
+
+
+# --- worker processes started alongside the API ---
+
+_procs: List[multiprocessing.Process] = []
+_stop_event = None
+
+def start_workers(n: int = JOB_WORKERS, intake: int = JOB_INTAKE_WORKERS) -> None:
+    """
+    `n` workers for any job plus `intake` that only take intake jobs (none at all when n is 0).
+    Per calling process: each API worker process that calls this starts its own set.
+    Not daemonic: an ingest chunks a large corpus in a process pool, which daemon processes
+    may not start. stop_workers joins them (and terminates stragglers) on shutdown.
+    """
+    global _stop_event
+    if n <= 0 or _procs:
+        return
+    ctx = multiprocessing.get_context("spawn")
+    _stop_event = ctx.Event()
+    workers = [(f"job-worker-{i}", None) for i in range(n)]
+    workers += [(f"job-worker-intake-{i}", ("intake",)) for i in range(intake)]
+    for name, kinds in workers:
+        p = ctx.Process(target=run_worker, args=(_stop_event, kinds), name=name, daemon=False)
+        p.start()
+        _procs.append(p)
+
+def stop_workers(timeout: float = 10.0) -> None:
+    """Let workers finish their current job, then stop them."""
+    if _stop_event is not None:
+        _stop_event.set()
+    for p in _procs:
+        p.join(timeout)
+        if p.is_alive():
+            p.terminate()
+    _procs.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--intake-workers", type=int, default=JOB_INTAKE_WORKERS, help="extra workers for intake jobs only")
+    opts = parser.parse_args()
+    if opts.workers == 1 and opts.intake_workers == 0:
+        run_worker()
+    else:
+        start_workers(opts.workers, opts.intake_workers)
+        try:
+            for p in _procs:
+                p.join()
+        except KeyboardInterrupt:
+            stop_workers()
@@ -0,0 +1,163 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Chunk metadata + text, one sqlite row per vector id. Files are written once and never
+# modified (each ingest writes a new one), so readers open them immutable + memory-mapped:
+# no parse at startup, only the hit rows are read per search, and every worker process
+# shares the same pages through the OS page cache. An FTS5 index over the chunk text
+# (BM25 ranking) and a per-term document frequency table live in the same file for the
+# lexical half of hybrid search.
+# Each thread reads through its own connection, so concurrent searches don't queue on one.
+
+COLUMNS = ("vid", "id", "hash", "source", "document", "section", "chunk", "char_start", "char_end", "text")
+MMAP_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE chunks (
+    vid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    hash TEXT,
+    source TEXT,
+    document TEXT,
+    section TEXT,
+    chunk INTEGER,
+    char_start INTEGER,
+    char_end INTEGER,
+    text TEXT NOT NULL
+);
+CREATE INDEX chunks_document ON chunks (document);
+CREATE VIRTUAL TABLE chunks_fts USING fts5(text, content='chunks', content_rowid='vid', tokenize='unicode61');
+CREATE VIRTUAL TABLE chunks_vocab USING fts5vocab(chunks_fts, 'row');
+CREATE TABLE term_df (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+"""
+
+FILTER_COLUMNS = ("source", "document", "section")
+
+def _fill(conn: sqlite3.Connection, rows: Iterable[Dict[str, Any]]) -> None:
+    conn.executescript(_SCHEMA)
+    conn.executemany(
+        f"INSERT INTO chunks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+        ([r.get(c) for c in COLUMNS] for r in rows),
+    )
+    conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+    # Document frequencies, materialised once: scanning fts5vocab per search costs milliseconds
+    conn.execute("INSERT INTO term_df (term, df) SELECT term, doc FROM chunks_vocab")
+
+
+def write_meta_store(path: Path, rows: Iterable[Dict[str, Any]]) -> None:
+    path.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(path))
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")  # fresh file renamed into place afterwards; nothing to roll back
+        _fill(conn, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class MetaStore:
+    """Read-only view of one metadata file (or of an in-memory copy for legacy JSON stores)."""
+
+    def __init__(self, conn: sqlite3.Connection, path: Optional[Path] = None) -> None:
+        self.path = path
+        self._conn = conn  # the in-memory copy's only connection; the opening thread's for a file
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()  # serialises the in-memory connection, which can't be reopened
+        self._local = threading.local()
+        if path is not None:
+            self._local.conn = conn
+        self._count = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        # Files written before hybrid search have no FTS table; the lexical leg is then skipped
+        self.has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone() is not None
+        self.has_term_df = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'term_df'").fetchone() is not None
+
+    @staticmethod
+    def _connect(path: Path) -> sqlite3.Connection:
+        # The connection pins this file: a later ingest writes a new one instead of touching it
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @classmethod
+    def open(cls, path: Path) -> "MetaStore":
+        return cls(cls._connect(path), path)
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "MetaStore":
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        _fill(conn, rows)
+        return cls(conn)
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """This thread's connection to the file (opened on first use), or the locked in-memory one."""
+        if self.path is None:
+            with self._lock:
+                yield self._conn
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect(self.path)
+        yield conn
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, vids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Rows for the given vector ids (missing ids are simply absent)."""
+        if not vids:
+            return {}
+        with self._reader() as conn:
+            cur = conn.execute(
+                f"SELECT * FROM chunks WHERE vid IN ({', '.join('?' * len(vids))})", [int(v) for v in vids]
+            )
+            return {r["vid"]: dict(r) for r in cur}
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """Every row in vector-id order (full scan; ingest only)."""
+        with self._reader() as conn:
+            rows = conn.execute("SELECT * FROM chunks ORDER BY vid").fetchall()
+        return (dict(r) for r in rows)
+
+    def filter_vids(self, filters: Dict[str, str]) -> List[int]:
+        """Vector ids whose source/document/section equal the given values."""
+        where, params = self._where(filters)
+        with self._reader() as conn:
+            return [r[0] for r in conn.execute(f"SELECT vid FROM chunks WHERE {where}", params)]
+
+    def _where(self, filters: Optional[Dict[str, str]]) -> Tuple[str, List[str]]:
+        cols = [c for c in FILTER_COLUMNS if filters and filters.get(c) is not None]
+        return " AND ".join(f"{c} = ?" for c in cols) or "1", [filters[c] for c in cols]
+
+    def lexical_search(
+        self, terms: List[str], limit: int, filters: Optional[Dict[str, str]] = None
+    ) -> List[Tuple[int, float]]:
+        """BM25 over chunk text: (vid, bm25) best first, any term matching. bm25 is negative; lower is better."""
+        if not self.has_fts or not terms:
+            return []
+        match = " OR ".join(f'"{t}"' for t in terms)
+        sql = "SELECT rowid, bm25(chunks_fts) FROM chunks_fts WHERE chunks_fts MATCH ?"
+        params: List[Any] = [match]
+        if filters:
+            where, values = self._where(filters)
+            sql += f" AND rowid IN (SELECT vid FROM chunks WHERE {where})"
+            params += values
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        with self._reader() as conn:
+            return [(r[0], r[1]) for r in conn.execute(sql, [*params, limit])]
+
+    def doc_freq(self, terms: List[str]) -> Dict[str, int]:
+        """Number of chunks containing each term (terms absent from the corpus are omitted)."""
+        if not self.has_fts or not terms:
+            return {}
+        # Files from before term_df fall back to the (much slower) fts5vocab scan
+        table, column = ("term_df", "df") if self.has_term_df else ("chunks_vocab", "doc")
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"SELECT term, {column} FROM {table} WHERE term IN ({', '.join('?' * len(terms))})", terms
+            )
+            return {r[0]: r[1] for r in rows}
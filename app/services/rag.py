@@ -1,23 +1,33 @@
-from typing import Dict, Any, List
-import os
-from openai import OpenAI
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import json
+import time
 
-from app.services.sop_ingest import search_sops
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+
+from app.services.answer_cache import answer_cache, chunk_set
+from app.services.clients import get_async_openai_client, get_openai_client
+from app.services.coalesce import COALESCE_QUERIES, SingleFlight
+from app.services.context import pack_context, record_prompt_tokens
+from app.services.embed_cache import normalize_query
+from app.services.sop_ingest import retrieve, retrieve_async
+from app.utils.metrics import STAGE_SECONDS, span
 
 def _oai() -> OpenAI:
-    key = os.getenv("OPENAI_API_KEY", "").strip()
-    if not key:
-        raise RuntimeError("OPENAI_API_KEY missing")
-    return OpenAI(api_key=key)
+    return get_openai_client()
+
+def _aoai() -> AsyncOpenAI:
+    return get_async_openai_client()
 
 def _compute_confidence(matches: List[Dict[str, Any]]) -> float:
     """
-    FAISS score here is cosine similarity (inner product on normalized vectors).
+    Best match score: cosine similarity (inner product on normalized vectors), lifted by the
+    query's rare terms found in the chunk but never past hybrid.LEXICAL_CAP, so an exact
+    TRN / unit code can answer while term overlap alone can't look confident.
+    Matches are in fused (rank) order, so the best score need not be first.
     Typical range ~0.2–0.9 depending on content.
     """
-    if not matches:
-        return 0.0
-    top = matches[0].get("score", 0.0)
+    top = max((m.get("score", 0.0) for m in matches), default=0.0)
     # Clamp to [0,1]
     if top < 0:
         return 0.0
@@ -25,25 +35,26 @@ def _compute_confidence(matches: List[Dict[str, Any]]) -> float:
         return 1.0
     return float(top)
 
-def answer_from_sops(question: str, top_k: int = 4, min_confidence: float = 0.45) -> Dict[str, Any]:
-    retrieval = search_sops(query=question, top_k=top_k)
-    matches = retrieval["matches"]
-    confidence = _compute_confidence(matches)
-
-    citations = [{"source": m["source"], "chunk": m["chunk"], "score": m["score"]} for m in matches]
-
-    # If retrieval is weak, do NOT guess — escalate
-    if confidence < min_confidence or len(matches) == 0:
-        return {
-            "answer": "I don’t have enough information in the approved SOPs to answer confidently. Please escalate to the Chief of Staff.",
-            "citations": citations,
-            "confidence": confidence,
-            "needs_escalation": True,
+def _citations(matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "source": m["source"], "document": m.get("document"), "section": m.get("section"), "chunk": m["chunk"],
+            "char_start": m.get("char_start"), "char_end": m.get("char_end"), "score": m["score"],
         }
+        for m in matches
+    ]
 
-    context_blocks = []
-    for m in matches:
-        context_blocks.append(f"[{m['source']} | chunk {m['chunk']} | score {m['score']:.3f}]\n{m['text']}\n")
+def _escalation(citations: List[Dict[str, Any]], confidence: float) -> Dict[str, Any]:
+    return {
+        "answer": "I don’t have enough information in the approved SOPs to answer confidently. Please escalate to the Chief of Staff.",
+        "citations": citations,
+        "confidence": confidence,
+        "needs_escalation": True,
+    }
+
+def _chat_request(question: str, matches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    excerpts = pack_context(matches)
+    context_blocks = [f"{e.header()}\n{e.text}\n" for e in excerpts]
 
     system = (
         "You are an internal policy assistant for a family office. "
@@ -59,19 +70,19 @@ def answer_from_sops(question: str, top_k: int = 4, min_confidence: float = 0.45
         + "\n\nReturn JSON with keys: answer, next_steps (array), risk_flags (array), used_chunks (array of {source, chunk})."
     )
 
-    client = _oai()
-    resp = client.chat.completions.create(
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+    record_prompt_tokens(matches, excerpts, messages)
+    return dict(
         model="gpt-4o-mini",
         temperature=0.1,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
+        messages=messages,
         response_format={"type": "json_object"},
     )
 
-    content = resp.choices[0].message.content
-
+def _answer(content: str, citations: List[Dict[str, Any]], confidence: float) -> Dict[str, Any]:
     # Return the model JSON + our meta controls
     return {
         "result": content,  # JSON string (kept as-is for simplicity)
@@ -79,3 +90,121 @@ def answer_from_sops(question: str, top_k: int = 4, min_confidence: float = 0.45
         "confidence": confidence,
         "needs_escalation": False,
     }
+
+def answer_from_sops(
+    question: str, top_k: int = 4, min_confidence: float = 0.45, filters: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    retrieval, q_emb, generation = retrieve(query=question, top_k=top_k, filters=filters)
+    matches = retrieval["matches"]
+    confidence = _compute_confidence(matches)
+    citations = _citations(matches)
+
+    # If retrieval is weak, do NOT guess — escalate
+    if confidence < min_confidence or len(matches) == 0:
+        return _escalation(citations, confidence)
+
+    # Same corpus version + same excerpts + (near-)same question => same answer; skip the LLM
+    chunks = chunk_set(matches)
+    content = answer_cache.get(generation, chunks, q_emb)
+    if content is None:
+        client = _oai()
+        with span("chat_completion"):
+            resp = client.chat.completions.create(**_chat_request(question, matches))
+        content = resp.choices[0].message.content
+        answer_cache.put(generation, chunks, q_emb, content)
+    return _answer(content, citations, confidence)
+
+_ANSWER_FLIGHTS = SingleFlight("answer")
+
+async def answer_from_sops_async(
+    question: str,
+    top_k: int = 4,
+    min_confidence: float = 0.45,
+    q_emb: Optional[np.ndarray] = None,
+    filters: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """`q_emb` lets batch callers pass an embedding they already computed for `question`."""
+    if not COALESCE_QUERIES:
+        return await _answer_async(question, top_k, min_confidence, q_emb, filters)
+    # Identical questions in flight at the same time share one retrieval + chat completion
+    key = (normalize_query(question), top_k, min_confidence, tuple(sorted((filters or {}).items())))
+    return await _ANSWER_FLIGHTS.do(key, lambda: _answer_async(question, top_k, min_confidence, q_emb, filters))
+
+async def _answer_async(
+    question: str, top_k: int, min_confidence: float, q_emb: Optional[np.ndarray], filters: Optional[Dict[str, str]]
+) -> Dict[str, Any]:
+    retrieval, q_emb, generation = await retrieve_async(query=question, top_k=top_k, q_emb=q_emb, filters=filters)
+    matches = retrieval["matches"]
+    confidence = _compute_confidence(matches)
+    citations = _citations(matches)
+
+    if confidence < min_confidence or len(matches) == 0:
+        return _escalation(citations, confidence)
+
+    chunks = chunk_set(matches)
+    content = answer_cache.get(generation, chunks, q_emb)
+    if content is None:
+        client = _aoai()
+        with span("chat_completion"):
+            resp = await client.chat.completions.create(**_chat_request(question, matches))
+        content = resp.choices[0].message.content
+        answer_cache.put(generation, chunks, q_emb, content)
+    return _answer(content, citations, confidence)
+
+def parse_answer(content: str) -> Dict[str, Any]:
+    """Model JSON -> the structured answer fields (tolerates malformed output)."""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        data = {"answer": content}
+    if not isinstance(data, dict):
+        data = {"answer": data}
+    return {
+        "answer": data.get("answer", ""),
+        "next_steps": data.get("next_steps", []),
+        "risk_flags": data.get("risk_flags", []),
+        "used_chunks": data.get("used_chunks", []),
+    }
+
+async def stream_answer_from_sops(
+    question: str, top_k: int = 4, min_confidence: float = 0.45, filters: Optional[Dict[str, str]] = None
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Same flow as answer_from_sops_async, as (event, data) pairs:
+    "retrieval" (citations + confidence, as soon as search is done), then "token"
+    deltas from the model, then "answer" with the parsed structured result.
+    """
+    retrieval, q_emb, generation = await retrieve_async(query=question, top_k=top_k, filters=filters)
+    matches = retrieval["matches"]
+    confidence = _compute_confidence(matches)
+    citations = _citations(matches)
+    escalate = confidence < min_confidence or len(matches) == 0
+
+    yield "retrieval", {"citations": citations, "confidence": confidence, "needs_escalation": escalate}
+
+    if escalate:
+        yield "answer", _escalation(citations, confidence)
+        return
+
+    chunks = chunk_set(matches)
+    content = answer_cache.get(generation, chunks, q_emb)
+    if content is not None:
+        yield "token", {"delta": content}
+    else:
+        parts: List[str] = []
+        started = time.perf_counter()
+        with span("chat_completion"):
+            stream = await _aoai().chat.completions.create(**_chat_request(question, matches), stream=True)
+            async for event in stream:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, "chat_first_token")
+                    parts.append(delta)
+                    yield "token", {"delta": delta}
+        content = "".join(parts)
+        answer_cache.put(generation, chunks, q_emb, content)
+
+    yield "answer", {**_answer(content, citations, confidence), **parse_answer(content)}
@@ -1,19 +1,207 @@
+import json
+import os
 import re
-from typing import Tuple
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
-def classify(message: str) -> Tuple[str, bool]:
+# Routing rules live in a JSON file so categories/keywords change without a deploy;
+# edits are picked up on the next classify() after ROUTING_RULES_CHECK_S.
+ROUTING_RULES_FILE = Path(os.getenv("ROUTING_RULES_FILE", "data/routing_rules.json"))
+ROUTING_RULES_CHECK_S = float(os.getenv("ROUTING_RULES_CHECK_S", "2.0"))
+
+DEFAULT_CATEGORY = "general_task"
+
+# Used when no rules file exists: the original expense keyword list
+_BUILTIN_RULES: Dict[str, Any] = {
+    "default_category": DEFAULT_CATEGORY,
+    "categories": {"expense_purchase": {"needs_approval": True}},
+    "rules": [
+        {
+            "id": "expense.keywords",
+            "category": "expense_purchase",
+            "terms": ["buy", "purchase", "invoice", "card", "pay", "subscription", "laptop", "phone", "tablet", "amazon"],
+        }
+    ],
+}
+
+_TOKEN = re.compile(r"\w+")
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.casefold())
+
+
+class Classification(NamedTuple):
+    category: str
+    needs_approval: bool
+    score: float
+    rules: List[str]  # ids of the rules that matched, for the audit trail
+    stage: str = "keywords"  # which routing stage decided: "keywords" or "embedding"
+
+
+class _Automaton:
     """
-    Returns: (category, needs_approval)
+    Aho–Corasick over word tokens: matches every configured term/phrase in a single
+    pass over the message, independent of how many rules there are. Working on whole
+    tokens gives word boundaries for free ("pay" does not fire on "paypal" or "repay").
+    """
+
+    def __init__(self, phrases: Sequence[Tuple[Sequence[str], int]]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[List[int]] = [[]]
+        for tokens, rule in phrases:
+            node = 0
+            for tok in tokens:
+                nxt = self._goto[node].get(tok)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][tok] = nxt
+                    self._goto.append({})
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(rule)
+
+        # Failure links, breadth-first so a node's fail target is always finished first
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for tok, child in self._goto[node].items():
+                f = self._fail[node]
+                while f and tok not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(tok, 0) if node else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def scan(self, tokens: Sequence[str]) -> set:
+        hits = set()
+        node = 0
+        for tok in tokens:
+            while node and tok not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(tok, 0)
+            hits.update(self._out[node])
+        return hits
+
+
+class RuleTable:
+    """
+    Compiled rule table. Config shape:
+
+        {"default_category": "general_task",
+         "categories": {"expense_purchase": {"needs_approval": true, "min_score": 1.0,
+                                             "examples": ["Settle the bill from the caterer"]}},
+         "rules": [{"id": "expense.buy", "category": "expense_purchase",
+                    "terms": ["buy", "bought", "credit card"], "weight": 1.0,
+                    "needs_approval": false}]}
+
+    The highest-scoring category (sum of its matched rule weights) wins if it reaches
+    its min_score; ties go to the category listed first. Approval is required if the
+    category asks for it or any matched rule does. Category "examples" feed the
+    embedding fallback in app/services/intent.py.
     """
-    m = message.lower()
 
-    # expense / purchase signals
-    expense_keywords = ["buy", "purchase", "invoice", "card", "pay", "subscription", "laptop", "phone", "tablet", "amazon"]
-    if any(k in m for k in expense_keywords):
-        return ("expense_purchase", True)
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.default_category = config.get("default_category", DEFAULT_CATEGORY)
+        self.categories: Dict[str, Dict[str, Any]] = dict(config.get("categories", {}))
+        self.rules: List[Dict[str, Any]] = []
+        phrases = []
+        for rule in config.get("rules", []):
+            if "id" not in rule or "category" not in rule:
+                raise RuntimeError(f"Routing rule needs an id and a category: {rule}")
+            self.categories.setdefault(rule["category"], {})
+            idx = len(self.rules)
+            self.rules.append(rule)
+            for term in rule.get("terms", []):
+                tokens = _tokens(term)
+                if tokens:
+                    phrases.append((tokens, idx))
+        self._order = {name: i for i, name in enumerate(self.categories)}
+        self._automaton = _Automaton(phrases)
+
+    def classify(self, message: str) -> Classification:
+        hits = sorted(self._automaton.scan(_tokens(message)))
+        scores: Dict[str, float] = {}
+        for idx in hits:
+            rule = self.rules[idx]
+            scores[rule["category"]] = scores.get(rule["category"], 0.0) + float(rule.get("weight", 1.0))
+
+        eligible = [
+            (score, -self._order[cat], cat)
+            for cat, score in scores.items()
+            if score >= float(self.categories[cat].get("min_score", 0.0))
+        ]
+        if not eligible:
+            return Classification(self.default_category, False, 0.0, [self.rules[i]["id"] for i in hits])
+
+        score, _, category = max(eligible)
+        needs_approval = bool(self.categories[category].get("needs_approval", False)) or any(
+            self.rules[i].get("needs_approval", False) for i in hits
+        )
+        return Classification(category, needs_approval, score, [self.rules[i]["id"] for i in hits])
+
+
+class _RuleHolder:
+    """Current RuleTable, recompiled when the rules file changes (a bad edit keeps the last good table)."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._table: Optional[RuleTable] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, stamp: Optional[Tuple[int, int]]) -> RuleTable:
+        if stamp is None:
+            return RuleTable(_BUILTIN_RULES)
+        return RuleTable(json.loads(self.path.read_text(encoding="utf-8")))
 
-    # default
-    return ("general_task", False)
+    def get(self) -> RuleTable:
+        table = self._table
+        now = time.monotonic()
+        if table is not None and now - self._last_check < ROUTING_RULES_CHECK_S:
+            return table
+        with self._lock:
+            self._last_check = now
+            stamp = self._file_stamp()
+            if self._table is not None and stamp == self._stamp:
+                return self._table
+            try:
+                self._table = self._load(stamp)
+                self.last_error = None
+            except Exception as e:
+                if self._table is None:
+                    raise RuntimeError(f"Invalid routing rules in {self.path}: {e}") from e
+                self.last_error = str(e)
+            self._stamp = stamp
+            return self._table
+
+
+_RULES = _RuleHolder(ROUTING_RULES_FILE)
+
+def get_rule_table() -> RuleTable:
+    return _RULES.get()
+
+def classify_message(message: str) -> Classification:
+    return _RULES.get().classify(message)
+
+def classify(message: str) -> Tuple[str, bool]:
+    """
+    Returns: (category, needs_approval)
+    """
+    result = classify_message(message)
+    return (result.category, result.needs_approval)
 
 def make_title(message: str) -> str:
     # Keep it short for Todoist title
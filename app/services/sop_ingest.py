@@ -1,123 +1,559 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Callable, Iterator, NamedTuple, Optional, Tuple
 import os
 import json
+import asyncio
+import contextvars
+import hashlib
+import threading
+import time
+import uuid
 
 import numpy as np
 import faiss
-import tiktoken
-from openai import OpenAI
 
-SOP_PATH = Path("data/sops/expenses_sop.txt")
+from app.services.chunking import CHUNKER, chunk_spans
+from app.services.coalesce import COALESCE_QUERIES, query_coalescer
+from app.services.embed_cache import query_cache
+from app.services.embeddings import get_embedder
+from app.services.hybrid import HYBRID_CANDIDATES, SEARCH_POOL, fuse, lexical_leg, vector_leg
+from app.services.meta_store import MetaStore, write_meta_store
+from app.services.vector_index import apply_search_params, build_search_index
+from app.utils.metrics import span
+
+# Every *.txt / *.md under this tree is part of the corpus (subfolder = section, e.g. travel/, vendors/)
+SOP_DIR = Path("data/sops")
+SOP_GLOBS = ("*.txt", "*.md")
 
 # We’ll store the FAISS index + metadata locally (simple + demo-friendly)
+# Each ingest writes new uniquely named files (sops.<token>.index, sops.ann.<token>.index,
+# sops.meta.<token>.sqlite); the info file is the one pointer to them and is renamed into place last.
 VSTORE_DIR = Path("data/vector_store")
-INDEX_FILE = VSTORE_DIR / "sops.index"
-META_FILE = VSTORE_DIR / "sops.meta.json"
-
-def _get_openai_client() -> OpenAI:
-    key = os.getenv("OPENAI_API_KEY", "").strip()
-    if not key:
-        raise RuntimeError("OPENAI_API_KEY is missing in environment/.env")
-    return OpenAI(api_key=key)
-
-def _chunk_text(text: str, max_tokens: int = 350, overlap_tokens: int = 50) -> List[str]:
-    enc = tiktoken.get_encoding("cl100k_base")
-    tokens = enc.encode(text)
-    chunks = []
-    i = 0
-    while i < len(tokens):
-        window = tokens[i:i + max_tokens]
-        chunks.append(enc.decode(window))
-        i += max_tokens - overlap_tokens
-    return chunks
-
-def _embed_texts(texts: List[str]) -> np.ndarray:
-    import time
-    oai = _get_openai_client()
-    embeddings: List[List[float]] = []
-
-    batch_size = 16  # smaller batches reduce rate-limit risk
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-
-        # retry with exponential backoff on 429
-        for attempt in range(5):
-            try:
-                resp = oai.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=batch
-                )
-                embeddings.extend([d.embedding for d in resp.data])
-                break
-            except Exception as e:
-                msg = str(e)
-                if "429" in msg or "rate" in msg.lower():
-                    sleep_s = 2 ** attempt
-                    time.sleep(sleep_s)
-                    continue
-                raise  # non-429 errors should fail fast
-
-    arr = np.array(embeddings, dtype="float32")
-    faiss.normalize_L2(arr)
-    return arr
-
-
-def ingest_expenses_sop() -> Dict[str, Any]:
-    if not SOP_PATH.exists():
-        raise RuntimeError(f"SOP file not found at: {SOP_PATH}")
-
-    text = SOP_PATH.read_text(encoding="utf-8").strip()
-    chunks = _chunk_text(text)
-
-    embeddings = _embed_texts(chunks)
-    dim = embeddings.shape[1]
-
-    # Build FAISS index (cosine via inner product on normalized vectors)
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
-
-    # Save index + metadata
-    VSTORE_DIR.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(INDEX_FILE))
+INFO_FILE = VSTORE_DIR / "sops.info.json"  # provider/dimension, search index and the current store files
+INDEX_FILE = VSTORE_DIR / "sops.index"  # legacy fixed names, read only for stores whose info file predates the tokens
+META_FILE = VSTORE_DIR / "sops.meta.json"  # legacy JSON metadata, read only if no sqlite store exists yet
+ANN_FILE = VSTORE_DIR / "sops.ann.index"
+
+# Ingestion throughput knobs
+INGEST_WORKERS = int(os.getenv("SOP_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Below this much SOP text, chunking in-process beats starting worker processes (each loads the tokenizer)
+PARALLEL_CHUNK_MIN_BYTES = int(os.getenv("SOP_PARALLEL_CHUNK_MIN_BYTES", str(2 * 1024 * 1024)))
+
+# How often (seconds) searches stat the store files to pick up an ingest done by another worker
+RELOAD_CHECK_INTERVAL_S = float(os.getenv("SOP_INDEX_RELOAD_CHECK_S", "2.0"))
+
+def _embed_batches(texts: List[str]) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Yield (offset, vectors) for each batch of `texts` as soon as it completes,
+    with up to the provider's concurrency in flight. Order is not preserved.
+    """
+    if not texts:
+        return
+    embedder = get_embedder()
+    size = embedder.batch_size
+    batches = [(i, texts[i:i + size]) for i in range(0, len(texts), size)]
+
+    if len(batches) == 1 or embedder.concurrency <= 1:
+        for offset, batch in batches:
+            yield offset, embedder.embed(batch)
+        return
+
+    with ThreadPoolExecutor(max_workers=embedder.concurrency) as pool:
+        futures = {pool.submit(embedder.embed, batch): offset for offset, batch in batches}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
+
+def _embed_query(query: str) -> np.ndarray:
+    """Single query embedding, served from the query cache when possible. Shape (1, dim)."""
+    embedder = get_embedder()
+    cached = query_cache.get(embedder.name, query)
+    if cached is not None:
+        return cached.reshape(1, -1)
+
+    q_emb = embedder.embed([query])
+    query_cache.put(embedder.name, query, q_emb[0])
+    return q_emb
+
+async def _embed_query_async(query: str) -> np.ndarray:
+    embedder = get_embedder()
+    cached = await query_cache.get_async(embedder.name, query)
+    if cached is not None:
+        return cached.reshape(1, -1)
+
+    q_emb = await embedder.embed_async([query])
+    query_cache.put(embedder.name, query, q_emb[0])
+    return q_emb
+
+
+BULK_EMBED_BATCH_SIZE = int(os.getenv("BULK_EMBED_BATCH_SIZE", "256"))  # inputs per request when embedding many queries
+
+async def embed_queries_async(queries: List[str]) -> np.ndarray:
+    """
+    Embeddings for many queries at once (bulk intake): cache hits are reused and all
+    misses go out in as few embeddings requests as possible. Shape (len(queries), dim).
+    """
+    embedder = get_embedder()
+    vecs: List[Optional[np.ndarray]] = await query_cache.get_many_async(embedder.name, queries)
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    for start in range(0, len(missing), BULK_EMBED_BATCH_SIZE):
+        idxs = missing[start:start + BULK_EMBED_BATCH_SIZE]
+        emb = await embedder.embed_async([queries[i] for i in idxs])
+        for i, v in zip(idxs, emb):
+            vecs[i] = v
+            query_cache.put(embedder.name, queries[i], v)
+    if not vecs:
+        return np.zeros((0, 0), dtype="float32")
+    return np.vstack([v.reshape(1, -1) for v in vecs])
+
+def _chunk_hash(text: str) -> str:
+    """Content address of a chunk: same text + chunker params + model => same vector."""
+    h = hashlib.sha256()
+    h.update(f"{get_embedder().name}|{CHUNKER}\n".encode("utf-8"))
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+def _vector_id(document: str, chunk_hash: str) -> int:
+    # FAISS ids are int64; take 63 bits so they stay positive. The document is part of the id
+    # so the same paragraph in two SOPs keeps two citations (the vector itself is reused).
+    digest = hashlib.sha256(f"{document}|{chunk_hash}".encode("utf-8")).hexdigest()
+    return int(digest[:16], 16) & 0x7FFF_FFFF_FFFF_FFFF
 
+def _discover_sops(root: Path) -> List[Path]:
+    return sorted({p for pattern in SOP_GLOBS for p in root.rglob(pattern) if p.is_file()})
+
+def _doc_info(path: Path, root: Path) -> Dict[str, str]:
+    rel = path.relative_to(root)
+    section = rel.parent.as_posix()
+    return {
+        "document": rel.as_posix(),
+        "slug": rel.with_suffix("").as_posix().replace("/", "_"),
+        "source": f"SFO {path.stem.replace('_', ' ').upper()}",  # expenses_sop.txt -> "SFO EXPENSES SOP"
+        "section": "" if section == "." else section,
+    }
+
+def _read_and_chunk(path: str) -> List[Tuple[int, int, str]]:
+    # Module-level so it can run in a worker process
+    text = Path(path).read_text(encoding="utf-8")
+    return [(start, end, text[start:end]) for start, end in chunk_spans(text)]
+
+def _chunk_documents(paths: List[Path]) -> List[List[Tuple[int, int, str]]]:
+    """(start, end, text) chunks per document; offsets are characters into the file's text."""
+    if INGEST_WORKERS <= 1 or len(paths) < 2 or sum(p.stat().st_size for p in paths) < PARALLEL_CHUNK_MIN_BYTES:
+        return [_read_and_chunk(str(p)) for p in paths]
+    with ProcessPoolExecutor(max_workers=min(INGEST_WORKERS, len(paths))) as pool:
+        return list(pool.map(_read_and_chunk, [str(p) for p in paths], chunksize=4))
+
+def _current_store() -> Tuple[Optional[faiss.Index], List[Dict[str, Any]]]:
+    """
+    Existing index (a private copy, safe to mutate) + meta rows for incremental ingest.
+    Returns (None, []) when there is no store yet or it predates content hashing.
+    """
+    try:
+        snap = _STORE.get()
+    except RuntimeError:
+        return None, []
+    if snap.provider != get_embedder().name:
+        return None, []  # other vector space: nothing is reusable
+    rows = list(snap.meta.rows())
+    if not rows or not all(m["hash"] for m in rows):
+        return None, []
+    if snap.ann.get("type", "flat") != "flat":
+        return faiss.read_index(str(flat_index_file())), rows  # readers only hold the ANN index
+    return faiss.clone_index(snap.index), rows
+
+def ingest_sops(root: Path = SOP_DIR, progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, Any]:
+    """Incremental (re)ingest. `progress(fraction, message)` is called as stages complete."""
+    report = progress or (lambda fraction, message: None)
+    if not root.exists():
+        raise RuntimeError(f"SOP directory not found at: {root}")
+    paths = _discover_sops(root)  # none (or only empty files) is a valid, zero-chunk corpus
+
+    report(0.0, f"chunking {len(paths)} documents")
     meta = []
-    for i, chunk in enumerate(chunks):
-        meta.append({
-            "id": f"expenses_sop_{i}",
-            "source": "SFO EXPENSES SOP",
-            "chunk": i,
-            "text": chunk
-        })
+    seen = set()
+    with span("ingest_chunk"):
+        chunked = _chunk_documents(paths)
+    for path, chunks in zip(paths, chunked):
+        doc = _doc_info(path, root)
+        for i, (start, end, chunk) in enumerate(chunks):
+            h = _chunk_hash(chunk)
+            vid = _vector_id(doc["document"], h)
+            if vid in seen:  # identical chunk repeated within one document
+                continue
+            seen.add(vid)
+            meta.append({
+                "id": f"{doc['slug']}_{i}",
+                "vid": vid,
+                "hash": h,
+                "source": doc["source"],
+                "document": doc["document"],
+                "section": doc["section"],
+                "chunk": i,
+                "char_start": start,
+                "char_end": end,
+                "text": chunk
+            })
+
+    index, old_meta = _current_store()
+    old_vids = {m["vid"] for m in old_meta}
+    vid_by_hash = {m["hash"]: m["vid"] for m in old_meta}
+
+    wanted_vids = {m["vid"] for m in meta}
+    stale_ids = [v for v in old_vids if v not in wanted_vids]
+    added = [m for m in meta if m["vid"] not in old_vids]
+
+    # Rows whose text is already embedded elsewhere in the store (moved file, shared boilerplate)
+    copied = [m for m in added if m["hash"] in vid_by_hash]
+    vids_by_new_hash: Dict[str, List[int]] = {}
+    text_by_hash: Dict[str, str] = {}
+    for m in added:
+        if m["hash"] not in vid_by_hash:
+            vids_by_new_hash.setdefault(m["hash"], []).append(m["vid"])
+            text_by_hash[m["hash"]] = m["text"]
+    to_embed = list(vids_by_new_hash)
+
+    summary = {
+        "documents": len(paths),
+        "chunks": len(meta),
+        "embedded": len(to_embed),
+        "reused": len(meta) - len(to_embed),
+        "removed": len(stale_ids),
+        "store": "faiss",
+        "provider": get_embedder().name,
+    }
+    unchanged = not added and not stale_ids and {m["vid"]: m for m in meta} == {m["vid"]: m for m in old_meta}
+    if unchanged and (index is None or _STORE.get().meta.has_term_df):  # older metadata files get rewritten once
+        return summary
+
+    if copied:
+        vectors = np.vstack([index.reconstruct(vid_by_hash[m["hash"]]) for m in copied])
+    if stale_ids:
+        index.remove_ids(np.array(stale_ids, dtype="int64"))
+    if copied:
+        index.add_with_ids(vectors, np.array([m["vid"] for m in copied], dtype="int64"))
+
+    texts = [text_by_hash[h] for h in to_embed]
+    report(0.1, f"embedding {len(texts)} chunks")
+    done = 0
+    with span("ingest_embed"):
+        # Stream each embedded batch straight into the index instead of collecting the corpus first
+        for offset, emb in _embed_batches(texts):
+            if index is None or index.d != emb.shape[1]:
+                # Cosine via inner product on normalized vectors; IDMap2 gives add/remove/reconstruct by id.
+                # A dim change means a new model, which already made every old hash stale.
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(emb.shape[1]))
+            rows, ids = [], []
+            for j, h in enumerate(to_embed[offset:offset + len(emb)]):
+                for vid in vids_by_new_hash[h]:
+                    rows.append(j)
+                    ids.append(vid)
+            index.add_with_ids(emb[rows], np.array(ids, dtype="int64"))
+            done += len(emb)
+            report(0.1 + 0.8 * done / len(texts), f"embedded {done}/{len(texts)} chunks")
+    if index is None:
+        return summary  # nothing was ever embedded: no store to write yet
+
+    report(0.9, "building search index")
+    with span("ingest_index"):
+        search_index, ann = build_search_index(index)
+    summary["index"] = ann
+
+    # Save index + metadata, then hand the fresh index to in-process readers
+    with span("ingest_save"):
+        info = _save_index_and_meta(index, meta, search_index, ann)
+    meta_file = VSTORE_DIR / info["meta_store"]
+    summary["index_file"] = str(VSTORE_DIR / info["index_file"])
+    summary["meta_file"] = str(meta_file)
+    _STORE.publish(search_index or index, MetaStore.open(meta_file), ann)
+
+    return summary
+
+def _save_index_and_meta(
+    index: faiss.Index,
+    meta: List[Dict[str, Any]],
+    search_index: Optional[faiss.Index] = None,
+    ann: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Write the index, ANN index and metadata to new uniquely named files, then rename the
+    info file that points at them into place, so a concurrent reader (this process or
+    another worker) sees either the old store or the new one, never a mix of the two.
+    """
+    VSTORE_DIR.mkdir(parents=True, exist_ok=True)
+    token = uuid.uuid4().hex[:12]
+    index_file = VSTORE_DIR / f"sops.{token}.index"
+    ann_file = VSTORE_DIR / f"sops.ann.{token}.index"
+    meta_file = VSTORE_DIR / f"sops.meta.{token}.sqlite"
+    tmp_info = INFO_FILE.with_suffix(INFO_FILE.suffix + ".tmp")
 
-    META_FILE.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    faiss.write_index(index, str(index_file))
+    if search_index is not None:
+        faiss.write_index(search_index, str(ann_file))
+    write_meta_store(meta_file, meta)
+    info = {
+        "provider": get_embedder().name,
+        "dim": index.d,
+        "vectors": index.ntotal,
+        "ann": ann or {"type": "flat"},
+        "index_file": index_file.name,
+        "meta_store": meta_file.name,
+    }
+    if search_index is not None:
+        info["ann_file"] = ann_file.name
+    tmp_info.write_text(json.dumps(info))
+    os.replace(tmp_info, INFO_FILE)  # atomic within a directory (POSIX + Windows)
 
-    return {"chunks": len(chunks), "store": "faiss", "index_file": str(INDEX_FILE), "meta_file": str(META_FILE)}
+    # Older store files: gone once no process has them open (Windows refuses while one does).
+    # A reader that read the old info file just before this retries on its next check.
+    current = {index_file, ann_file, meta_file}
+    stale = [INDEX_FILE, ANN_FILE, META_FILE, *VSTORE_DIR.glob("sops.*.index"), *VSTORE_DIR.glob("sops.meta.*.sqlite")]
+    for old in stale:
+        if old not in current:
+            try:
+                old.unlink(missing_ok=True)
+            except OSError:
+                pass
+    return info
+
+def _read_info() -> Dict[str, Any]:
+    return json.loads(INFO_FILE.read_text(encoding="utf-8")) if INFO_FILE.exists() else {}
+
+def flat_index_file(info: Optional[Dict[str, Any]] = None) -> Path:
+    """The exact (flat) index the info file points at: the source of truth ingest updates."""
+    info = _read_info() if info is None else info
+    return VSTORE_DIR / info.get("index_file", INDEX_FILE.name)
 
-def _load_index_and_meta() -> Tuple[faiss.Index, List[Dict[str, Any]]]:
-    if not INDEX_FILE.exists() or not META_FILE.exists():
+def _store_stamp() -> Optional[Tuple[int, ...]]:
+    # Every ingest renames a new info file into place: a new inode, whatever the mtime resolution
+    files = [f for f in (INFO_FILE, INDEX_FILE, ANN_FILE, META_FILE) if f.exists()]
+    if not files:
+        return None
+    return tuple(x for f in files for x in (f.stat().st_ino, f.stat().st_mtime_ns))
+
+def _load_index_and_meta() -> Tuple[faiss.Index, MetaStore, Dict[str, Any]]:
+    info = _read_info()
+    index_file = flat_index_file(info)
+    if not index_file.exists() or ("meta_store" not in info and not META_FILE.exists()):
         raise RuntimeError("Vector store not found. Run /sop/ingest first.")
 
-    index = faiss.read_index(str(INDEX_FILE))
-    meta = json.loads(META_FILE.read_text(encoding="utf-8"))
-    return index, meta
-
-def search_sops(query: str, top_k: int = 4) -> Dict[str, Any]:
-    index, meta = _load_index_and_meta()
-
-    q_emb = _embed_texts([query])  # shape (1, dim)
-    scores, idxs = index.search(q_emb, top_k)
-
-    matches = []
-    for score, idx in zip(scores[0], idxs[0]):
-        if idx == -1:
-            continue
-        item = meta[idx]
-        matches.append({
-            "source": item["source"],
-            "chunk": item["chunk"],
-            "score": float(score),  # higher is more similar
-            "text": item["text"]
-        })
-
-    return {"query": query, "top_k": top_k, "matches": matches}
+    if "meta_store" in info:
+        meta = MetaStore.open(VSTORE_DIR / info["meta_store"])
+    else:
+        # Legacy JSON list: parsed once into an in-memory table; FAISS labels may be row positions
+        rows = json.loads(META_FILE.read_text(encoding="utf-8"))
+        meta = MetaStore.from_rows([{**m, "vid": m.get("vid", i)} for i, m in enumerate(rows)])
+    info.setdefault("provider", "text-embedding-3-small")  # stores from before providers were pluggable
+    info.setdefault("ann", {"type": "flat"})
+
+    # Serve from the ANN index when one was built; the flat one is only needed by ingest
+    ann_file = VSTORE_DIR / info.get("ann_file", ANN_FILE.name)
+    if info["ann"]["type"] != "flat" and ann_file.exists():
+        index = faiss.read_index(str(ann_file))
+        apply_search_params(index, info["ann"])
+    else:
+        index = faiss.read_index(str(index_file))
+        info["ann"] = {"type": "flat"}
+    return index, meta, info
+
+
+class IndexSnapshot(NamedTuple):
+    index: faiss.Index
+    meta: MetaStore  # FAISS label (vid) -> chunk row, fetched per search
+    generation: int  # bumps on every swap; lets callers key caches on corpus version
+    stamp: Optional[Tuple[int, ...]]
+    provider: str  # embedding provider name the vectors came from
+    ann: Dict[str, Any]  # search index type, tuned parameter and measured recall
+
+
+class _IndexHolder:
+    """
+    Process-resident FAISS index + metadata.
+
+    Readers take the current immutable snapshot (a single reference read, no lock).
+    Swaps build a complete new snapshot first and then replace the reference,
+    so a reader sees either the old corpus or the new one, never a mix.
+    """
+
+    def __init__(self) -> None:
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._last_check = 0.0
+
+    def publish(self, index: faiss.Index, meta: MetaStore, ann: Dict[str, Any]) -> IndexSnapshot:
+        with self._lock:
+            return self._swap(index, meta, _store_stamp(), get_embedder().name, ann)
+
+    def reload(self) -> IndexSnapshot:
+        with self._lock:
+            return self._reload_locked()
+
+    def get(self) -> IndexSnapshot:
+        snap = self._snapshot
+        if snap is None:
+            return self.reload()
+        return self._refresh(snap) if self._check_due() else snap
+
+    async def get_async(self) -> IndexSnapshot:
+        """
+        get() for the event loop: file reads and index loads run on the search pool.
+        A due reload check runs in the background; this request and the ones after it
+        keep the current snapshot until the new one is swapped in.
+        """
+        snap = self._snapshot
+        if snap is None:
+            return await asyncio.get_running_loop().run_in_executor(SEARCH_POOL, self.reload)
+        if self._check_due():
+            SEARCH_POOL.submit(self._refresh, snap)
+        return snap
+
+    def _check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL_S:
+            return False
+        self._last_check = now
+        return True
+
+    def _refresh(self, snap: IndexSnapshot) -> IndexSnapshot:
+        if _store_stamp() == snap.stamp:
+            return snap
+
+        # Files changed on disk (ingest in another worker). One reader reloads;
+        # everyone else keeps serving the current snapshot instead of waiting.
+        if not self._lock.acquire(blocking=False):
+            return snap
+        try:
+            return self._reload_locked()
+        except Exception:
+            return snap
+        finally:
+            self._lock.release()
+
+    def _reload_locked(self) -> IndexSnapshot:
+        stamp = _store_stamp()
+        if self._snapshot is not None and stamp == self._snapshot.stamp:
+            return self._snapshot
+
+        index, meta, info = _load_index_and_meta()
+        if index.ntotal != len(meta):
+            # A legacy store (fixed file names) caught mid-replace; keep what we have and retry on the next check
+            if self._snapshot is not None:
+                return self._snapshot
+            raise RuntimeError("Vector store is being rewritten. Retry shortly.")
+        return self._swap(index, meta, stamp, info["provider"], info["ann"])
+
+    def _swap(
+        self, index: faiss.Index, meta: MetaStore, stamp, provider: str, ann: Dict[str, Any]
+    ) -> IndexSnapshot:
+        self._generation += 1
+        snap = IndexSnapshot(
+            index=index, meta=meta, generation=self._generation, stamp=stamp, provider=provider, ann=ann
+        )
+        self._snapshot = snap
+        return snap
+
+
+_STORE = _IndexHolder()
+
+def get_index_snapshot() -> IndexSnapshot:
+    return _STORE.get()
+
+async def get_index_snapshot_async() -> IndexSnapshot:
+    return await _STORE.get_async()
+
+def warm_vector_store() -> bool:
+    """Load the index at startup. Returns False if nothing has been ingested yet."""
+    try:
+        _STORE.reload()
+        return True
+    except RuntimeError:
+        return False
+
+def _require_provider(snap: IndexSnapshot) -> None:
+    current = get_embedder().name
+    if snap.provider != current:
+        raise RuntimeError(
+            f"SOP index was built with embeddings from '{snap.provider}' but EMBED_PROVIDER gives '{current}'. "
+            "Run /sop/ingest to rebuild it."
+        )
+
+Filters = Optional[Dict[str, str]]  # exact source / document / section to restrict retrieval to
+
+def _search_snapshot(
+    snap: IndexSnapshot,
+    query: str,
+    q_emb: np.ndarray,
+    top_k: int,
+    filters: Filters = None,
+    lexical: Optional[List[Tuple[int, float]]] = None,
+    vector_hits: Optional[List[Tuple[int, float]]] = None,
+) -> Dict[str, Any]:
+    """Dense + lexical candidates (either may be precomputed by the caller), fused to top_k."""
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    result = {"query": query, "top_k": top_k, "matches": []}
+    if filters:
+        result["filters"] = filters
+    limit = max(HYBRID_CANDIDATES, top_k)
+    if vector_hits is None:
+        allowed = snap.meta.filter_vids(filters) if filters else None
+        if allowed is not None and not allowed:
+            return result
+        with span("vector_search"):
+            vector_hits = vector_leg(snap.index, snap.ann.get("type", "flat"), q_emb, limit, allowed)
+    if lexical is None:
+        lexical = _lexical_leg(snap.meta, query, limit, filters)
+    with span("fuse"):
+        result["matches"] = fuse(snap.meta, query, vector_hits, lexical, top_k)
+    return result
+
+def _lexical_leg(meta: MetaStore, query: str, limit: int, filters: Filters) -> List[Tuple[int, float]]:
+    with span("lexical_search"):
+        return lexical_leg(meta, query, limit, filters)
+
+def retrieve(query: str, top_k: int = 4, filters: Filters = None) -> Tuple[Dict[str, Any], np.ndarray, int]:
+    """search_sops plus the query embedding and the index generation it ran against."""
+    snap = get_index_snapshot()
+    _require_provider(snap)
+    # BM25 runs on a pool thread while this one waits on the embedding (context copied: its span counts for this request)
+    lexical = SEARCH_POOL.submit(
+        contextvars.copy_context().run, _lexical_leg, snap.meta, query, max(HYBRID_CANDIDATES, top_k), filters
+    )
+    with span("embed_query"):
+        q_emb = _embed_query(query)  # shape (1, dim)
+    return _search_snapshot(snap, query, q_emb, top_k, filters, lexical.result()), q_emb, snap.generation
+
+async def retrieve_async(
+    query: str, top_k: int = 4, q_emb: Optional[np.ndarray] = None, filters: Filters = None
+) -> Tuple[Dict[str, Any], np.ndarray, int]:
+    snap = await get_index_snapshot_async()
+    _require_provider(snap)
+    loop = asyncio.get_running_loop()
+    lexical = loop.run_in_executor(
+        SEARCH_POOL,
+        contextvars.copy_context().run, _lexical_leg, snap.meta, query, max(HYBRID_CANDIDATES, top_k), filters,
+    )
+    vector_hits = None
+    active = {k: v for k, v in (filters or {}).items() if v is not None} if COALESCE_QUERIES else None
+    allowed = await loop.run_in_executor(SEARCH_POOL, snap.meta.filter_vids, active) if active else None
+    if COALESCE_QUERIES and allowed != []:
+        # Embedding + vector search batched with concurrent requests (app/services/coalesce.py)
+        with span("embed_and_search"):
+            q_emb, vector_hits = await query_coalescer.search(
+                snap.index, snap.ann.get("type", "flat"), snap.generation, query,
+                max(HYBRID_CANDIDATES, top_k), q_emb, allowed,
+            )
+    elif q_emb is None:
+        with span("embed_query"):
+            q_emb = await _embed_query_async(query)
+    result = await loop.run_in_executor(
+        SEARCH_POOL,
+        contextvars.copy_context().run, _search_snapshot, snap, query, q_emb, top_k, filters, await lexical, vector_hits,
+    )
+    return result, q_emb, snap.generation
+
+def search_sops(query: str, top_k: int = 4, filters: Filters = None) -> Dict[str, Any]:
+    return retrieve(query, top_k, filters)[0]
+
+async def search_sops_async(query: str, top_k: int = 4, filters: Filters = None) -> Dict[str, Any]:
+    return (await retrieve_async(query, top_k, filters=filters))[0]
@@ -1,38 +1,119 @@
+import asyncio
+import json
 import os
-import requests
+import time
+from typing import Dict, Optional
 
-TODOIST_API_BASE = "https://api.todoist.com/rest/v2"
+from app.services.clients import get_async_http_client, timeout_for
 
-def _headers():
+TODOIST_API_BASE = os.getenv("TODOIST_API_BASE", "https://api.todoist.com/rest/v2")  # overridable for local stand-ins (bench/)
+TODOIST_HOST = "api.todoist.com"
+
+# Project name -> id changes almost never; refresh at most this often (plus on a miss)
+PROJECT_CACHE_TTL_S = float(os.getenv("TODOIST_PROJECT_CACHE_TTL_S", "3600"))
+PROJECT_MISS_REFRESH_S = 30.0  # don't hammer /projects for a name that really doesn't exist
+
+def default_project_name() -> str:
+    return os.getenv("TODOIST_PROJECT_NAME", "Inbox")
+
+# Optional routing of classify() categories to projects, e.g. TODOIST_CATEGORY_PROJECTS='{"expense_purchase": "Purchases"}'.
+# Parsed once: it is looked up on every intake
+CATEGORY_PROJECTS: Dict[str, str] = json.loads(os.getenv("TODOIST_CATEGORY_PROJECTS", "").strip() or "{}")
+
+def category_project_names() -> Dict[str, str]:
+    return CATEGORY_PROJECTS
+
+def project_name_for_category(category: str) -> str:
+    return category_project_names().get(category, default_project_name())
+
+def auth_headers() -> Dict[str, str]:
+    """Bearer token header for any Todoist API (REST or Sync)."""
     token = os.getenv("TODOIST_API_TOKEN", "").strip()
     if not token:
         raise RuntimeError("TODOIST_API_TOKEN is missing in environment/.env")
-    return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    return {"Authorization": f"Bearer {token}"}
 
-def get_projects():
-    r = requests.get(f"{TODOIST_API_BASE}/projects", headers=_headers(), timeout=20)
-    r.raise_for_status()
-    return r.json()
+def _headers():
+    return {**auth_headers(), "Content-Type": "application/json"}
 
-def get_project_id_by_name(project_name: str) -> str:
-    projects = get_projects()
-    for p in projects:
-        if p.get("name") == project_name:
-            return p["id"]
-    raise RuntimeError(f"Todoist project not found: {project_name}")
-
-def create_task(content: str, description: str = "", project_id: str | None = None):
-    payload = {"content": content}
-    if description:
-        payload["description"] = description
-    if project_id:
-        payload["project_id"] = project_id
-
-    r = requests.post(f"{TODOIST_API_BASE}/tasks", json=payload, headers=_headers(), timeout=20)
-    r.raise_for_status()
-    return r.json()
-def add_comment(task_id: str, content: str):
-    payload = {"task_id": task_id, "content": content}
-    r = requests.post(f"{TODOIST_API_BASE}/comments", json=payload, headers=_headers(), timeout=20)
+
+class _ProjectDirectory:
+    """
+    name -> id for Todoist projects, loaded once and shared by all requests.
+    Stale entries are still served while a refresh runs in the background;
+    unknown names trigger one (rate-limited) refresh before failing.
+    """
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        # Bound to the loop that created them; job workers can run on another loop (see _bind_loop)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._bg_task: Optional[asyncio.Task] = None
+
+    def _store(self, projects) -> None:
+        self._ids = {p["name"]: p["id"] for p in projects if p.get("name")}
+        self._loaded_at = time.monotonic()
+
+    def _age(self) -> float:
+        return time.monotonic() - self._loaded_at
+
+    def _lookup(self, project_name: str) -> str:
+        try:
+            return self._ids[project_name]
+        except KeyError:
+            raise RuntimeError(f"Todoist project not found: {project_name}") from None
+
+    def _bind_loop(self) -> None:
+        # A lock or task from a previous (possibly closed) loop would block or never finish here
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._refresh_lock, self._bg_task = loop, asyncio.Lock(), None
+
+    async def refresh_async(self) -> None:
+        self._bind_loop()
+        loaded_at = self._loaded_at
+        async with self._refresh_lock:
+            if self._loaded_at != loaded_at:
+                return  # someone else refreshed while we waited
+            self._store(await get_projects_async())
+
+    async def resolve_async(self, project_name: str) -> str:
+        self._bind_loop()
+        if project_name in self._ids:
+            if self._age() > PROJECT_CACHE_TTL_S and (self._bg_task is None or self._bg_task.done()):
+                self._bg_task = asyncio.create_task(self.refresh_async())
+            return self._ids[project_name]
+
+        if self._age() > PROJECT_MISS_REFRESH_S:
+            await self.refresh_async()
+        return self._lookup(project_name)
+
+
+_PROJECTS = _ProjectDirectory()
+
+async def warm_project_directory() -> bool:
+    """Resolve projects at startup. Returns False (and leaves resolution to the first request) on failure."""
+    try:
+        await _PROJECTS.refresh_async()
+        for name in {default_project_name(), *category_project_names().values()}:
+            _PROJECTS._lookup(name)
+        return True
+    except Exception:
+        return False
+
+# Task and comment writes go through todoist_writer (Sync API batches); only reads use REST
+
+async def _request_async(method: str, path: str, json: dict | None = None):
+    r = await get_async_http_client().request(
+        method, f"{TODOIST_API_BASE}{path}", json=json, headers=_headers(), timeout=timeout_for(TODOIST_HOST)
+    )
     r.raise_for_status()
     return r.json()
+
+async def get_projects_async():
+    return await _request_async("GET", "/projects")
+
+async def get_project_id_for_category_async(category: str) -> str:
+    return await _PROJECTS.resolve_async(project_name_for_category(category))
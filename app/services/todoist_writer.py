@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.clients import get_async_http_client, timeout_for
+from app.services.jobs import save_write_status
+from app.services.todoist import TODOIST_HOST, auth_headers
+from app.utils.metrics import UPSTREAM_RETRIES
+
+# Task + comment creation goes out as Sync API batches instead of two REST POSTs per intake.
+# Each command carries a uuid, so re-sending a batch after a timeout/429 never duplicates work.
+TODOIST_SYNC_URL = os.getenv("TODOIST_SYNC_URL", "https://api.todoist.com/sync/v9/sync")
+
+FLUSH_INTERVAL_S = float(os.getenv("TODOIST_FLUSH_INTERVAL_MS", "200")) / 1000.0
+MAX_COMMANDS = 100  # Sync API limit per request
+MAX_ATTEMPTS = int(os.getenv("TODOIST_WRITE_MAX_ATTEMPTS", "5"))
+STATUS_HISTORY = 10_000  # accepted ids this process answers /intake/status for from memory (all are in the jobs DB)
+
+logger = logging.getLogger(__name__)
+
+
+class TodoistWriteError(RuntimeError):
+    pass
+
+
+@dataclass
+class _Write:
+    accepted_id: str
+    commands: List[Dict[str, Any]]
+    task_temp_id: str
+    note_temp_id: Optional[str]
+    future: asyncio.Future
+
+
+def _command(type_: str, args: Dict[str, Any], temp_id: str) -> Dict[str, Any]:
+    return {"type": type_, "uuid": str(uuid.uuid4()), "temp_id": temp_id, "args": args}
+
+
+class TodoistWriter:
+    """
+    Outbound write queue. submit() returns immediately with an accepted id and a
+    future; a background task coalesces everything queued within FLUSH_INTERVAL_S
+    into one Sync API call (comments linked to their new task via temp_id).
+    """
+
+    def __init__(self) -> None:
+        self._queue: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._status: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._runner is None or self._runner.done():
+            if self._runner is not None and not self._runner.cancelled() and self._runner.exception():
+                logger.error("Todoist writer stopped; restarting", exc_info=self._runner.exception())
+            # Same queue: writes accepted while the old runner was down still go out
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop."""
+        if self._runner is None:
+            return
+        self.start()  # replaces a crashed runner so the queued writes are still sent
+        await self._queue.put(None)
+        try:
+            await self._runner
+        except Exception:
+            logger.exception("Todoist writer failed while flushing at shutdown")
+        # The queue belongs to this event loop; the next start() (e.g. a new app lifespan) makes its own
+        self._runner = None
+        self._queue = None
+
+    def submit(
+        self, content: str, description: str = "", project_id: Optional[str] = None, comment: Optional[str] = None
+    ) -> Tuple[str, asyncio.Future]:
+        self.start()
+        accepted_id = str(uuid.uuid4())
+        task_temp_id = str(uuid.uuid4())
+
+        args: Dict[str, Any] = {"content": content}
+        if description:
+            args["description"] = description
+        if project_id:
+            args["project_id"] = project_id
+        commands = [_command("item_add", args, task_temp_id)]
+
+        note_temp_id = None
+        if comment:
+            note_temp_id = str(uuid.uuid4())
+            commands.append(_command("note_add", {"item_id": task_temp_id, "content": comment}, note_temp_id))
+
+        future = asyncio.get_running_loop().create_future()
+        # Fire-and-forget callers may never await this; don't warn about unretrieved errors
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        self._set_status(accepted_id, {"state": "queued"})
+        self._queue.put_nowait(_Write(accepted_id, commands, task_temp_id, note_temp_id, future))
+        return accepted_id, future
+
+    def status(self, accepted_id: str) -> Optional[Dict[str, Any]]:
+        return self._status.get(accepted_id)
+
+    def _set_status(self, accepted_id: str, status: Dict[str, Any]) -> None:
+        self._status[accepted_id] = status
+        self._status.move_to_end(accepted_id)
+        while len(self._status) > STATUS_HISTORY:
+            self._status.popitem(last=False)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            n_commands = len(first.commands)
+            deadline = loop.time() + FLUSH_INTERVAL_S
+            while n_commands + 2 <= MAX_COMMANDS:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                n_commands += len(item.commands)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[_Write]) -> None:
+        """Send one batch. Every write in it ends resolved or failed, whatever goes wrong."""
+        queued = asyncio.ensure_future(self._persist(batch))  # recorded while the Sync API call runs
+        try:
+            await self._send(batch)
+        except Exception as e:
+            for w in batch:
+                if not w.future.done():
+                    self._fail(w, f"Todoist sync failed: {e}")
+        await queued
+        await self._persist(batch)
+
+    async def _persist(self, batch: List[_Write]) -> None:
+        statuses = {w.accepted_id: self._status.get(w.accepted_id, {"state": "queued"}) for w in batch}
+        try:
+            await asyncio.to_thread(save_write_status, statuses)
+        except Exception:
+            logger.warning("Could not record Todoist write status", exc_info=True)
+
+    async def _send(self, batch: List[_Write]) -> None:
+        resp = await self._post([c for w in batch for c in w.commands])
+        sync_status = resp.get("sync_status", {})
+        mapping = resp.get("temp_id_mapping", {})
+        for w in batch:
+            errors = [sync_status.get(c["uuid"]) for c in w.commands if sync_status.get(c["uuid"]) != "ok"]
+            if errors:
+                self._fail(w, f"Todoist rejected command: {errors[0]}")
+                continue
+            result = {
+                "task_id": mapping.get(w.task_temp_id),
+                "comment_id": mapping.get(w.note_temp_id) if w.note_temp_id else None,
+            }
+            self._set_status(w.accepted_id, {"state": "ok", **result})
+            if not w.future.done():
+                w.future.set_result(result)
+
+    def _fail(self, w: _Write, error: str) -> None:
+        self._set_status(w.accepted_id, {"state": "error", "error": error})
+        if not w.future.done():
+            w.future.set_exception(TodoistWriteError(error))
+
+    async def _post(self, commands: List[Dict[str, Any]]) -> Dict[str, Any]:
+        headers = auth_headers()  # form-encoded body: no JSON content type
+        for attempt in range(MAX_ATTEMPTS):
+            last = attempt == MAX_ATTEMPTS - 1
+            try:
+                r = await get_async_http_client().post(
+                    TODOIST_SYNC_URL,
+                    data={"commands": json.dumps(commands)},
+                    headers=headers,
+                    timeout=timeout_for(TODOIST_HOST),
+                )
+            except httpx.TransportError as e:
+                if last:
+                    raise
+                UPSTREAM_RETRIES.inc("todoist_sync", type(e).__name__)
+                await asyncio.sleep(2 ** attempt)
+                continue
+
+            if (r.status_code == 429 or r.status_code >= 500) and not last:
+                UPSTREAM_RETRIES.inc("todoist_sync", str(r.status_code))
+                retry_after = r.headers.get("Retry-After", "")
+                await asyncio.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+                continue
+            r.raise_for_status()
+            return r.json()
+        raise TodoistWriteError("Todoist sync retries exhausted")
+
+
+todoist_writer = TodoistWriter()
@@ -0,0 +1,33 @@
+import logging
+from functools import lru_cache
+from typing import Optional
+
+import tiktoken
+
+# The cl100k_base tokenizer, shared by chunking (ingest) and prompt packing (/ask).
+CHARS_PER_TOKEN = 4  # estimate when the tokenizer is unavailable
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def token_encoder() -> Optional[tiktoken.Encoding]:
+    """cl100k_base, loaded once per process; None when it can't be loaded (tiktoken downloads it on first use)."""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Chunk sizes and prompt budgets then drift from real token counts; say so once
+        logger.warning("cl100k_base unavailable (%s); estimating %d chars per token", e, CHARS_PER_TOKEN)
+        return None
+
+def count_tokens(text: str) -> int:
+    enc = token_encoder()
+    if enc is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    enc = token_encoder()
+    if enc is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return enc.decode(enc.encode(text, disallowed_special=())[:max_tokens])
@@ -0,0 +1,263 @@
+"""
+Approximate-nearest-neighbour search indexes built from the exact (flat) SOP index.
+
+The flat IndexIDMap2 stays the source of truth for incremental ingest (add/remove/
+reconstruct by id). After each ingest a search index is derived from it:
+
+    vectors < ANN_MIN_VECTORS      flat        exact brute force
+    < 200k                         hnsw        IndexHNSWFlat, tuned via efSearch
+    < 1M                           ivfflat     IndexIVFFlat, tuned via nprobe
+    otherwise                      ivfpq       IndexIVFPQ (compressed), tuned via nprobe
+
+ANN_INDEX forces one kind. The search-time knob (efSearch / nprobe) is raised until
+recall@k against the flat index reaches ANN_TARGET_RECALL, and the measured recall
+is stored with the index so the accuracy traded for speed/memory stays visible.
+In auto mode a kind that cannot reach the target (PQ compression caps recall however
+wide the probe) is dropped for the next more exact one: ivfpq -> ivfflat -> hnsw -> flat.
+ANN_EFSEARCH / ANN_NPROBE override the tuned value at load time.
+
+Compare all kinds on the current store:  python -m app.services.vector_index
+"""
+import math
+import os
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+ANN_INDEX = os.getenv("ANN_INDEX", "auto").strip().lower()  # auto | flat | hnsw | ivfflat | ivfpq
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "20000"))
+ANN_HNSW_M = int(os.getenv("ANN_HNSW_M", "32"))
+ANN_EF_CONSTRUCTION = int(os.getenv("ANN_EF_CONSTRUCTION", "80"))
+ANN_TARGET_RECALL = float(os.getenv("ANN_TARGET_RECALL", "0.95"))
+ANN_RECALL_K = int(os.getenv("ANN_RECALL_K", "10"))
+ANN_RECALL_QUERIES = int(os.getenv("ANN_RECALL_QUERIES", "200"))
+# A filter allowing at most this many vectors is searched exactly over just those vectors
+# (HNSW only: its graph walk rarely reaches a handful of allowed nodes)
+ANN_FILTER_EXACT_MAX = int(os.getenv("ANN_FILTER_EXACT_MAX", "5000"))
+
+_AUTO_TIERS = ((200_000, "hnsw"), (1_000_000, "ivfflat"))
+_KNOB = {"hnsw": "efSearch", "ivfflat": "nprobe", "ivfpq": "nprobe"}
+_MORE_EXACT = {"ivfpq": "ivfflat", "ivfflat": "hnsw", "hnsw": "flat"}  # auto-mode fallback below target recall
+
+
+def choose_kind(n_vectors: int) -> str:
+    if ANN_INDEX != "auto":
+        return ANN_INDEX
+    if n_vectors < ANN_MIN_VECTORS:
+        return "flat"
+    for limit, kind in _AUTO_TIERS:
+        if n_vectors < limit:
+            return kind
+    return "ivfpq"
+
+def _flat_contents(flat: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """All (vectors, ids) of an IndexIDMap2(IndexFlatIP)."""
+    ids = faiss.vector_to_array(flat.id_map).astype("int64")
+    inner = faiss.downcast_index(flat.index)
+    return inner.reconstruct_n(0, flat.ntotal), ids
+
+def _pq_subquantizers(d: int) -> int:
+    # ~16 dims per sub-quantizer; PQ needs m to divide d
+    for m in (d // 16, 64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if m and d % m == 0 and m <= d:
+            return m
+    return 1
+
+def _build(kind: str, xb: np.ndarray, ids: np.ndarray) -> faiss.Index:
+    n, d = xb.shape
+    if kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(d, ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = ANN_EF_CONSTRUCTION
+        index = faiss.IndexIDMap(hnsw)
+        index.add_with_ids(xb, ids)
+        return index
+
+    # IVF: ~4*sqrt(n) lists, at least 39 training points per list
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+    quantizer = faiss.IndexFlatIP(d)
+    if kind == "ivfflat":
+        index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+    elif kind == "ivfpq":
+        nbits = 8 if n >= 256 * 39 else max(1, int(math.log2(max(2, n // 39))))
+        index = faiss.IndexIVFPQ(quantizer, d, nlist, _pq_subquantizers(d), nbits, faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise RuntimeError(f"Unknown ANN_INDEX kind: {kind}")
+    rng = np.random.default_rng(0)
+    train = xb if n <= nlist * 256 else xb[rng.choice(n, nlist * 256, replace=False)]
+    index.train(train)
+    index.add_with_ids(xb, ids)
+    return index
+
+def set_search_param(index: faiss.Index, kind: str, value: int) -> None:
+    if kind == "hnsw":
+        faiss.downcast_index(faiss.downcast_index(index).index).hnsw.efSearch = value
+    elif kind in ("ivfflat", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = value
+
+def filtered_search_params(index: faiss.Index, kind: str, ids: Sequence[int]) -> faiss.SearchParameters:
+    """
+    Search parameters restricting results to `ids` (pre-filtering). The tuned knob is scaled
+    up by how selective the filter is: efSearch / nprobe were tuned for finding k neighbours
+    among all vectors, and only a fraction of what the search visits is now allowed.
+    """
+    sel = faiss.IDSelectorBatch(np.asarray(ids, dtype="int64"))
+    widen = index.ntotal / max(1, len(ids))
+    if kind == "hnsw":
+        ef = faiss.downcast_index(faiss.downcast_index(index).index).hnsw.efSearch
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=int(max(ef, min(index.ntotal, ef * widen))))
+    if kind in ("ivfflat", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=sel, nprobe=int(min(ivf.nlist, math.ceil(ivf.nprobe * widen))))
+    return faiss.SearchParameters(sel=sel)
+
+# HNSW index -> (its external ids sorted, their positions in the flat storage); built on first use
+_positions: "weakref.WeakKeyDictionary[faiss.Index, Tuple[np.ndarray, np.ndarray]]" = weakref.WeakKeyDictionary()
+
+def exact_filtered_search(
+    index: faiss.Index, kind: str, q_emb: np.ndarray, ids: Sequence[int], k: int
+) -> Optional[List[Tuple[int, float]]]:
+    """
+    Exact inner-product top-k among `ids`, for filters too selective for the graph walk.
+    Returns None when the filter is too large or the index kind isn't covered (search it normally).
+    """
+    if kind != "hnsw" or len(ids) > ANN_FILTER_EXACT_MAX:
+        return None
+    cached = _positions.get(index)
+    if cached is None:
+        all_ids = faiss.vector_to_array(faiss.downcast_index(index).id_map)
+        order = np.argsort(all_ids, kind="stable")
+        cached = _positions[index] = (all_ids[order], order)
+    sorted_ids, order = cached
+    wanted = np.asarray(ids, dtype="int64")
+    at = np.minimum(np.searchsorted(sorted_ids, wanted), len(sorted_ids) - 1)
+    found = sorted_ids[at] == wanted
+    if not found.any():
+        return []
+    wanted, positions = wanted[found], order[at[found]].astype("int64")
+    storage = faiss.downcast_index(faiss.downcast_index(index).index)
+    scores = storage.reconstruct_batch(positions) @ q_emb[0]
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [(int(wanted[i]), float(scores[i])) for i in top]
+
+def _sample_queries(xb: np.ndarray, n_queries: int) -> np.ndarray:
+    """Stored vectors plus a little noise: realistic "near a document" queries that are not exact hits."""
+    rng = np.random.default_rng(1)
+    q = xb[rng.choice(len(xb), min(n_queries, len(xb)), replace=False)].copy()
+    q += rng.normal(scale=0.2 / math.sqrt(xb.shape[1]), size=q.shape).astype("float32")
+    faiss.normalize_L2(q)
+    return q
+
+def recall_at_k(index: faiss.Index, flat: faiss.Index, queries: np.ndarray, k: int = ANN_RECALL_K) -> float:
+    """Mean fraction of the exact top-k ids (from `flat`) that `index` also returns."""
+    k = min(k, flat.ntotal)
+    if k == 0 or len(queries) == 0:
+        return 1.0
+    _, exact = flat.search(queries, k)
+    _, approx = index.search(queries, k)
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact.tolist(), approx.tolist()))
+    return hits / (k * len(queries))
+
+def _build_tuned(
+    kind: str, xb: np.ndarray, ids: np.ndarray, flat: faiss.Index, queries: np.ndarray
+) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """Build a `kind` index and raise its search knob until recall@k reaches ANN_TARGET_RECALL or stops improving."""
+    started = time.perf_counter()
+    index = _build(kind, xb, ids)
+    build_s = time.perf_counter() - started
+
+    knob = _KNOB[kind]
+    limit = ANN_EF_CONSTRUCTION * 8 if kind == "hnsw" else faiss.extract_index_ivf(index).nlist
+    value = 16 if kind == "hnsw" else 1
+    set_search_param(index, kind, value)
+    recall = recall_at_k(index, flat, queries)
+    while recall < ANN_TARGET_RECALL and value < limit:
+        # Stop once widening the search no longer helps (PQ error caps recall, not the probe count)
+        wider = min(limit, value * 2)
+        set_search_param(index, kind, wider)
+        wider_recall = recall_at_k(index, flat, queries)
+        if wider_recall - recall < 0.005:
+            set_search_param(index, kind, value)
+            break
+        value, recall = wider, wider_recall
+
+    return index, {
+        "type": kind,
+        knob: value,
+        f"recall_at_{ANN_RECALL_K}": round(recall, 4),
+        "build_s": round(build_s, 3),
+    }
+
+def build_search_index(flat: faiss.Index) -> Tuple[Optional[faiss.Index], Dict[str, Any]]:
+    """
+    Derive the search index for `flat`. Returns (None, info) when flat search is used,
+    else (ann_index, info) with the tuned search parameter and measured recall@k.
+    """
+    kind = choose_kind(flat.ntotal)
+    if kind == "flat" or flat.ntotal == 0:
+        return None, {"type": "flat"}
+
+    xb, ids = _flat_contents(flat)
+    queries = _sample_queries(xb, ANN_RECALL_QUERIES)
+    rejected: Dict[str, float] = {}
+    while True:
+        index, info = _build_tuned(kind, xb, ids, flat, queries)
+        recall = info[f"recall_at_{ANN_RECALL_K}"]
+        if ANN_INDEX != "auto" or recall >= ANN_TARGET_RECALL:
+            break
+        rejected[kind] = recall
+        kind = _MORE_EXACT[kind]
+        if kind == "flat":
+            return None, {"type": "flat", "rejected": rejected}
+    if rejected:
+        info["rejected"] = rejected  # kinds tried first, with the recall they topped out at
+    return index, info
+
+def apply_search_params(index: faiss.Index, ann: Dict[str, Any]) -> None:
+    """Re-apply the tuned knob after loading (efSearch is not serialized; env overrides win)."""
+    kind = ann.get("type", "flat")
+    if kind == "flat":
+        return
+    knob = _KNOB[kind]
+    value = int(os.getenv(f"ANN_{knob.upper()}", ann.get(knob, 0)) or 0)
+    if value:
+        set_search_param(index, kind, value)
+
+
+def _latency_ms(index: faiss.Index, queries: np.ndarray, k: int) -> float:
+    started = time.perf_counter()
+    for i in range(len(queries)):
+        index.search(queries[i:i + 1], k)
+    return (time.perf_counter() - started) * 1000 / max(1, len(queries))
+
+def compare_kinds(flat: faiss.Index, kinds=("hnsw", "ivfflat", "ivfpq")) -> Dict[str, Dict[str, Any]]:
+    """recall@k, per-query latency and serialized size of each index kind on the same vectors."""
+    global ANN_INDEX
+    xb, _ = _flat_contents(flat)
+    queries = _sample_queries(xb, ANN_RECALL_QUERIES)
+    report = {"flat": {
+        f"recall_at_{ANN_RECALL_K}": 1.0,
+        "latency_ms": round(_latency_ms(flat, queries, ANN_RECALL_K), 3),
+        "bytes": len(faiss.serialize_index(flat)),
+    }}
+    forced = ANN_INDEX
+    try:
+        for kind in kinds:
+            ANN_INDEX = kind
+            index, info = build_search_index(flat)
+            info["latency_ms"] = round(_latency_ms(index, queries, ANN_RECALL_K), 3)
+            info["bytes"] = len(faiss.serialize_index(index))
+            report[kind] = info
+    finally:
+        ANN_INDEX = forced
+    return report
+
+
+if __name__ == "__main__":
+    import json
+
+    from app.services.sop_ingest import flat_index_file
+
+    print(json.dumps(compare_kinds(faiss.read_index(str(flat_index_file()))), indent=2))
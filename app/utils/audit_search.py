@@ -0,0 +1,41 @@
+"""
+Query the audit log from the shell, e.g.
+
+    python -m app.utils.audit_search --request-id 3f2c...
+    python -m app.utils.audit_search --event http_exception --since 2025-01-01T00:00:00
+    python -m app.utils.audit_search --reindex
+"""
+import argparse
+import json
+
+from app.utils.logging import parse_audit_ts, rebuild_audit_index, search_audit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search audit.jsonl via its sidecar index")
+    parser.add_argument("--request-id")
+    parser.add_argument("--event")
+    parser.add_argument("--status")
+    parser.add_argument("--since", type=parse_audit_ts, help="ISO-8601 lower bound on ts (no offset = UTC)")
+    parser.add_argument("--until", type=parse_audit_ts, help="ISO-8601 upper bound on ts (no offset = UTC)")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--reindex", action="store_true", help="rebuild the index from all audit files (run with the API stopped)")
+    args = parser.parse_args()
+
+    if args.reindex:
+        print(f"indexed {rebuild_audit_index()} records")
+        return
+
+    for record in search_audit(
+        request_id=args.request_id,
+        event=args.event,
+        status=args.status,
+        since=args.since,
+        until=args.until,
+        limit=args.limit,
+    ):
+        print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
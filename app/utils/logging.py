@@ -1,28 +1,598 @@
+import atexit
+import bisect
+import gzip
 import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.metrics import current_timings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 AUDIT_FILE = Path("audit.jsonl")
+# Sidecar index: (request_id, event, status, ts) -> file + byte offset, maintained by the writer
+AUDIT_INDEX_FILE = Path(os.getenv("AUDIT_INDEX_FILE", "audit.index.sqlite"))
+
+# Background writer tuning
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "256"))
+AUDIT_FLUSH_INTERVAL_S = float(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "200")) / 1000.0
+AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", str(50 * 1024 * 1024)))  # rotate above this size; 0 = never
+AUDIT_ROTATE_S = float(os.getenv("AUDIT_ROTATE_S", "0"))  # rotate after this many seconds; 0 = never
+AUDIT_COMPRESS = os.getenv("AUDIT_COMPRESS", "0") == "1"  # gzip rotated files
+# Rotated files are gzipped as independent members of this many bytes each, so a lookup
+# decompresses one block instead of the file up to the record (.gz files without a block
+# table, written before it existed, still scan from the start)
+AUDIT_GZIP_BLOCK_BYTES = int(os.getenv("AUDIT_GZIP_BLOCK_BYTES", str(256 * 1024)))
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "interval")  # none | batch | interval
+AUDIT_FSYNC_INTERVAL_S = float(os.getenv("AUDIT_FSYNC_INTERVAL_S", "1.0"))
 
 def new_request_id() -> str:
     return str(uuid.uuid4())
 
+
+class _AuditIndex:
+    """
+    sqlite index over the audit files. Rows point at (file, offset, length) so a
+    lookup reads just the matching lines; records themselves stay in the JSONL files.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None  # writer-thread connection
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")  # readers never block the writer
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                ts TEXT NOT NULL,
+                request_id TEXT,
+                event TEXT,
+                status TEXT,
+                file TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS records_request_id ON records (request_id);
+            CREATE INDEX IF NOT EXISTS records_event_ts ON records (event, ts);
+            CREATE INDEX IF NOT EXISTS records_status_ts ON records (status, ts);
+            CREATE INDEX IF NOT EXISTS records_ts ON records (ts);
+            CREATE INDEX IF NOT EXISTS records_file ON records (file);  -- rotation renames, pruning
+            CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, indexed_bytes INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS gzip_blocks (
+                file TEXT NOT NULL,
+                raw_offset INTEGER NOT NULL,
+                gz_offset INTEGER NOT NULL,
+                PRIMARY KEY (file, raw_offset)
+            ) WITHOUT ROWID;
+            """
+        )
+        # (dev, ino) of the file the watermark belongs to; older indexes get the columns added
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(files)")}
+        for col in ("dev", "ino"):
+            if col not in cols:
+                try:
+                    conn.execute(f"ALTER TABLE files ADD COLUMN {col} INTEGER")
+                except sqlite3.OperationalError:
+                    pass  # another process added it first
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = self.connect()
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def add(
+        self, file: str, entries: List[Tuple[str, str, str, str, int, int]], end: int, ident: Tuple[int, int]
+    ) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO records (ts, request_id, event, status, file, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(ts, rid, ev, st, file, off, ln) for ts, rid, ev, st, off, ln in entries],
+            )
+            self.conn.execute(
+                "INSERT INTO files (name, indexed_bytes, dev, ino) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET indexed_bytes = excluded.indexed_bytes,"
+                " dev = excluded.dev, ino = excluded.ino",
+                (file, end, *ident),
+            )
+
+    def watermark(self, file: str) -> Tuple[int, Optional[Tuple[int, int]]]:
+        """(indexed bytes, (dev, ino) of the file they were indexed from, if known)."""
+        row = self.conn.execute("SELECT indexed_bytes, dev, ino FROM files WHERE name = ?", (file,)).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], (row[1], row[2]) if row[2] is not None else None
+
+    def forget(self, file: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM records WHERE file = ?", (file,))
+            self.conn.execute("DELETE FROM files WHERE name = ?", (file,))
+            self.conn.execute("DELETE FROM gzip_blocks WHERE file = ?", (file,))
+
+    def prune(self, directory: Path) -> List[str]:
+        """Forget indexed files that are gone from `directory` (rotated files deleted by retention)."""
+        names = [r[0] for r in self.conn.execute("SELECT name FROM files")]
+        gone = [name for name in names if not (directory / name).exists()]
+        for name in gone:
+            self.forget(name)
+        return gone
+
+    def rename(self, old: str, new: str) -> None:
+        # Own connection: also called from the compression thread
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("UPDATE records SET file = ? WHERE file = ?", (new, old))
+                conn.execute("UPDATE files SET name = ? WHERE name = ?", (new, old))
+        finally:
+            conn.close()
+
+    def compressed(self, old: str, new: str, blocks: List[Tuple[int, int]]) -> None:
+        """`old` was gzipped to `new` as members starting at (decompressed offset, compressed offset)."""
+        conn = self.connect()  # compression thread
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO gzip_blocks (file, raw_offset, gz_offset) VALUES (?, ?, ?)",
+                    [(new, raw, gz) for raw, gz in blocks],
+                )
+                conn.execute("UPDATE records SET file = ? WHERE file = ?", (new, old))
+                conn.execute("UPDATE files SET name = ? WHERE name = ?", (new, old))
+        finally:
+            conn.close()
+
+    def catch_up(self, path: Path) -> None:
+        """
+        Index lines appended to `path` past the watermark (first run, crash between write and commit).
+        Callers hold the audit file lock, so no other writer moves the watermark meanwhile.
+        """
+        if not path.exists():
+            return
+        st = path.stat()
+        start, ident = self.watermark(path.name)
+        if ident is not None and ident != (st.st_dev, st.st_ino):  # a different file under the same name
+            self.forget(path.name)
+            start = 0
+        if st.st_size <= start:
+            return
+        size = st.st_size
+        entries = []
+        with path.open("rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial trailing line
+                entry = _index_entry(line, offset)
+                if entry is not None:
+                    entries.append(entry)
+                offset += len(line)
+                if offset >= size:
+                    break
+        self.add(path.name, entries, offset, (st.st_dev, st.st_ino))
+
+
+def _index_entry(line: bytes, offset: int) -> Optional[Tuple[str, str, str, str, int, int]]:
+    try:
+        r = json.loads(line)
+    except ValueError:
+        return None
+    return (r.get("ts", ""), r.get("request_id"), r.get("event"), r.get("status"), offset, len(line))
+
+
+class _FileLock:
+    """Exclusive lock shared by every process writing one audit file (API workers, job workers)."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "_FileLock":
+        if self._fd is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+
+class _AuditWriter:
+    """
+    audit_log() only enqueues. A dedicated thread drains the queue in batches,
+    appends them with one write, rotates the file and fsyncs per AUDIT_FSYNC.
+    Appending a batch + indexing it, rotation and catch-up all happen under a
+    cross-process file lock, so processes sharing the file never index each
+    other's bytes at the wrong offset or rotate the file twice. A batch that
+    can't be written (disk, lock or index failure) is appended to
+    audit.spill.jsonl rather than dropped; rebuild_audit_index indexes it.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: Path, index: _AuditIndex) -> None:
+        self.path = path
+        self.index = index
+        self._lock = _FileLock(path.with_suffix(".lock"))  # audit.lock: outside the audit*.jsonl* rotation glob
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._fh = None
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def put(self, record: Dict[str, Any]) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        self._queue.put(record)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush every queued record and close the file."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            stopping = first is self._STOP
+            batch: List[Dict[str, Any]] = [] if stopping else [first]
+
+            deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL_S
+            while not stopping and len(batch) < AUDIT_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+
+            if stopping:
+                # drain anything enqueued before the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not self._STOP:
+                        batch.append(item)
+
+            if batch:
+                try:
+                    with self._lock:
+                        self._write(batch)
+                except Exception as e:
+                    # Never let the writer thread die: keep the batch in the spill file, reopen on the next one
+                    self._spill(batch, e)
+                    self._discard_handle()
+
+            if stopping:
+                self._close(fsync=True)
+                self.index.close()
+                return
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Unbuffered O_APPEND: each batch is one write() landing at the current end of file,
+        # even when several processes (API workers, job workers) share the log
+        self._fh = self.path.open("ab", buffering=0)
+        self._opened_at = time.monotonic()
+        try:
+            self.index.catch_up(self.path)
+        except sqlite3.Error as e:
+            sys.stderr.write(f"audit_log: index catch-up failed: {e}\n")
+
+    def _close(self, fsync: bool) -> None:
+        if self._fh is None:
+            return
+        self._fh.flush()
+        if fsync and AUDIT_FSYNC != "none":
+            os.fsync(self._fh.fileno())
+        self._fh.close()
+        self._fh = None
+
+    def _discard_handle(self) -> None:
+        try:
+            if self._fh is not None:
+                self._fh.close()
+        except OSError:
+            pass
+        self._fh = None
+
+    def _spill(self, batch: List[Dict[str, Any]], error: Exception) -> None:
+        """Append a batch the log couldn't take to the spill file; rebuild_audit_index picks it up."""
+        spill = self.path.with_name(f"{self.path.stem}.spill{self.path.suffix}")
+        try:
+            data = b"".join(
+                (json.dumps(r, ensure_ascii=True, default=str) + "\n").encode("ascii") for r in batch
+            )
+            with spill.open("ab", buffering=0) as fh:
+                fh.write(data)
+            sys.stderr.write(f"audit_log: write failed ({error!r}); {len(batch)} records spilled to {spill}\n")
+        except Exception as e:
+            sys.stderr.write(f"audit_log: write failed ({error!r}) and spill failed ({e!r}); dropped {len(batch)} records\n")
+
+    def _replaced(self) -> bool:
+        """Another process rotated the file since we opened it."""
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return True
+        own = os.fstat(self._fh.fileno())
+        return (st.st_dev, st.st_ino) != (own.st_dev, own.st_ino)
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        # Caller holds self._lock
+        if self._fh is not None and self._replaced():
+            self._close(fsync=False)
+        if self._fh is None:
+            self._open()
+        if self._should_rotate():
+            self._rotate()
+
+        lines = [(json.dumps(r, ensure_ascii=False, default=str) + "\n").encode("utf-8") for r in batch]
+        data = b"".join(lines)
+        self._fh.write(data)
+
+        # Offsets from where the append landed (under the lock nobody else appends in between)
+        offset = self._fh.tell() - len(data)
+        entries = []
+        for r, line in zip(batch, lines):
+            entries.append((r["ts"], r["request_id"], r["event"], r["status"], offset, len(line)))
+            offset += len(line)
+
+        # Index only after the bytes are in the file, so every indexed offset is readable
+        own = os.fstat(self._fh.fileno())
+        try:
+            self.index.add(self.path.name, entries, offset, (own.st_dev, own.st_ino))
+        except sqlite3.Error as e:
+            sys.stderr.write(f"audit_log: index update failed ({e}); will catch up on next open\n")
+
+        now = time.monotonic()
+        if AUDIT_FSYNC == "batch" or (AUDIT_FSYNC == "interval" and now - self._last_fsync >= AUDIT_FSYNC_INTERVAL_S):
+            try:
+                os.fsync(self._fh.fileno())
+            except OSError as e:  # the batch is already appended; spilling it too would duplicate it
+                sys.stderr.write(f"audit_log: fsync failed: {e}\n")
+            self._last_fsync = now
+
+    def _should_rotate(self) -> bool:
+        if AUDIT_MAX_BYTES and os.fstat(self._fh.fileno()).st_size >= AUDIT_MAX_BYTES:
+            return True
+        return bool(AUDIT_ROTATE_S) and time.monotonic() - self._opened_at >= AUDIT_ROTATE_S
+
+    def _rotate(self) -> None:
+        # Caller holds self._lock; other writers reopen the new file when they see the inode change
+        self._close(fsync=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        self.index.rename(self.path.name, rotated.name)
+        self._open()
+        try:
+            self.index.prune(self.path.parent)
+        except sqlite3.Error as e:
+            sys.stderr.write(f"audit_log: index prune failed: {e}\n")
+        if AUDIT_COMPRESS:
+            threading.Thread(target=_gzip_file, args=(rotated, self.index), name="audit-compress", daemon=True).start()
+
+
+def _gzip_file(path: Path, index: _AuditIndex) -> None:
+    gz = path.with_name(path.name + ".gz")
+    blocks = []  # (decompressed offset, compressed offset) of each member
+    raw = 0
+    with path.open("rb") as src, gz.open("wb") as dst:
+        while True:
+            data = src.read(AUDIT_GZIP_BLOCK_BYTES)
+            if not data:
+                break
+            blocks.append((raw, dst.tell()))
+            dst.write(gzip.compress(data))  # a multi-member file is still one valid gzip stream
+            raw += len(data)
+    index.compressed(path.name, gz.name, blocks)  # offsets stay valid: they address the decompressed stream
+    path.unlink()
+
+
+_INDEX = _AuditIndex(AUDIT_INDEX_FILE)
+_WRITER = _AuditWriter(AUDIT_FILE, _INDEX)
+atexit.register(_WRITER.stop)
+
+def start_audit_writer() -> None:
+    _WRITER.start()
+
+def shutdown_audit_writer() -> None:
+    _WRITER.stop()
+
 def audit_log(
     request_id: str,
     event: str,
     payload: Optional[Dict[str, Any]] = None,
     status: str = "ok",
     error: Optional[str] = None,
+    duration_ms: Optional[float] = None,
 ) -> None:
+    """`duration_ms` defaults to the time since the current request (or job) began."""
+    if duration_ms is None:
+        timings = current_timings()
+        duration_ms = timings.elapsed_ms() if timings is not None else None
     record = {
-        "ts": datetime.now(timezone.utc).isoformat(),
+        "ts": _ts(datetime.now(timezone.utc)),
         "request_id": request_id,
         "event": event,
         "status": status,
         "payload": payload or {},
         "error": error,
+        "duration_ms": duration_ms,
     }
-    with AUDIT_FILE.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    _WRITER.put(record)
+
+
+def _ts(dt: datetime) -> str:
+    # One fixed-width UTC form (microseconds always present), so `ts` strings sort by time
+    return dt.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+def parse_audit_ts(value: str) -> str:
+    """ISO-8601 date or time -> the stored `ts` form; no offset means UTC. ValueError if malformed."""
+    dt = datetime.fromisoformat(value.strip())
+    return _ts(dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc))
+
+def _open_audit_file(name: str):
+    path = AUDIT_FILE.parent / name
+    return gzip.open(path, "rb") if name.endswith(".gz") else path.open("rb")
+
+def _read_gzip_block(fh, blocks: List[Tuple[int, int]], offset: int, length: int) -> bytes:
+    """`length` bytes at decompressed `offset`, decompressing from the member that holds it."""
+    raw, gz = blocks[bisect.bisect_right(blocks, (offset, float("inf"))) - 1]
+    fh.seek(gz)
+    with gzip.GzipFile(fileobj=fh, mode="rb") as member:
+        member.read(offset - raw)
+        return member.read(length)
+
+def _read_rows(
+    rows: List[Tuple[str, int, int]], blocks: Optional[Dict[str, List[Tuple[int, int]]]] = None
+) -> Iterator[Dict[str, Any]]:
+    handles: Dict[str, Any] = {}
+    blocks = blocks or {}
+    try:
+        for file, offset, length in rows:
+            fh = handles.get(file)
+            if fh is None:
+                try:
+                    # Block-compressed files are read raw and decompressed per member
+                    fh = handles[file] = (AUDIT_FILE.parent / file).open("rb") if file in blocks else _open_audit_file(file)
+                except FileNotFoundError:
+                    continue  # rotated/compressed between the query and the read
+            try:
+                if file in blocks:
+                    line = _read_gzip_block(fh, blocks[file], offset, length)
+                else:
+                    fh.seek(offset)
+                    line = fh.read(length)
+                yield json.loads(line)
+            except (ValueError, EOFError, gzip.BadGzipFile):  # torn line or truncated member
+                continue
+    finally:
+        for fh in handles.values():
+            fh.close()
+
+def search_audit(
+    request_id: Optional[str] = None,
+    event: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    Indexed lookup over all audit files (live + rotated). `since`/`until` are ISO-8601
+    dates or times in any offset (none = UTC), compared against the record's `ts`; a
+    malformed one raises ValueError. Newest first. Records still in the writer queue
+    (up to AUDIT_FLUSH_INTERVAL_MS old) are not visible yet.
+    """
+    clauses, params = [], []
+    for column, value in (("request_id", request_id), ("event", event), ("status", status)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(parse_audit_ts(since))
+    if until is not None:
+        clauses.append("ts <= ?")
+        params.append(parse_audit_ts(until))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = _INDEX.connect()
+    try:
+        rows = conn.execute(
+            f"SELECT file, offset, length FROM records {where} ORDER BY ts DESC, id DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        blocks: Dict[str, List[Tuple[int, int]]] = {}
+        for file in {r[0] for r in rows if r[0].endswith(".gz")}:
+            found = conn.execute(
+                "SELECT raw_offset, gz_offset FROM gzip_blocks WHERE file = ? ORDER BY raw_offset", (file,)
+            ).fetchall()
+            if found:
+                blocks[file] = found
+    finally:
+        conn.close()
+    return list(_read_rows(rows, blocks))
+
+def rebuild_audit_index() -> int:
+    """Drop the index and rebuild it from every audit file on disk. Returns the record count."""
+    pattern = f"{AUDIT_FILE.stem}*{AUDIT_FILE.suffix}*"
+    conn = _INDEX.connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM records")
+            conn.execute("DELETE FROM files")
+        for path in sorted(AUDIT_FILE.parent.glob(pattern)):
+            offset, entries = 0, []
+            with _open_audit_file(path.name) as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    entry = _index_entry(line, offset)
+                    if entry is not None:
+                        entries.append((*entry[:4], path.name, *entry[4:]))
+                    offset += len(line)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO records (ts, request_id, event, status, file, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    entries,
+                )
+                st = path.stat()
+                conn.execute(
+                    "INSERT OR REPLACE INTO files (name, indexed_bytes, dev, ino) VALUES (?, ?, ?, ?)",
+                    (path.name, offset, st.st_dev, st.st_ino),
+                )
+        return conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    finally:
+        conn.close()
@@ -0,0 +1,159 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Process-local metrics in the Prometheus text format (served on GET /metrics), plus the
+# per-request stage breakdown that audit events carry as duration_ms / stages.
+#
+#     with span("embed_query"):
+#         ...
+#
+# observes the block in pillar2_stage_seconds{stage="embed_query"} and adds its time to the
+# current request's stages. Every process (API worker, job worker) has its own numbers;
+# scrape each one.
+
+LATENCY_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_fmt_labels(self.labels, k)} {_num(v)}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS_S
+    ) -> None:
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, List[float]] = {}  # per-bucket counts (non-cumulative), then sum, then count
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in items:
+            running = 0.0
+            for bound, n in zip(self.buckets, series):
+                running += n
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {_num(running)}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, inf)} {_num(series[-1])}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {repr(series[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {_num(series[-1])}")
+        return lines
+
+
+_REGISTRY: List = []
+
+HTTP_SECONDS = Histogram("pillar2_http_request_seconds", "API request latency.", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("pillar2_stage_seconds", "Time spent in one stage of a request or job.", ("stage",))
+UPSTREAM_REQUESTS = Counter("pillar2_upstream_requests_total", "HTTP requests sent upstream, retries included.", ("host",))
+UPSTREAM_SECONDS = Histogram("pillar2_upstream_seconds", "Upstream time to response headers.", ("host", "status"))
+UPSTREAM_RETRIES = Counter("pillar2_upstream_retries_total", "Retries done by our own backoff loops.", ("upstream", "reason"))
+
+
+def render(extra: Sequence[Tuple[str, str, str, Sequence[Tuple[Dict[str, str], float]]]] = ()) -> str:
+    """All registered metrics plus `extra` (name, help, type, [(labels, value)]) read at scrape time."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    for name, help, kind, samples in extra:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_fmt_labels(list(labels), list(labels.values()))} {_num(v)}" for labels, v in samples]
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """Start time + milliseconds per stage for one request (or job), plus named counts (prompt tokens, ...)."""
+
+    __slots__ = ("started", "stages", "counts")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def stage_ms(self) -> Dict[str, float]:
+        return {k: round(v, 2) for k, v in self.stages.items()}
+
+
+# Tasks and copied contexts share the same RequestTimings object, so spans recorded in a
+# child task or in a pool thread (run via contextvars.copy_context().run) land in it too.
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+def begin_request() -> RequestTimings:
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+def add_count(name: str, n: int) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.counts[name] = timings.counts.get(name, 0) + n
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage)
+        timings = _current.get()
+        if timings is not None:
+            timings.stages[stage] = timings.stages.get(stage, 0.0) + seconds * 1000
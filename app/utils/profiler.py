@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Deque, Optional, Tuple
+
+# Opt-in sampling profiler for slow requests (PROFILE_SLOW_MS > 0).
+# A daemon thread samples every thread's Python stack each PROFILE_INTERVAL_MS into a
+# ring buffer. When a request takes longer than PROFILE_SLOW_MS, the samples taken while
+# it ran are written as folded stacks (flamegraph.pl / speedscope input) to
+# PROFILE_DIR/<request_id>.folded. The event loop serves other requests meanwhile, so the
+# profile shows everything the process did during the slow request, not only its own work.
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # 0 = off
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_WINDOW_S = float(os.getenv("PROFILE_WINDOW_S", "120"))  # longest request that can be profiled in full
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+
+
+def _folded(frame, thread_name: str) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class _Sampler:
+    def __init__(self) -> None:
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(
+            maxlen=max(1, int(PROFILE_WINDOW_S * 1000 / max(PROFILE_INTERVAL_MS, 0.1)))
+        )
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        interval = PROFILE_INTERVAL_MS / 1000.0
+        while not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = tuple(
+                _folded(frame, names.get(ident, str(ident)))
+                for ident, frame in sys._current_frames().items()
+                if ident != me
+            )
+            with self._lock:
+                self._samples.append((time.perf_counter(), stacks))
+
+    def between(self, start: float, end: float) -> Counter:
+        with self._lock:
+            samples = [stacks for t, stacks in self._samples if start <= t <= end]
+        return Counter(stack for stacks in samples for stack in stacks)
+
+
+_SAMPLER = _Sampler()
+
+def start_profiler() -> None:
+    if PROFILE_SLOW_MS > 0:
+        _SAMPLER.start()
+
+def stop_profiler() -> None:
+    _SAMPLER.stop()
+
+async def profile_if_slow(request_id: str, started: float, elapsed_ms: float) -> Optional[str]:
+    """Write the folded profile of a request that took longer than PROFILE_SLOW_MS; returns its path."""
+    if PROFILE_SLOW_MS <= 0 or elapsed_ms < PROFILE_SLOW_MS:
+        return None
+    # A slow request's window can hold thousands of samples: fold and write them off the event loop
+    return await asyncio.to_thread(_write_profile, request_id, started, started + elapsed_ms / 1000.0)
+
+def _write_profile(request_id: str, start: float, end: float) -> Optional[str]:
+    stacks = _SAMPLER.between(start, end)
+    if not stacks:
+        return None
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"{request_id}.folded"
+    path.write_text("".join(f"{stack} {n}\n" for stack, n in stacks.most_common()), encoding="utf-8")
+    return str(path)
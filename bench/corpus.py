@@ -0,0 +1,205 @@
+"""
+Synthetic SOP corpora for benchmarks: deterministic policy-like text across a few
+sections, with form codes and amounts so both the dense and the BM25 leg have signal.
+
+    python -m bench.corpus --chunks 10000
+
+builds data/vector_store in the current directory with the configured EMBED_PROVIDER.
+Chunks are generated at chunk size directly (no tokenizer needed), then embedded,
+indexed and saved through the same code paths as /sop/ingest.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(os.getenv("BENCH_DIR", str(REPO_DIR / "bench_work")))
+CHUNKS_PER_DOCUMENT = 20
+WORDS_PER_CHUNK = 220  # ~ CHUNK_MAX_TOKENS of English text
+
+_SECTIONS = {
+    "expenses": (
+        ["laptop", "monitor", "catering", "office chairs", "software licence", "printer toner", "gift hampers",
+         "villa furniture", "generator service", "pool maintenance", "staff uniforms", "security cameras"],
+        ["purchase order", "invoice", "receipt", "cost centre", "approval", "reimbursement", "budget line"],
+    ),
+    "travel": (
+        ["London", "Geneva", "Riyadh", "Dubai", "Paris", "Singapore", "New York", "Zurich", "Milan", "Doha"],
+        ["flight", "hotel", "visa", "airport transfer", "itinerary", "per diem", "booking"],
+    ),
+    "it": (
+        ["mailbox", "VPN", "password manager", "laptop image", "shared drive", "printer", "Wi-Fi", "phone"],
+        ["access request", "reset", "ticket", "onboarding", "offboarding", "MFA", "backup"],
+    ),
+    "vendors": (
+        ["caterer", "cleaning company", "landscaper", "security firm", "car service", "florist", "IT contractor"],
+        ["contract", "due diligence", "bank details", "onboarding form", "renewal", "payment terms", "NDA"],
+    ),
+    "household": (
+        ["chef", "driver", "housekeeper", "nanny", "gardener", "guard", "estate manager"],
+        ["schedule", "handover", "timesheet", "key register", "incident log", "supplies", "inventory"],
+    ),
+}
+_TEMPLATES = [
+    "Any {topic} request for the {item} must reference form {code} before work starts.",
+    "Amounts above {amount} USD for {item} need a second approver and a {topic} on file.",
+    "The Chief of Staff reviews every {topic} involving {item} within two business days.",
+    "Record the {topic} for {item} in the shared tracker, citing {code} and the requester.",
+    "Do not split a {topic} for {item} to stay under the {amount} USD threshold.",
+    "Escalate a missing {topic} for {item} to the principal's office the same day.",
+    "Keep the {topic} and supporting documents for {item} for seven years under {code}.",
+    "For urgent {item} cases a verbal {topic} is allowed, confirmed in writing by {code}.",
+]
+
+
+def _sentence(rng: random.Random, section: str) -> str:
+    items, topics = _SECTIONS[section]
+    return rng.choice(_TEMPLATES).format(
+        item=rng.choice(items),
+        topic=rng.choice(topics),
+        code=f"{section[:3].upper()}-{rng.randint(100, 999)}",
+        amount=rng.choice([500, 1000, 2500, 5000, 10000, 25000]),
+    )
+
+def chunk_text(rng: random.Random, section: str, words: int = WORDS_PER_CHUNK) -> str:
+    out: List[str] = []
+    while sum(len(s.split()) for s in out) < words:
+        out.append(_sentence(rng, section))
+    return " ".join(out)
+
+def synthetic_document(words: int, seed: int = 0) -> str:
+    """One long SOP-like document (for chunker benchmarks)."""
+    rng = random.Random(seed)
+    paragraphs = []
+    while sum(len(p.split()) for p in paragraphs) < words:
+        paragraphs.append(chunk_text(rng, rng.choice(list(_SECTIONS)), 60))
+    return "\n\n".join(paragraphs)
+
+def _chunks(n_chunks: int, seed: int = 0) -> Iterator[Tuple[str, int, int, str]]:
+    """(section, document number, chunk number, text); a prefix of a larger corpus is the smaller one."""
+    rng = random.Random(seed)
+    sections = list(_SECTIONS)
+    for n in range(n_chunks):
+        doc_no, chunk = divmod(n, CHUNKS_PER_DOCUMENT)
+        section = sections[doc_no % len(sections)]
+        yield section, doc_no, chunk, chunk_text(rng, section)
+
+def synthetic_rows(n_chunks: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Metadata rows shaped like ingest_sops output (vid/hash use the configured provider)."""
+    from app.services.sop_ingest import _chunk_hash, _vector_id
+
+    rows, seen = [], set()
+    for section, doc_no, chunk, text in _chunks(n_chunks, seed):
+        document = f"{section}/{section}_sop_{doc_no:05d}.txt"
+        h = _chunk_hash(text)
+        vid = _vector_id(document, h)
+        if vid in seen:
+            continue
+        seen.add(vid)
+        rows.append({
+            "id": f"{section}_{section}_sop_{doc_no:05d}_{chunk}",
+            "vid": vid,
+            "hash": h,
+            "source": f"SFO {section.upper()} SOP {doc_no:05d}",
+            "document": document,
+            "section": section,
+            "chunk": chunk,
+            "text": text,
+        })
+    return rows
+
+def answerable_questions(n_chunks: int, n: int, seed: int = 3) -> List[str]:
+    """Sentences lifted from chunks of a corpus of `n_chunks`: retrieval is confident, so /ask reaches the LLM."""
+    rng = random.Random(seed)
+    texts = [text for _, _, _, text in _chunks(min(n_chunks, 200))]
+    sentences = [s.strip() for t in texts for s in t.split(".") if s.strip()]
+    return [f"{rng.choice(sentences)}?" for _ in range(n)]
+
+def synthetic_queries(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        section = rng.choice(list(_SECTIONS))
+        items, topics = _SECTIONS[section]
+        out.append(rng.choice([
+            f"What is the {rng.choice(topics)} process for {rng.choice(items)}?",
+            f"Who approves {rng.choice(items)} above {rng.choice([1000, 5000, 25000])} USD?",
+            f"Which form do I need for a {rng.choice(topics)}?",
+            f"{section[:3].upper()}-{rng.randint(100, 999)}",
+        ]))
+    return out
+
+def synthetic_messages(n: int, seed: int = 2) -> List[str]:
+    """Intake-style requests across all routing categories (some without any keyword)."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        section = rng.choice(list(_SECTIONS))
+        items, _ = _SECTIONS[section]
+        item = rng.choice(items)
+        out.append(rng.choice([
+            f"Please buy a new {item} for the office, budget around {rng.randint(2, 90) * 100} USD",
+            f"Can you book a flight and hotel to {rng.choice(_SECTIONS['travel'][0])} next week",
+            f"I can't log in to the {rng.choice(_SECTIONS['it'][0])}, please reset my access",
+            f"Remind the {rng.choice(_SECTIONS['household'][0])} about the schedule for Friday",
+            f"The {item} invoice arrived, please pay it by Monday",
+        ]))
+    return out
+
+
+def build_store(n_chunks: int, seed: int = 0) -> Dict[str, Any]:
+    """Embed + index + save a synthetic corpus under ./data/vector_store."""
+    import faiss
+    import numpy as np
+
+    from app.services.sop_ingest import _embed_batches, _save_index_and_meta
+    from app.services.vector_index import build_search_index
+
+    started = time.perf_counter()
+    rows = synthetic_rows(n_chunks, seed)
+    index = None
+    for offset, emb in _embed_batches([r["text"] for r in rows]):
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(emb.shape[1]))
+        index.add_with_ids(emb, np.array([r["vid"] for r in rows[offset:offset + len(emb)]], dtype="int64"))
+    embed_s = time.perf_counter() - started
+    search_index, ann = build_search_index(index)
+    _save_index_and_meta(index, rows, search_index, ann)
+
+    # Routing rules travel with the corpus so a server started here routes like the real one
+    rules = REPO_DIR / "data" / "routing_rules.json"
+    if rules.exists():
+        shutil.copyfile(rules, Path("data") / "routing_rules.json")
+    return {"chunks": len(rows), "embed_s": round(embed_s, 2), "total_s": round(time.perf_counter() - started, 2), "index": ann}
+
+def ensure_corpus(n_chunks: int, env: Optional[Dict[str, str]] = None) -> Path:
+    """
+    Directory holding a built corpus of `n_chunks` for the provider in `env`, building it
+    (in a child process, so its env decides the provider) unless it already exists.
+    """
+    env = {**os.environ, **(env or {})}
+    provider = env.get("EMBED_PROVIDER", "openai")
+    workdir = BENCH_DIR / f"corpus-{provider}-{n_chunks}"
+    info = workdir / "data" / "vector_store" / "sops.info.json"
+    if info.exists():
+        return workdir
+    workdir.mkdir(parents=True, exist_ok=True)
+    env.setdefault("EMBED_BATCH_SIZE", "256")  # fewer round trips; batching doesn't change the vectors
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_DIR), env.get("PYTHONPATH")]))
+    subprocess.run([sys.executable, "-m", "bench.corpus", "--chunks", str(n_chunks)], cwd=workdir, env=env, check=True)
+    return workdir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a synthetic SOP vector store in ./data/vector_store")
+    parser.add_argument("--chunks", type=int, required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args()
+    print(json.dumps(build_store(opts.chunks, opts.seed)))
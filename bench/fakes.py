@@ -0,0 +1,230 @@
+"""
+Local stand-ins for the OpenAI and Todoist APIs, so benchmarks measure this service
+instead of network variance. Latency is configurable per endpoint.
+
+    python -m bench.fakes --embed-latency-ms 80 --chat-latency-ms 400 --todoist-latency-ms 60
+
+prints one JSON line of env vars that point the app at the fakes, then serves until killed.
+Embeddings are LocalHashEmbeddings vectors, so retrieval over a synthetic corpus still
+behaves like retrieval (related texts are close); chat answers quote the first excerpt.
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+FAKE_EMBED_DIM = int(os.getenv("FAKE_EMBED_DIM", "512"))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    latency: Dict[str, float] = {}
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _delay(self, key: str) -> None:
+        ms = self.latency.get(key, 0.0)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _json(self, data: Any, status: int = 200) -> None:
+        raw = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class _OpenAIHandler(_Handler):
+    embedder = None  # set by serve(); importing app modules here would fix their env-driven settings early
+
+    def do_POST(self) -> None:
+        body = json.loads(self._body() or b"{}")
+        if self.path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(body)
+        else:
+            self._json({"error": {"message": f"no fake for {self.path}"}}, 404)
+
+    def _embeddings(self, body: Dict[str, Any]) -> None:
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        vectors = self.embedder.embed([str(t) for t in texts])
+        self._delay("embeddings")
+        b64 = body.get("encoding_format") == "base64"  # the SDK's default; it decodes float32 itself
+        self._json({
+            "object": "list",
+            "model": body.get("model", ""),
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": base64.b64encode(v.astype("<f4").tobytes()).decode() if b64 else v.tolist(),
+                }
+                for i, v in enumerate(vectors)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    @staticmethod
+    def _answer(messages: List[Dict[str, Any]]) -> str:
+        user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        excerpt = user.split("Approved SOP excerpts:\n", 1)[-1].split("\n")
+        quote = excerpt[1] if len(excerpt) > 1 else ""
+        return json.dumps({
+            "answer": f"Per the SOP: {quote[:240]}",
+            "next_steps": ["Follow the SOP steps quoted above."],
+            "risk_flags": [],
+            "used_chunks": [],
+        })
+
+    def _chat(self, body: Dict[str, Any]) -> None:
+        content = self._answer(body.get("messages", []))
+        self._delay("chat")
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model", "")}
+        if not body.get("stream"):
+            self._json({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")  # no length up front: the stream ends with the connection
+        self.end_headers()
+        step = self.latency.get("token", 0.0) / 1000.0
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        for n, piece in enumerate(pieces):
+            last = n == len(pieces) - 1
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": "stop" if last else None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if step and not last:
+                time.sleep(step)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class _TodoistHandler(_Handler):
+    projects: List[str] = ["Inbox"]
+    _ids = iter(range(1, 1 << 62))
+    _ids_lock = threading.Lock()
+
+    def _new_id(self) -> str:
+        with self._ids_lock:
+            return str(next(self._ids))
+
+    def do_GET(self) -> None:
+        self._delay("todoist")
+        if self.path.endswith("/projects"):
+            self._json([{"id": str(i + 1), "name": name} for i, name in enumerate(self.projects)])
+        else:
+            self._json({"error": f"no fake for {self.path}"}, 404)
+
+    def do_POST(self) -> None:
+        raw = self._body()
+        self._delay("todoist")
+        if self.path.endswith("/sync"):
+            commands = json.loads(parse_qs(raw.decode("utf-8"))["commands"][0])
+            self._json({
+                "sync_status": {c["uuid"]: "ok" for c in commands},
+                "temp_id_mapping": {c["temp_id"]: self._new_id() for c in commands if c.get("temp_id")},
+            })
+        elif self.path.endswith("/tasks") or self.path.endswith("/comments"):
+            self._json({**json.loads(raw or b"{}"), "id": self._new_id()})
+        else:
+            self._json({"error": f"no fake for {self.path}"}, 404)
+
+
+def serve(
+    embed_latency_ms: float = 0.0,
+    chat_latency_ms: float = 0.0,
+    token_latency_ms: float = 0.0,
+    todoist_latency_ms: float = 0.0,
+    projects: Optional[List[str]] = None,
+) -> Dict[str, str]:
+    """Start both fakes on free localhost ports (daemon threads). Returns the env vars for the app."""
+    from app.services.embeddings import LocalHashEmbeddings
+
+    _OpenAIHandler.embedder = LocalHashEmbeddings(FAKE_EMBED_DIM)
+    _OpenAIHandler.latency = {"embeddings": embed_latency_ms, "chat": chat_latency_ms, "token": token_latency_ms}
+    _TodoistHandler.latency = {"todoist": todoist_latency_ms}
+    if projects:
+        _TodoistHandler.projects = list(dict.fromkeys(["Inbox", *projects]))
+
+    urls = {}
+    for name, handler in (("openai", _OpenAIHandler), ("todoist", _TodoistHandler)):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"fake-{name}", daemon=True).start()
+        urls[name] = f"http://127.0.0.1:{server.server_address[1]}"
+    return {
+        "OPENAI_BASE_URL": f"{urls['openai']}/v1",
+        "OPENAI_API_KEY": "bench",
+        "TODOIST_API_BASE": f"{urls['todoist']}/rest/v2",
+        "TODOIST_SYNC_URL": f"{urls['todoist']}/sync/v9/sync",
+        "TODOIST_API_TOKEN": "bench",
+    }
+
+
+class FakeServers:
+    """Runs the fakes in a child process, so their CPU use doesn't skew the process under test."""
+
+    def __init__(self, **latency_ms: float) -> None:
+        args = [sys.executable, "-m", "bench.fakes"]
+        for key, value in latency_ms.items():
+            args += [f"--{key.replace('_', '-')}", str(value)]
+        self._proc = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+        line = self._proc.stdout.readline()
+        if not line:
+            raise RuntimeError("bench.fakes exited before reporting its ports")
+        self.env: Dict[str, str] = json.loads(line)
+
+    def stop(self) -> None:
+        self._proc.terminate()
+        self._proc.wait(10)
+
+    def __enter__(self) -> "FakeServers":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0, help="time to first token / full answer")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="gap between streamed chunks")
+    parser.add_argument("--todoist-latency-ms", type=float, default=0.0)
+    opts = parser.parse_args()
+    category_projects = json.loads(os.getenv("TODOIST_CATEGORY_PROJECTS", "") or "{}")
+    env = serve(
+        opts.embed_latency_ms, opts.chat_latency_ms, opts.token_latency_ms, opts.todoist_latency_ms,
+        projects=[os.getenv("TODOIST_PROJECT_NAME", "Inbox"), *category_projects.values()],
+    )
+    print(json.dumps(env), flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
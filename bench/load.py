@@ -0,0 +1,123 @@
+"""
+End-to-end load generator: starts the API (uvicorn, one process) on a synthetic corpus with
+OpenAI/Todoist pointed at bench.fakes, then drives /sop/search, /ask and /intake with a fixed
+number of concurrent clients and reports throughput and p50/p95/p99 latency.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+import httpx
+
+from bench.corpus import REPO_DIR, answerable_questions, ensure_corpus, synthetic_messages, synthetic_queries
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def serve_app(workdir: Path, env: Dict[str, str]) -> Iterator[str]:
+    """Run the API from `workdir` (its data/ is the corpus) until the block exits. Yields the base URL."""
+    port = _free_port()
+    env = {**os.environ, **env, "JOB_WORKERS": "0"}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_DIR), env.get("PYTHONPATH")]))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"API exited during startup (code {proc.returncode})")
+            try:
+                httpx.get(f"{base}/debug/env", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("API did not come up within 60s") from None
+                time.sleep(0.2)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(15)
+
+
+async def _drive(
+    base: str, path: str, bodies: List[Dict[str, Any]], concurrency: int, duration_s: float
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    deadline = time.monotonic() + duration_s
+    counter = iter(range(1 << 62))
+
+    async def client(http: httpx.AsyncClient) -> None:
+        while time.monotonic() < deadline:
+            body = bodies[next(counter) % len(bodies)]
+            t = time.perf_counter()
+            try:
+                r = await http.post(path, json=body)
+                ok = r.status_code < 400
+                key = str(r.status_code)
+            except httpx.HTTPError as e:
+                ok, key = False, type(e).__name__
+            if ok:
+                latencies.append(time.perf_counter() - t)
+            else:
+                errors[key] = errors.get(key, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    xs = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return round(xs[min(len(xs) - 1, int(p / 100 * len(xs)))] * 1000, 2) if xs else None
+
+    return {
+        "requests": len(xs),
+        "errors": errors,
+        "rps": round(len(xs) / wall, 1),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+    }
+
+def _bodies(path: str, size: int, n: int = 500) -> List[Dict[str, Any]]:
+    # Bodies cycle, so later rounds hit the query/answer caches the way repeated questions do
+    if path == "/intake":
+        return [{"channel": "bench", "message": m} for m in synthetic_messages(n)]
+    if path == "/ask":
+        # Half answerable from the corpus (LLM call), half escalated after retrieval
+        questions = answerable_questions(size, n // 2) + synthetic_queries(n - n // 2)
+        return [{"question": q, "top_k": 4} for q in questions]
+    return [{"query": q, "top_k": 4} for q in synthetic_queries(n)]
+
+def run_load(
+    sizes: Sequence[int],
+    env: Dict[str, str],
+    paths: Sequence[str] = ("/sop/search", "/ask", "/intake"),
+    concurrency: int = 16,
+    duration_s: float = 10.0,
+) -> Dict[str, Any]:
+    """{corpus size: {path: result}}; `env` points the app at the fakes (and picks the provider)."""
+    out: Dict[str, Any] = {}
+    for size in sizes:
+        with serve_app(ensure_corpus(size, env), env) as base:
+            out[str(size)] = {
+                path: asyncio.run(_drive(base, path, _bodies(path, size), concurrency, duration_s)) for path in paths
+            }
+    return out
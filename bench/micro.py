@@ -0,0 +1,100 @@
+"""
+In-process micro-benchmarks: chunk_spans, search_sops (per corpus size), classify, audit_log.
+Run through `python -m bench.run --micro`, which sets up the env and working directory first.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+from bench.corpus import ensure_corpus, synthetic_document, synthetic_messages, synthetic_queries
+
+
+def stats(samples_s: Sequence[float], wall_s: float) -> Dict[str, Any]:
+    """Latency percentiles (microseconds) + throughput for a list of per-call timings."""
+    xs = sorted(samples_s)
+    if not xs:
+        return {"n": 0}
+
+    def pct(p: float) -> float:
+        return round(xs[min(len(xs) - 1, int(p / 100 * len(xs)))] * 1e6, 1)
+
+    return {
+        "n": len(xs),
+        "p50_us": pct(50),
+        "p95_us": pct(95),
+        "p99_us": pct(99),
+        "ops_s": round(len(xs) / wall_s, 1) if wall_s > 0 else None,
+    }
+
+def timed(fn: Callable[[Any], Any], inputs: Sequence[Any], warmup: int = 5) -> Dict[str, Any]:
+    for x in inputs[:warmup]:
+        fn(x)
+    samples: List[float] = []
+    started = time.perf_counter()
+    for x in inputs:
+        t = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - t)
+    return stats(samples, time.perf_counter() - started)
+
+
+def bench_chunk_text(n: int = 30, words: int = 5000) -> Dict[str, Any]:
+    from app.services.chunking import chunk_spans
+    from app.services.tokens import token_encoder
+
+    doc = synthetic_document(words)
+    result = timed(chunk_spans, [doc] * n, warmup=2)
+    result["words"] = words
+    result["chunks"] = len(chunk_spans(doc))
+    # tiktoken downloads its encoding on first use; offline, token counts are estimated (not comparable)
+    result["tokenizer"] = "cl100k_base" if token_encoder() is not None else "estimate"
+    return result
+
+def bench_search(sizes: Sequence[int], n: int = 300, top_k: int = 4) -> Dict[str, Any]:
+    """search_sops per corpus size. Every query is distinct, so the query-embedding cache doesn't hide the embed."""
+    from app.services import sop_ingest
+    from app.services.embed_cache import query_cache
+
+    out = {}
+    cwd = os.getcwd()
+    try:
+        for size in sizes:
+            os.chdir(ensure_corpus(size))
+            snap = sop_ingest._STORE.reload()  # store paths are relative to the working directory
+            query_cache.clear()
+            queries = [f"{q} #{i}" for i, q in enumerate(synthetic_queries(n))]
+            result = timed(lambda q: sop_ingest.search_sops(q, top_k), queries)
+            result["index"] = snap.ann.get("type", "flat")
+            out[str(size)] = result
+    finally:
+        os.chdir(cwd)
+    return out
+
+def bench_classify(n: int = 5000) -> Dict[str, Any]:
+    from app.services.router import classify
+
+    return timed(classify, synthetic_messages(n))
+
+def bench_audit_log(n: int = 20000) -> Dict[str, Any]:
+    """Caller-side cost of audit_log (enqueue only), then how long the writer takes to drain it."""
+    from app.utils.logging import audit_log, shutdown_audit_writer, start_audit_writer
+
+    start_audit_writer()
+    payload = {"query": "Who approves laptop purchases above 5000 USD?", "top_k": 4, "filters": None}
+    result = timed(lambda i: audit_log(f"bench-{i}", "sop_search", payload=payload), list(range(n)))
+    started = time.perf_counter()
+    shutdown_audit_writer()
+    result["drain_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result["file_bytes"] = Path("audit.jsonl").stat().st_size if Path("audit.jsonl").exists() else 0
+    return result
+
+
+def run_micro(sizes: Sequence[int], quick: bool = False) -> Dict[str, Any]:
+    scale = 0.2 if quick else 1.0
+    return {
+        "chunk_text": bench_chunk_text(n=max(3, int(30 * scale))),
+        "search_sops": bench_search(sizes, n=max(20, int(300 * scale))),
+        "classify": bench_classify(n=max(200, int(5000 * scale))),
+        "audit_log": bench_audit_log(n=max(1000, int(20000 * scale))),
+    }
@@ -0,0 +1,138 @@
+"""
+Offline benchmark + load-test runner. Nothing leaves the machine: OpenAI and Todoist are
+replaced by bench.fakes for the whole run.
+
+    python -m bench.run                                   # micro + load on 1 .. 100k chunks
+    python -m bench.run --micro --sizes 1,1000 --quick
+    python -m bench.run --load --provider openai --embed-latency-ms 80 --chat-latency-ms 400
+    python -m bench.run --compare                         # exit 1 on regressions vs bench/baselines.json
+    python -m bench.run --save-baseline
+
+--provider local (default) embeds in-process, so the numbers are this service's own cost;
+--provider openai goes through the OpenAI client to the fake (latency included).
+Corpora are built once and cached under bench_work/ (BENCH_DIR). Baselines are
+host-specific: re-save them when the benchmark machine changes.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench.corpus import BENCH_DIR
+from bench.fakes import FakeServers
+
+DEFAULT_SIZES = "1,1000,10000,100000"
+BASELINE_FILE = Path(__file__).resolve().parent / "baselines.json"
+REGRESSION_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))  # allowed relative slowdown
+
+_LOWER_IS_BETTER = ("p50_us", "p95_us", "p99_us", "p50_ms", "p95_ms", "p99_ms")
+_HIGHER_IS_BETTER = ("ops_s", "rps")
+
+
+def flatten(report: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Tracked numbers only, keyed by path, e.g. "micro.search_sops.10000.p95_us"."""
+    out: Dict[str, float] = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, f"{path}."))
+        elif key in _LOWER_IS_BETTER + _HIGHER_IS_BETTER and isinstance(value, (int, float)):
+            out[path] = value
+    return out
+
+def regressions(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    found = []
+    for key, base in sorted(baseline.items()):
+        now = current.get(key)
+        if now is None or not base:
+            continue
+        if key.endswith(_HIGHER_IS_BETTER):
+            worse = now < base * (1 - tolerance)
+        else:
+            worse = now > base * (1 + tolerance)
+        if worse:
+            found.append(f"{key}: {base} -> {now} ({(now - base) / base:+.0%})")
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake OpenAI/Todoist")
+    parser.add_argument("--micro", action="store_true", help="only micro-benchmarks")
+    parser.add_argument("--load", action="store_true", help="only the end-to-end load test")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="corpus sizes in chunks, comma-separated")
+    parser.add_argument("--provider", choices=("local", "openai"), default="local")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, shorter load runs")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration-s", type=float, default=10.0, help="per endpoint and corpus size")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--todoist-latency-ms", type=float, default=0.0)
+    parser.add_argument("--out", help="also write the report here")
+    parser.add_argument("--compare", action="store_true", help=f"compare against {BASELINE_FILE.name}")
+    parser.add_argument("--save-baseline", action="store_true")
+    opts = parser.parse_args()
+    sizes = [int(s) for s in opts.sizes.split(",") if s.strip()]
+    do_micro = opts.micro or not opts.load
+    do_load = opts.load or not opts.micro
+
+    fakes = FakeServers(
+        embed_latency_ms=opts.embed_latency_ms,
+        chat_latency_ms=opts.chat_latency_ms,
+        todoist_latency_ms=opts.todoist_latency_ms,
+    )
+    # Set before any app module is imported: their settings are read at import time
+    env = {**fakes.env, "EMBED_PROVIDER": opts.provider, "JOB_WORKERS": "0"}
+    os.environ.update(env)
+    workdir = BENCH_DIR / "run"
+    shutil.rmtree(workdir, ignore_errors=True)
+    workdir.mkdir(parents=True)
+    os.chdir(workdir)  # audit log, caches and job db of the in-process benchmarks land here
+
+    report: Dict[str, Any] = {
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {k: v for k, v in vars(opts).items() if k not in ("out", "compare", "save_baseline")},
+    }
+    try:
+        if do_micro:
+            from bench.micro import run_micro
+
+            report["micro"] = run_micro(sizes, quick=opts.quick)
+        if do_load:
+            from bench.load import run_load
+
+            duration = min(opts.duration_s, 3.0) if opts.quick else opts.duration_s
+            report["load"] = run_load(sizes, env, concurrency=opts.concurrency, duration_s=duration)
+    finally:
+        fakes.stop()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if opts.out:
+        Path(opts.out).write_text(text + "\n", encoding="utf-8")
+
+    current = flatten({k: report[k] for k in ("micro", "load") if k in report})
+    if opts.save_baseline:
+        saved = json.loads(BASELINE_FILE.read_text(encoding="utf-8")) if BASELINE_FILE.exists() else {}
+        saved.update({"host": report["host"], "config": report["config"]})
+        saved.setdefault("metrics", {}).update(current)
+        BASELINE_FILE.write_text(json.dumps(saved, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"baseline saved: {len(current)} metrics -> {BASELINE_FILE}", file=sys.stderr)
+    if opts.compare:
+        if not BASELINE_FILE.exists():
+            print(f"no baseline at {BASELINE_FILE}; run with --save-baseline first", file=sys.stderr)
+            return 1
+        baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8"))["metrics"]
+        found = regressions(current, baseline, REGRESSION_TOLERANCE)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        print(f"{len(found)} regressions (tolerance {REGRESSION_TOLERANCE:.0%})", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
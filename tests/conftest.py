@@ -0,0 +1,31 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# app/ is a namespace package run from the repo root; make plain `pytest` see it too
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Pins time.time(); advance it with clock[0] += seconds."""
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Empty sops/ in a fresh working directory, with an offline embedder and no loaded store."""
+    from app.services import sop_ingest
+    from app.services.embeddings import LocalHashEmbeddings
+
+    # Store paths are relative to the working directory; a fresh holder has no snapshot yet
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sop_ingest, "_STORE", sop_ingest._IndexHolder())
+    embedder = LocalHashEmbeddings(dim=64)
+    monkeypatch.setattr(sop_ingest, "get_embedder", lambda: embedder)
+    (tmp_path / "sops").mkdir()
+    return tmp_path
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from app.services import sop_ingest
+from app.services.answer_cache import AnswerCache
+
+CHUNKS = frozenset({"expenses_sop.txt:0", "expenses_sop.txt:1"})
+
+
+def _unit(cos):
+    # A question vector at cosine `cos` from [1, 0]
+    return np.array([cos, np.sqrt(1 - cos * cos)], dtype="float32")
+
+
+@pytest.mark.parametrize("cos, hit", [(1.0, True), (0.951, True), (0.949, False)])
+def test_a_hit_needs_the_similarity_threshold(cos, hit):
+    cache = AnswerCache(max_size=8, similarity=0.95, ttl_s=60)
+    cache.put(1, CHUNKS, _unit(1.0), "Chief of Staff.")
+    assert cache.get(1, CHUNKS, _unit(cos)) == ("Chief of Staff." if hit else None)
+
+
+def test_a_hit_needs_the_same_chunk_set():
+    cache = AnswerCache(max_size=8, similarity=0.95, ttl_s=60)
+    cache.put(1, CHUNKS, _unit(1.0), "Chief of Staff.")
+    assert cache.get(1, CHUNKS - {"expenses_sop.txt:1"}, _unit(1.0)) is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = AnswerCache(max_size=8, similarity=0.95, ttl_s=60)
+    cache.put(1, CHUNKS, _unit(1.0), "Chief of Staff.")
+    clock[0] += 61
+    assert cache.get(1, CHUNKS, _unit(1.0)) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_the_least_recently_used_chunk_set_is_evicted():
+    cache = AnswerCache(max_size=2, similarity=0.95, ttl_s=60)
+    sets = [frozenset({f"doc:{i}"}) for i in range(3)]
+    cache.put(1, sets[0], _unit(1.0), "zero")
+    cache.put(1, sets[1], _unit(1.0), "one")
+    assert cache.get(1, sets[0], _unit(1.0)) == "zero"  # sets[1] is now the oldest
+    cache.put(1, sets[2], _unit(1.0), "two")
+    assert cache.get(1, sets[1], _unit(1.0)) is None
+    assert cache.stats()["size"] == 2
+
+
+def test_a_reingest_invalidates_cached_answers(workdir):
+    sop = workdir / "sops" / "expenses_sop.txt"
+    sop.write_text("Purchases above 5,000 AED need Chief of Staff approval.\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    cache = AnswerCache(max_size=8, similarity=0.95, ttl_s=60)
+    before = sop_ingest.get_index_snapshot().generation
+    cache.put(before, CHUNKS, _unit(1.0), "Chief of Staff.")
+    assert cache.get(before, CHUNKS, _unit(1.0)) == "Chief of Staff."
+
+    sop.write_text("Purchases above 5,000 AED need CEO approval.\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    after = sop_ingest.get_index_snapshot().generation
+    assert after != before
+    assert cache.get(after, CHUNKS, _unit(1.0)) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_a_request_from_an_older_generation_neither_reads_nor_refills_the_cache():
+    cache = AnswerCache(max_size=8, similarity=0.95, ttl_s=60)
+    cache.put(1, CHUNKS, _unit(1.0), "Chief of Staff.")
+    cache.put(2, CHUNKS, _unit(1.0), "CEO.")
+    cache.put(1, CHUNKS, _unit(1.0), "Chief of Staff.")  # slow request that retrieved before the ingest
+    assert cache.get(1, CHUNKS, _unit(1.0)) is None
+    assert cache.get(2, CHUNKS, _unit(1.0)) == "CEO."
+    assert cache.stats()["generation"] == 2 and cache.stats()["invalidations"] == 1
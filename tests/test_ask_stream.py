@@ -0,0 +1,107 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.routers import ask
+from app.services import coalesce, rag, sop_ingest
+from app.services.answer_cache import AnswerCache
+
+ANSWER = '{"answer": "The Chief of Staff.", "next_steps": [], "risk_flags": [], "used_chunks": []}'
+
+
+class _FakeStreamingChat:
+    """AsyncOpenAI stand-in: every streamed completion sends ANSWER in three deltas."""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, stream=False, **kwargs):
+        assert stream
+        self.calls += 1
+        return self._events()
+
+    async def _events(self):
+        for delta in (ANSWER[:10], ANSWER[10:30], ANSWER[30:]):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    (workdir / "sops" / "expenses_sop.txt").write_text(
+        "All purchases above 5,000 AED need Chief of Staff approval.\n", encoding="utf-8"
+    )
+    sop_ingest.ingest_sops(workdir / "sops")
+    monkeypatch.setattr(coalesce, "get_embedder", sop_ingest.get_embedder)  # the offline embedder from workdir
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache(max_size=8, similarity=0.95, ttl_s=60))
+    monkeypatch.setattr(ask, "audit_log", lambda *args, **kwargs: None)
+
+    app = FastAPI()
+    app.include_router(ask.router)
+
+    @app.middleware("http")
+    async def request_id(request: Request, call_next):
+        request.state.request_id = "req-1"
+        return await call_next(request)
+
+    return TestClient(app)
+
+
+def _events(client, question):
+    response = client.post("/ask/stream", json={"question": question})
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_retrieval_comes_first_then_tokens_answer_and_done(client, monkeypatch):
+    chat = _FakeStreamingChat()
+    monkeypatch.setattr(rag, "_aoai", lambda: chat)
+
+    events = _events(client, "Who approves purchases above 5,000 AED?")
+    assert [name for name, _ in events] == ["retrieval", "token", "token", "token", "answer", "done"]
+    retrieval, answer = events[0][1], events[-2][1]
+    assert not retrieval["needs_escalation"] and retrieval["citations"][0]["document"] == "expenses_sop.txt"
+    assert "".join(data["delta"] for name, data in events if name == "token") == ANSWER
+    assert answer["answer"] == "The Chief of Staff." and answer["confidence"] == retrieval["confidence"]
+
+
+def test_a_cached_answer_streams_as_a_single_token(client, monkeypatch):
+    chat = _FakeStreamingChat()
+    monkeypatch.setattr(rag, "_aoai", lambda: chat)
+    _events(client, "Who approves purchases above 5,000 AED?")
+
+    events = _events(client, "Who approves purchases above 5,000 AED?")
+    assert [name for name, _ in events] == ["retrieval", "token", "answer", "done"]
+    assert events[1][1] == {"delta": ANSWER}
+    assert chat.calls == 1
+
+
+def test_an_escalation_sends_no_tokens(client, monkeypatch):
+    monkeypatch.setattr(rag, "_aoai", lambda: pytest.fail("escalations must not call the model"))
+
+    events = _events(client, "Which purchases need a unicorn permit from the zoo?")
+    assert [name for name, _ in events] == ["retrieval", "answer", "done"]
+    assert events[0][1]["needs_escalation"] and events[1][1]["needs_escalation"]
+
+
+def test_ask_answers_on_the_async_path(client, monkeypatch):
+    class Chat:
+        def __init__(self):
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+        async def _create(self, **kwargs):
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=ANSWER))])
+
+    monkeypatch.setattr(rag, "_aoai", Chat)
+    monkeypatch.setattr(rag, "_oai", lambda: pytest.fail("/ask must not use the blocking client"))
+
+    result = client.post("/ask", json={"question": "Who approves purchases above 5,000 AED?"}).json()
+    assert result["result"] == ANSWER and not result["needs_escalation"]
+    assert result["citations"][0]["document"] == "expenses_sop.txt"
@@ -0,0 +1,132 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import audit as audit_router
+from app.utils import logging as audit
+
+
+def _record(n):
+    return {"ts": f"2026-01-01T00:00:{n:02d}+00:00", "request_id": f"r{n}", "event": "test", "status": "ok", "payload": {}}
+
+
+def _lines(path):
+    return [json.loads(line)["request_id"] for line in path.read_bytes().splitlines()] if path.exists() else []
+
+
+@pytest.fixture
+def searchable(writer, monkeypatch):
+    """The writer's file and index are the ones search_audit reads."""
+    monkeypatch.setattr(audit, "AUDIT_FILE", writer.path)
+    monkeypatch.setattr(audit, "_INDEX", writer.index)
+    return writer
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_FLUSH_INTERVAL_S", 0.01)
+    monkeypatch.setattr(audit, "AUDIT_FSYNC", "none")
+    w = audit._AuditWriter(tmp_path / "audit.jsonl", audit._AuditIndex(tmp_path / "audit.index.sqlite"))
+    yield w
+    w.stop()
+
+
+def test_index_failure_during_rotation_spills_the_batch_and_keeps_the_thread(writer, tmp_path, monkeypatch):
+    writer.put(_record(1))
+    writer.stop()
+    monkeypatch.setattr(audit, "AUDIT_MAX_BYTES", 1)  # the next batch rotates
+
+    def locked(old, new):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(writer.index, "rename", locked)
+    writer.put(_record(2))
+    spill = tmp_path / "audit.spill.jsonl"
+    deadline = time.monotonic() + 5
+    while not spill.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _lines(spill) == ["r2"]
+    assert writer._thread.is_alive()
+
+    monkeypatch.setattr(audit, "AUDIT_MAX_BYTES", 0)
+    monkeypatch.delattr(writer.index, "rename")  # the real one again
+    writer.put(_record(3))
+    writer.stop()
+    assert _lines(tmp_path / "audit.jsonl") == ["r3"]
+
+
+def test_put_restarts_a_dead_writer_thread(writer, tmp_path):
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    writer._thread = dead
+    writer.put(_record(4))
+    writer.stop()
+    assert _lines(tmp_path / "audit.jsonl") == ["r4"]
+
+
+def test_lookups_into_a_compressed_segment_read_one_block(searchable, tmp_path, monkeypatch):
+    writer = searchable
+    monkeypatch.setattr(audit, "AUDIT_GZIP_BLOCK_BYTES", 4096)
+    for n in range(600):
+        writer.put({**_record(n % 60), "request_id": f"r{n}", "payload": {"n": n}})
+    writer.stop()
+
+    audit._gzip_file(writer.path, writer.index)
+    gz = tmp_path / "audit.jsonl.gz"
+    blocks = sqlite3.connect(tmp_path / "audit.index.sqlite").execute(
+        "SELECT raw_offset, gz_offset FROM gzip_blocks WHERE file = ? ORDER BY raw_offset", (gz.name,)
+    ).fetchall()
+    assert len(blocks) > 10 and not writer.path.exists()
+
+    def whole_file(*args, **kwargs):
+        raise AssertionError("lookup decompressed the segment from its start")
+
+    monkeypatch.setattr(audit, "_open_audit_file", whole_file)
+    for n in (0, 299, 599):
+        assert [r["payload"]["n"] for r in audit.search_audit(request_id=f"r{n}")] == [n]
+
+
+@pytest.mark.parametrize("since, until", [
+    ("2026-01-01T00:00:10+00:00", "2026-01-01T00:00:12+00:00"),
+    ("2026-01-01T04:00:10+04:00", "2026-01-01T00:00:12Z"),  # any offset
+    ("2026-01-01T00:00:10", "2026-01-01T00:00:12.000"),  # none means UTC
+])
+def test_time_bounds_are_compared_in_utc(searchable, since, until):
+    for n in range(20):
+        searchable.put({**_record(n), "ts": f"2026-01-01T00:00:{n:02d}.000000+00:00"})
+    searchable.stop()
+    found = audit.search_audit(since=since, until=until)
+    assert [r["request_id"] for r in found] == ["r12", "r11", "r10"]
+
+
+def test_a_malformed_time_bound_is_a_400(searchable):
+    app = FastAPI()
+    app.include_router(audit_router.router)
+    response = TestClient(app).get("/audit/search", params={"since": "yesterday"})
+    assert response.status_code == 400 and "ISO-8601" in response.json()["detail"]
+    with pytest.raises(ValueError):
+        audit.search_audit(until="2026-13-01")
+
+
+def test_rotation_forgets_rotated_files_that_were_deleted(searchable, tmp_path, monkeypatch):
+    searchable.put(_record(1))
+    searchable.stop()
+    monkeypatch.setattr(audit, "AUDIT_MAX_BYTES", 1)  # every batch rotates
+    searchable.put(_record(2))
+    searchable.stop()
+    (first,) = [p for p in tmp_path.glob("audit.*.jsonl") if p.name != "audit.spill.jsonl"]
+    assert [r["request_id"] for r in audit.search_audit(request_id="r1")] == ["r1"]
+
+    first.unlink()  # retention
+    searchable.put(_record(3))
+    searchable.stop()
+    index = sqlite3.connect(tmp_path / "audit.index.sqlite")
+    assert index.execute("SELECT COUNT(*) FROM records WHERE file = ?", (first.name,)).fetchone()[0] == 0
+    assert index.execute("SELECT COUNT(*) FROM files WHERE name = ?", (first.name,)).fetchone()[0] == 0
+    assert [r["request_id"] for r in audit.search_audit(request_id="r2")] == ["r2"]
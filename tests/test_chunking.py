@@ -0,0 +1,85 @@
+import logging
+
+import pytest
+
+from app.services import chunking, tokens
+from app.services.chunking import chunk_spans
+
+MAX, MIN = 120, 40
+
+
+def _estimate(text):
+    return -(-len(text) // tokens.CHARS_PER_TOKEN)
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # Sizes in these tests don't depend on whether cl100k_base can be downloaded here
+    monkeypatch.setattr(chunking, "count_tokens", _estimate)
+
+
+def _para(n, word):
+    return " ".join(f"{word}{i}" for i in range(n)) + "."
+
+
+def _chunks(text):
+    return [text[s:e] for s, e in chunk_spans(text, MAX, MIN)]
+
+
+@pytest.mark.parametrize("text", ["", "   ", "\n\n\t \n"])
+def test_empty_or_whitespace_input_has_no_chunks(text):
+    assert chunk_spans(text) == []
+
+
+def test_a_single_overlong_token_run_is_cut_to_size():
+    text = "x" * 5000
+    spans = chunk_spans(text, MAX, MIN)
+    assert all(_estimate(text[s:e]) <= MAX for s, e in spans)
+    assert "".join(text[s:e] for s, e in spans) == text
+
+
+def test_a_heading_is_never_left_at_the_end_of_a_chunk():
+    text = _para(25, "intro") + "\n\n## Approvals\n" + _para(60, "alpha") + "\n\n## Payments\n" + _para(20, "beta") + "\n"
+    chunks = _chunks(text)
+    for chunk in chunks:
+        assert not chunk.rstrip().endswith(("Approvals", "Payments"))
+    assert any(c.startswith("## Approvals\nalpha0 ") for c in chunks)
+
+
+def test_a_heading_too_big_to_join_its_section_still_starts_it():
+    # Heading + the whole section don't fit: the section's first part goes with the heading
+    text = "1. Approvals\n" + _para(60, "alpha") + "\n"
+    chunks = _chunks(text)
+    assert chunks[0].startswith("1. Approvals\nalpha0 ") and len(chunks) == 2
+
+
+def test_offsets_round_trip_to_the_source_text():
+    text = (
+        "# Expenses SOP\n\nScope: all purchases.\n\n1. Approvals\nPurchases above 5,000 AED need\n"
+        "Chief of Staff approval.\n\nConditions:\n- a quote\n- a budget line\n\n" + _para(200, "rule") + "\n"
+    )
+    spans = chunk_spans(text, MAX, MIN)
+    assert spans == sorted(spans)
+    assert all(s < e and text[s:e] == text[s:e].strip() for s, e in spans)
+    assert all(a[1] <= b[0] for a, b in zip(spans, spans[1:]))  # no overlap
+    assert " ".join(text[s:e] for s, e in spans).split() == text.split()  # nothing lost but whitespace
+
+
+def test_chunks_stay_within_max_tokens():
+    text = "\n\n".join(f"## Section {i}\n" + _para(15 * i, f"w{i}_") for i in range(1, 12)) + "\n"
+    sizes = [_estimate(c) for c in _chunks(text)]
+    assert max(sizes) <= MAX and sum(sizes) >= _estimate(text.strip()) * 0.9
+
+
+def test_tokenizer_fallback_is_logged_once(monkeypatch, caplog):
+    def offline(name):
+        raise OSError("no network")
+
+    monkeypatch.setattr(tokens.tiktoken, "get_encoding", offline)
+    tokens.token_encoder.cache_clear()
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.services.tokens"):
+            assert tokens.count_tokens("abcdefgh") == 2 and tokens.count_tokens("abcd") == 1
+        assert [r.levelno for r in caplog.records] == [logging.WARNING]
+    finally:
+        tokens.token_encoder.cache_clear()
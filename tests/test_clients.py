@@ -0,0 +1,26 @@
+import threading
+import time
+
+import httpx
+
+from app.services import clients
+
+
+def test_concurrent_first_calls_share_one_async_client(monkeypatch):
+    made = []
+
+    class SlowClient(httpx.AsyncClient):
+        def __init__(self, **kwargs):
+            time.sleep(0.05)  # widen the window between the None check and the assignment
+            made.append(self)
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(clients.httpx, "AsyncClient", SlowClient)
+    monkeypatch.setattr(clients, "_async_http", None)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(clients.get_async_http_client())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(made) == 1 and all(c is made[0] for c in got)
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import faiss
+import pytest
+
+from app.services import coalesce
+from app.services.embeddings import LocalHashEmbeddings
+
+DOCS = ["Vendor invoices over 5,000 AED need approval", "Book flights through the travel desk", "Laptops are IT assets"]
+
+
+class _SlowEmbeddings(LocalHashEmbeddings):
+    """Local embeddings behind a network-like delay, so callers can go away mid-batch."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(dim=64)
+        self.name = name
+
+    async def embed_async(self, texts):
+        await asyncio.sleep(0.05)
+        return self.embed(texts)
+
+
+@pytest.mark.parametrize("allowed", [None, [0, 1, 2]], ids=["unfiltered", "filtered"])
+def test_cancelled_caller_does_not_fail_the_batch(monkeypatch, allowed):
+    embedder = _SlowEmbeddings(f"slow-test-{allowed is None}")
+    monkeypatch.setattr(coalesce, "get_embedder", lambda: embedder)
+    index = faiss.IndexFlatIP(embedder.dim)
+    index.add(embedder.embed(DOCS))
+    queries = ["invoice approval limit", "where do I book flights", "who owns laptops"]
+
+    async def main():
+        qc = coalesce.QueryCoalescer()
+        calls = [asyncio.ensure_future(qc.search(index, "flat", 1, q, 2, allowed=allowed)) for q in queries]
+        await asyncio.sleep(0.01)  # window closed, batch is embedding
+        calls[0].cancel()
+        return await asyncio.wait_for(asyncio.gather(*calls[1:]), timeout=2)
+
+    results = asyncio.run(main())
+    assert [hits[0][0] for _, hits in results] == [1, 2]
+
+
+class _RecordingIndex:
+    """Flat index that records which thread each search ran on."""
+
+    def __init__(self, index):
+        self._index = index
+        self.ntotal = index.ntotal
+        self.threads = []
+
+    def search(self, *args, **kwargs):
+        self.threads.append(threading.get_ident())
+        return self._index.search(*args, **kwargs)
+
+
+@pytest.mark.parametrize("allowed", [None, [0, 1, 2]], ids=["unfiltered", "filtered"])
+def test_searches_run_off_the_event_loop(monkeypatch, allowed):
+    embedder = _SlowEmbeddings(f"slow-test-thread-{allowed is None}")
+    monkeypatch.setattr(coalesce, "get_embedder", lambda: embedder)
+    flat = faiss.IndexFlatIP(embedder.dim)
+    flat.add(embedder.embed(DOCS))
+    index = _RecordingIndex(flat)
+
+    async def main():
+        qc = coalesce.QueryCoalescer()
+        batched = await asyncio.gather(*(qc.search(index, "flat", 1, q, 2, allowed=allowed) for q in DOCS))
+        # Embedding known and no batch open: the immediate search path
+        known = await qc.search(index, "flat", 1, DOCS[0], 2, q_emb=embedder.embed(DOCS[:1]), allowed=allowed)
+        return [*batched, known], threading.get_ident()
+
+    results, loop_thread = asyncio.run(main())
+    assert [hits[0][0] for _, hits in results] == [0, 1, 2, 0]
+    assert index.threads and loop_thread not in index.threads
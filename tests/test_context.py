@@ -0,0 +1,30 @@
+from app.services.context import _merge_adjacent
+
+
+def _match(document, chunk, score, text, span=(None, None)):
+    # Both files are labelled "SFO EXPENSES SOP" (the label comes from the file name)
+    return {"id": f"{document}:{chunk}", "source": "SFO EXPENSES SOP", "document": document,
+            "chunk": chunk, "score": score, "text": text, "char_start": span[0], "char_end": span[1]}
+
+
+def test_adjacent_chunks_merge_within_a_document_only():
+    matches = [
+        _match("dubai/expenses_sop.txt", 3, 0.9, "Dubai rule three."),
+        _match("london/expenses_sop.txt", 4, 0.8, "London rule four."),
+        _match("dubai/expenses_sop.txt", 4, 0.7, "Dubai rule four."),
+    ]
+    excerpts = _merge_adjacent(matches)
+    assert [(e.chunks, e.text) for e in excerpts] == [
+        ([3, 4], "Dubai rule three.\nDubai rule four."),
+        ([4], "London rule four."),
+    ]
+    assert excerpts[0].header().startswith("[SFO EXPENSES SOP | chunks 3-4")
+
+
+def test_adjacent_chunks_join_by_char_offsets():
+    doc = "Needs Chief of Staff approval.\n\nApproval. Then pay the vendor" + "x" * 10
+    spans = [(0, 30), (32, 62), (62, 72)]
+    matches = [_match("expenses_sop.txt", i, 0.9, doc[s:e], (s, e)) for i, (s, e) in enumerate(spans)]
+    (excerpt,) = _merge_adjacent(matches)
+    # Repeated words across the boundary are kept; a cut inside a run is joined without a break
+    assert excerpt.text == "Needs Chief of Staff approval.\nApproval. Then pay the vendor" + "x" * 10
@@ -0,0 +1,79 @@
+import asyncio
+import sqlite3
+
+import numpy as np
+import pytest
+
+from app.services.embed_cache import QueryEmbeddingCache
+
+
+def _vec(*xs):
+    return np.array(xs, dtype="float32")
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = QueryEmbeddingCache(max_size=4, ttl_s=60, db_path="")
+    cache.put("m", "Who approves  travel?", _vec(0.6, 0.8))
+    clock[0] += 60
+    assert cache.get("m", "who approves travel?").tolist() == pytest.approx([0.6, 0.8])
+    clock[0] += 1
+    assert cache.get("m", "who approves travel?") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_the_least_recently_used_entry_is_evicted(clock):
+    cache = QueryEmbeddingCache(max_size=2, ttl_s=60, db_path="")
+    cache.put("m", "a", _vec(1, 0))
+    cache.put("m", "b", _vec(0, 1))
+    assert cache.get("m", "a") is not None  # "b" is now the oldest
+    cache.put("m", "c", _vec(1, 1))
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") is not None and cache.get("m", "c") is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_the_sqlite_tier_survives_a_restart(clock, tmp_path):
+    db = str(tmp_path / "cache" / "embeddings.sqlite")
+    first = QueryEmbeddingCache(max_size=2, ttl_s=60, db_path=db)
+    first.put("m", "Who approves travel?", _vec(0.6, 0.8))
+    first.flush()  # written behind
+
+    cache = QueryEmbeddingCache(max_size=2, ttl_s=60, db_path=db)
+    assert cache.get("m", "who approves travel?").tolist() == pytest.approx([0.6, 0.8])
+    assert cache.get("other-model", "who approves travel?") is None
+    assert (cache.stats()["disk_hits"], cache.stats()["size"]) == (1, 1)
+
+    clock[0] += 61
+    assert QueryEmbeddingCache(max_size=2, ttl_s=60, db_path=db).get("m", "who approves travel?") is None
+
+
+def test_async_lookups_read_the_sqlite_tier_in_one_thread_hop(clock, tmp_path, monkeypatch):
+    db = str(tmp_path / "embeddings.sqlite")
+    writer = QueryEmbeddingCache(max_size=4, ttl_s=60, db_path=db)
+    writer.put("m", "a", _vec(1, 0))
+    writer.put("m", "b", _vec(0, 1))
+    writer.flush()
+
+    cache = QueryEmbeddingCache(max_size=4, ttl_s=60, db_path=db)
+    hops = []
+    real = asyncio.to_thread
+    monkeypatch.setattr(asyncio, "to_thread", lambda fn, *args: hops.append(fn) or real(fn, *args))
+    found = asyncio.run(cache.get_many_async("m", ["a", "c", "B"]))
+    assert [v.tolist() if v is not None else None for v in found] == [[1, 0], None, [0, 1]]
+    assert len(hops) == 1
+    assert asyncio.run(cache.get_async("m", "a")).tolist() == [1, 0] and len(hops) == 1  # now in memory
+    assert (cache.stats()["disk_hits"], cache.stats()["misses"]) == (2, 1)
+
+
+def test_expired_rows_are_deleted_when_the_tier_is_opened(clock, tmp_path):
+    db = str(tmp_path / "embeddings.sqlite")
+    cache = QueryEmbeddingCache(max_size=4, ttl_s=60, db_path=db)
+    cache.put("m", "old", _vec(1, 0))
+    cache.flush()
+    clock[0] += 30
+    cache.put("m", "new", _vec(0, 1))
+    cache.flush()
+
+    clock[0] += 31
+    QueryEmbeddingCache(max_size=4, ttl_s=60, db_path=db)
+    assert sqlite3.connect(db).execute("SELECT text FROM query_embeddings").fetchall() == [("new",)]
@@ -0,0 +1,46 @@
+import httpx
+import openai
+import pytest
+
+from app.services import embeddings
+
+_OK = {
+    "object": "list", "model": "m", "usage": {"prompt_tokens": 1, "total_tokens": 1},
+    "data": [{"object": "embedding", "index": 0, "embedding": [0.6, 0.8]}],
+}
+
+
+def _client(monkeypatch, responses):
+    """An OpenAI client (SDK retries on, as in clients.py) answering with `responses` in turn."""
+    calls = []
+
+    def handler(request):
+        status, body = responses[min(len(calls), len(responses) - 1)]
+        calls.append(status)
+        return httpx.Response(status, json=body)
+
+    client = openai.OpenAI(api_key="x", max_retries=2, http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(embeddings, "get_openai_client", lambda: client)
+    monkeypatch.setattr(embeddings.time, "sleep", lambda s: None)
+    return calls
+
+
+def test_rate_limits_are_retried_by_one_layer_only(monkeypatch):
+    limited = (429, {"error": {"message": "Too many requests", "type": "requests"}})
+    calls = _client(monkeypatch, [limited, limited, (200, _OK)])
+    assert embeddings.OpenAIEmbeddings("m").embed(["hi"]).tolist() == [[pytest.approx(0.6), pytest.approx(0.8)]]
+    assert calls == [429, 429, 200]
+
+
+def test_other_errors_mentioning_rate_fail_fast(monkeypatch):
+    calls = _client(monkeypatch, [(400, {"error": {"message": "rate of input too high", "type": "invalid_request_error"}})])
+    with pytest.raises(openai.BadRequestError):
+        embeddings.OpenAIEmbeddings("m").embed(["hi"])
+    assert calls == [400]
+
+
+def test_persistent_rate_limit_gives_up_after_five_requests(monkeypatch):
+    calls = _client(monkeypatch, [(429, {"error": {"message": "Too many requests", "type": "requests"}})])
+    with pytest.raises(openai.RateLimitError):
+        embeddings.OpenAIEmbeddings("m").embed(["hi"])
+    assert len(calls) == 5
@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import hybrid, rag, sop_ingest
+from app.services.answer_cache import AnswerCache
+from app.services.meta_store import MetaStore
+
+ROWS = [
+    {"vid": 1, "id": "expenses_0", "source": "SFO EXPENSES SOP", "document": "expenses_sop.txt", "section": "",
+     "chunk": 0, "text": "Purchases above 5,000 AED need Chief of Staff approval."},
+    {"vid": 2, "id": "vendors_0", "source": "SFO BILLING SOP", "document": "vendors/billing.txt", "section": "vendors",
+     "chunk": 0, "text": "Invoice the office at DMCC Business Centre, UT-11-CO-190. TRN: 105069744800001"},
+    {"vid": 3, "id": "travel_0", "source": "SFO TRAVEL SOP", "document": "travel/flights.txt", "section": "travel",
+     "chunk": 0, "text": "Book flights through the travel desk. Quote the TRN on hotel invoices."},
+]
+
+
+@pytest.fixture
+def meta():
+    return MetaStore.from_rows(ROWS)
+
+
+def test_lexical_leg_ranks_the_exact_token_first(meta):
+    hits = hybrid.lexical_leg(meta, "TRN 105069744800001", 10)
+    assert [vid for vid, _ in hits] == [2, 3]
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"section": "travel"}, [3]),
+    ({"document": "vendors/billing.txt"}, [2]),
+    ({"source": "SFO EXPENSES SOP"}, []),
+    ({"section": "vendors", "source": "SFO TRAVEL SOP"}, []),
+])
+def test_lexical_leg_applies_filters(meta, filters, expected):
+    assert [vid for vid, _ in hybrid.lexical_leg(meta, "TRN invoices", 10, filters)] == expected
+
+
+def test_the_match_skips_terms_in_too_many_chunks(meta, monkeypatch):
+    monkeypatch.setattr(hybrid, "HYBRID_MATCH_MAX_DF", 1)  # "trn" is in two chunks
+    assert [vid for vid, _ in hybrid.lexical_leg(meta, "TRN 105069744800001", 10)] == [2]
+    assert [vid for vid, _ in hybrid.lexical_leg(meta, "TRN invoices", 10)] == [3]
+
+
+def test_document_frequencies_are_stored_at_ingest(meta):
+    assert meta.has_term_df
+    assert meta.doc_freq(["trn", "105069744800001", "unicorn"]) == {"trn": 2, "105069744800001": 1}
+
+
+def test_an_all_stopword_query_skips_the_lexical_leg(meta):
+    assert hybrid.lexical_leg(meta, "what is the", 10) == []
+
+
+def test_fuse_ranks_chunks_found_by_both_legs_first(meta):
+    matches = hybrid.fuse(meta, "TRN 105069744800001", [(1, 0.41), (2, 0.12)], [(2, -3.0), (3, -1.0)], top_k=3)
+    assert [m["id"] for m in matches] == ["vendors_0", "expenses_0", "travel_0"]
+    vendors, expenses, travel = matches
+    # Both terms present, but "trn" is in two of the three chunks: it counts for less than the number
+    assert 0.7 < vendors["lexical_score"] < 0.8
+    assert vendors["score"] == pytest.approx(0.12 + hybrid.LEXICAL_BOOST * vendors["lexical_score"])
+    assert (expenses["score"], expenses["lexical_score"]) == (pytest.approx(0.41), 0.0)
+    # Lexical-only hit: no cosine, and only the common term "trn" is present
+    assert travel["vector_score"] is None
+    assert 0 < travel["score"] < 0.5 * hybrid.LEXICAL_BOOST
+
+
+def test_term_evidence_never_lifts_a_score_past_the_cap(meta):
+    (only,) = hybrid.fuse(meta, "105069744800001", [(2, 0.4)], [(2, -3.0)], top_k=1)
+    assert only["lexical_score"] == pytest.approx(1.0)
+    assert only["score"] == pytest.approx(hybrid.LEXICAL_CAP)
+    (close,) = hybrid.fuse(meta, "105069744800001", [(2, 0.7)], [(2, -3.0)], top_k=1)
+    assert close["score"] == pytest.approx(0.7)  # the cap bounds the lift, not the cosine
+
+
+def test_vector_leg_applies_filters(workdir):
+    for name, text in [("expenses_sop.txt", ROWS[0]["text"]), ("billing.txt", ROWS[1]["text"])]:
+        (workdir / "sops" / name).write_text(text + "\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    snap = sop_ingest.get_index_snapshot()
+    q_emb = sop_ingest._embed_query("Chief of Staff approval")
+    allowed = snap.meta.filter_vids({"document": "billing.txt"})
+    hits = hybrid.vector_leg(snap.index, "flat", q_emb, 10, allowed)
+    assert [vid for vid, _ in hits] == allowed
+
+
+class _FakeChat:
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='{"answer": "Use it."}'))])
+
+
+def test_a_bare_trn_query_is_answered_from_the_right_chunk(workdir, monkeypatch):
+    (workdir / "sops" / "travel").mkdir()
+    (workdir / "sops" / "vendors").mkdir()
+    for name, row in zip(["expenses_sop.txt", "vendors/billing.txt", "travel/flights.txt"], ROWS):
+        (workdir / "sops" / name).write_text(row["text"] + "\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    chat = _FakeChat()
+    monkeypatch.setattr(rag, "_oai", lambda: chat)
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache(max_size=8, similarity=0.95, ttl_s=60))
+
+    result = rag.answer_from_sops("105069744800001")
+    assert result["citations"][0]["document"] == "vendors/billing.txt"
+    assert not result["needs_escalation"] and result["confidence"] >= 0.45
+    assert chat.calls == 1
+
+
+def test_a_query_sharing_only_common_terms_escalates(workdir, monkeypatch):
+    (workdir / "sops" / "expenses_sop.txt").write_text(ROWS[0]["text"] + "\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    monkeypatch.setattr(rag, "_oai", lambda: pytest.fail("escalations must not call the model"))
+
+    result = rag.answer_from_sops("Which purchases need a unicorn permit from the zoo?")
+    assert result["needs_escalation"]
+
+
+def test_a_bare_common_code_escalates(workdir, monkeypatch):
+    for name, row in zip(["expenses_sop.txt", "billing.txt", "flights.txt"], ROWS):
+        (workdir / "sops" / name).write_text(row["text"] + "\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    monkeypatch.setattr(rag, "_oai", lambda: pytest.fail("escalations must not call the model"))
+
+    result = rag.answer_from_sops("TRN")  # in two of the three chunks: says little about which
+    assert result["needs_escalation"] and result["confidence"] < 0.45
+
+
+def test_every_term_present_in_every_chunk_still_escalates(workdir, monkeypatch):
+    for topic in ["travel", "vendors", "payroll", "leave", "security", "events"]:
+        text = f"Office {topic} requests go through the {topic} desk and need written approval.\n"
+        (workdir / "sops" / f"{topic}.txt").write_text(text, encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    monkeypatch.setattr(rag, "_oai", lambda: pytest.fail("escalations must not call the model"))
+
+    result = rag.answer_from_sops("office approval")
+    assert result["needs_escalation"] and result["confidence"] < 0.45
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from app.services import sop_ingest
+
+
+def test_first_ingest_of_an_empty_directory_returns_zero_chunks(workdir):
+    summary = sop_ingest.ingest_sops(workdir / "sops")
+    assert (summary["documents"], summary["chunks"], summary["embedded"]) == (0, 0, 0)
+    assert not sop_ingest.INFO_FILE.exists()
+
+
+def test_first_ingest_of_empty_files_returns_zero_chunks(workdir):
+    (workdir / "sops" / "expenses_sop.txt").write_text("", encoding="utf-8")
+    (workdir / "sops" / "travel.md").write_text("  \n\n", encoding="utf-8")
+    summary = sop_ingest.ingest_sops(workdir / "sops")
+    assert (summary["documents"], summary["chunks"]) == (2, 0)
+    assert not sop_ingest.INFO_FILE.exists()
+
+
+def test_emptying_the_corpus_empties_the_store(workdir):
+    sop = workdir / "sops" / "expenses_sop.txt"
+    sop.write_text("Expenses\n\nAll purchases above 5,000 AED need Chief of Staff approval.\n", encoding="utf-8")
+    assert sop_ingest.ingest_sops(workdir / "sops")["embedded"] == 1
+
+    sop.write_text("", encoding="utf-8")
+    summary = sop_ingest.ingest_sops(workdir / "sops")
+    assert (summary["chunks"], summary["removed"]) == (0, 1)
+    assert sop_ingest.get_index_snapshot().index.ntotal == 0
+
+
+def _corpus(workdir):
+    sops = workdir / "sops"
+    (sops / "expenses_sop.txt").write_text("All purchases above 5,000 AED need Chief of Staff approval.\n", encoding="utf-8")
+    (sops / "travel_sop.txt").write_text("Book flights through the travel desk.\n", encoding="utf-8")
+    (sops / "vendors.md").write_text("Invoice the office at DMCC Business Centre.\n", encoding="utf-8")
+    return sops
+
+
+def _counts(summary):
+    return summary["embedded"], summary["reused"], summary["removed"]
+
+
+def test_an_unchanged_reingest_embeds_nothing(workdir):
+    sops = _corpus(workdir)
+    assert _counts(sop_ingest.ingest_sops(sops)) == (3, 0, 0)
+    assert _counts(sop_ingest.ingest_sops(sops)) == (0, 3, 0)
+
+
+def test_an_edit_reembeds_only_the_changed_chunk(workdir):
+    sops = _corpus(workdir)
+    sop_ingest.ingest_sops(sops)
+    (sops / "travel_sop.txt").write_text("Book flights and hotels through the travel desk.\n", encoding="utf-8")
+    assert _counts(sop_ingest.ingest_sops(sops)) == (1, 2, 1)
+    assert sop_ingest.get_index_snapshot().index.ntotal == 3
+
+
+def test_deleted_documents_leave_the_index(workdir):
+    sops = _corpus(workdir)
+    sop_ingest.ingest_sops(sops)
+    (sops / "vendors.md").unlink()
+    assert _counts(sop_ingest.ingest_sops(sops)) == (0, 2, 1)
+    snap = sop_ingest.get_index_snapshot()
+    assert snap.index.ntotal == len(snap.meta) == 2
+    assert {row["document"] for row in snap.meta.rows()} == {"expenses_sop.txt", "travel_sop.txt"}
+
+
+def test_a_moved_document_reuses_its_vectors(workdir, monkeypatch):
+    sops = _corpus(workdir)
+    sop_ingest.ingest_sops(sops)
+    snap = sop_ingest.get_index_snapshot()
+    before = {row["hash"]: snap.index.reconstruct(row["vid"]) for row in snap.meta.rows()}
+    (sops / "travel").mkdir()
+    (sops / "travel_sop.txt").rename(sops / "travel" / "flights.txt")
+    monkeypatch.setattr(sop_ingest.get_embedder(), "embed", lambda texts: pytest.fail("nothing to embed"))
+
+    assert _counts(sop_ingest.ingest_sops(sops)) == (0, 3, 1)  # new id (the path is part of it), same vector
+    snap = sop_ingest.get_index_snapshot()
+    (moved,) = [row for row in snap.meta.rows() if row["document"] == "travel/flights.txt"]
+    assert moved["section"] == "travel"
+    assert (snap.index.reconstruct(moved["vid"]) == before[moved["hash"]]).all()
+
+
+def test_async_readers_keep_the_current_snapshot_while_a_changed_store_reloads(workdir, monkeypatch):
+    sop = workdir / "sops" / "expenses_sop.txt"
+    sop.write_text("All purchases above 5,000 AED need Chief of Staff approval.\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    other = sop_ingest._IndexHolder()  # another worker's view of the same files
+    monkeypatch.setattr(sop_ingest, "RELOAD_CHECK_INTERVAL_S", 0.0)
+    first = asyncio.run(other.get_async())
+
+    sop.write_text("Purchases above 10,000 AED need CEO approval.\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    assert asyncio.run(other.get_async()) is first  # the reload runs on the search pool, not in the request
+    deadline = time.monotonic() + 5
+    while other._snapshot is first and time.monotonic() < deadline:
+        time.sleep(0.01)
+    (row,) = other._snapshot.meta.rows()
+    assert "CEO" in row["text"] and other._snapshot.generation == first.generation + 1
+
+
+def test_a_reingest_is_served_in_process_and_by_other_workers(workdir, monkeypatch):
+    sop = workdir / "sops" / "expenses_sop.txt"
+    sop.write_text("All purchases above 5,000 AED need Chief of Staff approval.\n", encoding="utf-8")
+    first = sop_ingest.ingest_sops(workdir / "sops")
+    other = sop_ingest._IndexHolder()  # another worker's view of the same files
+    assert sop_ingest.search_sops("purchases")["matches"][0]["text"].startswith("All purchases")
+    assert other.get().generation == 1
+
+    sop.write_text("Purchases above 10,000 AED need CEO approval.\n", encoding="utf-8")
+    second = sop_ingest.ingest_sops(workdir / "sops")
+    assert sop_ingest.search_sops("purchases")["matches"][0]["text"].startswith("Purchases above 10,000")
+    monkeypatch.setattr(sop_ingest, "RELOAD_CHECK_INTERVAL_S", 0.0)
+    (row,) = other.get().meta.rows()
+    assert "CEO" in row["text"]
+
+    # New files each time, only the current set left behind, and the info file points at it
+    assert first["index_file"] != second["index_file"] and first["meta_file"] != second["meta_file"]
+    assert sorted(p.name for p in sop_ingest.VSTORE_DIR.iterdir()) == sorted(
+        ["sops.info.json", Path(second["index_file"]).name, Path(second["meta_file"]).name]
+    )
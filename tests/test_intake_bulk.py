@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.models.schemas import TaskPayload
+from app.routers import intake
+from app.services import intake as intake_service, intent, jobs
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = FastAPI()
+    app.include_router(intake.router)
+
+    @app.middleware("http")
+    async def request_id(request: Request, call_next):
+        request.state.request_id = "req-1"
+        return await call_next(request)
+
+    monkeypatch.setattr(intake, "audit_log", lambda *args, **kwargs: None)
+    monkeypatch.setattr(intake_service, "audit_log", lambda *args, **kwargs: None)
+    return TestClient(app)
+
+
+def test_a_failed_batch_embedding_still_streams_per_item_results(client, monkeypatch):
+    async def embeddings_down(queries):
+        raise RuntimeError("OPENAI_API_KEY is not set")
+
+    prepared = []
+
+    async def prepare(body, classification=None, q_emb=None):
+        prepared.append((body.message, classification.category, q_emb))
+        if "laptop" in body.message:
+            raise RuntimeError("OPENAI_API_KEY is not set")  # its own SOP lookup fails too
+        payload = TaskPayload(title=body.message, description="", category=classification.category, priority="high")
+        return payload, ""
+
+    async def submit(payload, comment_text):
+        written = asyncio.get_running_loop().create_future()
+        written.set_result({"task_id": "t1", "comment_id": None})
+        return "accepted-1", written
+
+    monkeypatch.setattr(intake, "embed_queries_async", embeddings_down)
+    monkeypatch.setattr(intent, "embed_queries_async", embeddings_down)
+    monkeypatch.setattr(intent, "_CENTROIDS", intent._Centroids())
+    monkeypatch.setattr(intent, "_retry_at", 0.0)
+    monkeypatch.setattr(intake, "prepare_intake", prepare)
+    monkeypatch.setattr(intake, "submit_task", submit)
+
+    messages = ["Buy a laptop for the intern", "Remind me to call the lawyer"]
+    resp = client.post("/intake/bulk", json=[{"message": m} for m in messages])
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    by_index = {line["index"]: line for line in lines if "index" in line}
+    assert not by_index[0]["ok"] and "OPENAI_API_KEY" in by_index[0]["error"]
+    assert by_index[1]["ok"] and by_index[1]["task_id"] == "t1"
+    assert lines[-1] == {"done": True, "total": 2, "unique": 2, "failed": 1}
+    # The keyword routing from the batch still applies; the embedding is left to each item
+    assert sorted((m, c, e) for m, c, e in prepared) == [
+        ("Buy a laptop for the intern", "expense_purchase", None),
+        ("Remind me to call the lawyer", "general_task", None),
+    ]
+
+
+@pytest.fixture
+def single(client, monkeypatch, tmp_path):
+    """Single /intake with enrichment stubbed; each write completes on the next loop iteration."""
+    monkeypatch.setattr(jobs, "JOBS_DB", tmp_path / "jobs.sqlite")
+
+    async def prepare(body, classification=None, q_emb=None):
+        return TaskPayload(title=body.message, description="", category="general_task", priority="high"), "comment"
+
+    async def submit(payload, comment_text):
+        written = asyncio.get_running_loop().create_future()
+        asyncio.get_running_loop().call_soon(written.set_result, {"task_id": "t1", "comment_id": "c1"})
+        return "accepted-1", written
+
+    monkeypatch.setattr(intake, "prepare_intake", prepare)
+    monkeypatch.setattr(intake, "submit_task", submit)
+
+
+def test_intake_answers_once_the_task_is_written(client, single):
+    resp = client.post("/intake", json={"message": "Call the lawyer"})
+    assert resp.status_code == 200
+    assert (resp.json()["task_id"], resp.json()["comment_id"]) == ("t1", "c1")
+
+
+def test_intake_without_wait_answers_when_the_write_is_queued(client, single):
+    resp = client.post("/intake?wait=false", json={"message": "Call the lawyer"})
+    assert resp.status_code == 202
+    assert resp.json()["accepted_id"] == "accepted-1" and resp.json()["status"] == "queued"
+
+
+def test_background_intake_only_queues_a_job(client, single, monkeypatch):
+    monkeypatch.setattr(intake, "prepare_intake", lambda *args, **kwargs: pytest.fail("enriched in the request"))
+    resp = client.post("/intake?background=true", json={"message": "Call the lawyer"})
+    assert resp.status_code == 202 and resp.json()["status"] == "queued"
+    assert jobs.get_job(resp.json()["job_id"])["kind"] == "intake"
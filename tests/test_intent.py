@@ -0,0 +1,88 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services import intent
+from app.services.embeddings import LocalHashEmbeddings
+from app.services.router import Classification, RuleTable
+
+TABLE = RuleTable({
+    "default_category": "general_task",
+    "categories": {
+        "expense_purchase": {"needs_approval": True, "min_score": 1.0, "examples": ["Get a new keyboard for the office"]},
+        "travel_booking": {"needs_approval": True, "min_score": 1.0, "examples": ["Arrange a trip to London"]},
+        "general_task": {"examples": ["Remind me to call the lawyer"]},
+    },
+    # A weak term: on its own it is below min_score, so the embedding stage decides
+    "rules": [{"id": "expense.weak", "category": "expense_purchase", "terms": ["sort"], "weight": 0.5}],
+})
+LABELS = ["expense_purchase", "travel_booking", "general_task"]
+UNSURE = Classification("general_task", False, 0.0, ["expense.weak"])
+
+
+@pytest.mark.parametrize(
+    "sims, expected",
+    [
+        ([0.30, 0.10, 0.05], ("general_task", "keywords")),  # best below INTENT_MIN_SIMILARITY
+        ([0.60, 0.59, 0.10], ("general_task", "keywords")),  # best within INTENT_MIN_MARGIN of the runner-up
+        ([0.10, 0.70, 0.20], ("travel_booking", "embedding")),
+        ([0.10, 0.20, 0.70], ("general_task", "keywords")),  # agrees with the keywords: their result stands
+    ],
+)
+def test_pick_needs_similarity_and_margin(sims, expected):
+    picked = intent._pick(TABLE, UNSURE, LABELS, np.array(sims, dtype="float32"))
+    assert (picked.category, picked.stage) == expected
+    if picked.stage == "embedding":
+        assert picked.needs_approval and picked.score == pytest.approx(max(sims))
+
+
+@pytest.fixture
+def embed_calls(monkeypatch):
+    monkeypatch.setattr(intent, "get_rule_table", lambda: TABLE)
+    monkeypatch.setattr(intent, "_CENTROIDS", intent._Centroids())
+    monkeypatch.setattr(intent, "_retry_at", 0.0)
+    calls = []
+    local = LocalHashEmbeddings(dim=256)
+
+    async def embed(texts):
+        calls.append(list(texts))
+        if getattr(embed, "down", False):
+            raise RuntimeError("upstream down")
+        return local.embed(texts)
+
+    monkeypatch.setattr(intent, "embed_queries_async", embed)
+    return calls, embed
+
+
+def test_a_purchase_without_keywords_routes_through_the_embedding_stage(embed_calls):
+    embed_calls, _ = embed_calls
+    message = "Could you get a new keyboard for the office?"
+    assert TABLE.classify(message).rules == []
+    result = asyncio.run(intent.classify_many_async([message]))
+    assert (result[0].category, result[0].stage) == ("expense_purchase", "embedding")
+    assert result[0].needs_approval
+    assert embed_calls[-1] == [message]
+
+
+def test_unmatched_messages_are_not_embedded_when_opted_out(embed_calls, monkeypatch):
+    embed_calls, _ = embed_calls
+    monkeypatch.setattr(intent, "INTENT_FALLBACK_UNMATCHED", False)
+    result = asyncio.run(intent.classify_many_async(["Remind me to call the lawyer tomorrow"]))
+    assert result[0].category == "general_task" and embed_calls == []
+
+
+def test_partial_keyword_match_goes_to_the_embedding_stage(embed_calls):
+    embed_calls, _ = embed_calls
+    result = asyncio.run(intent.classify_many_async(["Sort out: arrange a trip to London"]))
+    assert (result[0].category, result[0].stage) == ("travel_booking", "embedding")
+    assert embed_calls[-1] == ["Sort out: arrange a trip to London"]
+
+
+def test_embedding_failure_backs_off(embed_calls):
+    embed_calls, embed = embed_calls
+    embed.down = True
+    for _ in range(3):
+        result = asyncio.run(intent.classify_many_async(["Sort out the Geneva visit"]))
+        assert result[0] == TABLE.classify("Sort out the Geneva visit")
+    assert len(embed_calls) == 1  # centroid build failed once; later calls skip the stage
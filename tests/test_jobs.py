@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.services import jobs
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DB", tmp_path / "jobs.sqlite")
+    c = jobs._connect()
+    yield c
+    c.close()
+
+
+def _stall(conn, job_id):
+    # Claimed long ago by a worker that stopped heartbeating
+    stale = time.time() - jobs.JOB_STALE_S - 1
+    conn.execute("UPDATE jobs SET status = 'running', worker = 'gone:1', heartbeat_at = ? WHERE id = ?", (stale, job_id))
+
+
+def test_stale_intake_fails_instead_of_running_twice(conn):
+    ingest = jobs.enqueue("sop_ingest", {}, lock_key="sop_ingest:x")
+    intake = jobs.enqueue("intake", {"body": {}})
+    _stall(conn, ingest["id"])
+    _stall(conn, intake["id"])
+
+    claimed = jobs._claim(conn, "w:2")
+    assert claimed["id"] == ingest["id"]  # requeued and taken again: ingest is incremental
+    failed = jobs.get_job(intake["id"])
+    assert failed["status"] == "failed" and "not retried" in failed["error"]
+    assert jobs._claim(conn, "w:2") is None
+
+
+def test_intake_worker_skips_a_queued_ingest(conn):
+    jobs.enqueue("sop_ingest", {}, lock_key="sop_ingest:x")
+    intake = jobs.enqueue("intake", {"body": {}})
+    assert jobs._claim(conn, "intake:1", ("intake",))["id"] == intake["id"]
+    assert jobs._claim(conn, "intake:1", ("intake",)) is None
+    assert jobs._claim(conn, "any:1")["kind"] == "sop_ingest"
+
+
+def test_a_jobs_db_error_does_not_stop_the_worker(conn, monkeypatch):
+    stop, connections = threading.Event(), []
+
+    def run_one(c, worker, kinds):
+        connections.append(c)
+        if len(connections) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        stop.set()
+        return True
+
+    monkeypatch.setattr(jobs, "run_one", run_one)
+    monkeypatch.setattr(jobs, "JOB_POLL_S", 0.001)
+    jobs.run_worker(stop)
+    assert len(connections) == 3 and len(set(map(id, connections))) == 3  # a fresh connection after each error
+
+
+def test_worker_process_can_chunk_in_parallel(tmp_path, monkeypatch):
+    # Spawned workers read their settings from the environment: force the process-pool chunking path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("JOBS_DB", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setenv("EMBED_PROVIDER", "local")
+    monkeypatch.setenv("LOCAL_EMBED_DIM", "64")
+    monkeypatch.setenv("SOP_INGEST_WORKERS", "2")
+    monkeypatch.setenv("SOP_PARALLEL_CHUNK_MIN_BYTES", "1")
+    monkeypatch.setattr(jobs, "JOBS_DB", tmp_path / "jobs.sqlite")
+    sops = tmp_path / "sops"
+    sops.mkdir()
+    (sops / "expenses_sop.txt").write_text("Expenses\n\nPurchases above 5,000 AED need approval.\n", encoding="utf-8")
+    (sops / "travel_sop.txt").write_text("Travel\n\nBook flights through the travel desk.\n", encoding="utf-8")
+
+    job = jobs.enqueue("sop_ingest", {"root": str(sops)}, lock_key="sop_ingest:test")
+    jobs.start_workers(1, 0)
+    try:
+        deadline = time.time() + 60
+        while jobs.get_job(job["id"])["status"] in ("queued", "running") and time.time() < deadline:
+            time.sleep(0.2)
+    finally:
+        jobs.stop_workers()
+    done = jobs.get_job(job["id"])
+    assert done["status"] == "succeeded", done["error"]
+    assert done["result"]["documents"] == 2 and done["result"]["chunks"] == 2
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import threading
+from collections import Counter as Tally
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.routers import ask
+from app.services import coalesce, sop_ingest
+from app.services.hybrid import SEARCH_POOL
+from app.utils import metrics, profiler
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Metrics created in a test register here, not next to the app's own."""
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+
+
+def test_histograms_render_cumulative_buckets_sum_and_count(registry):
+    hist = metrics.Histogram("t_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        hist.observe(value, "/ask")
+
+    assert metrics.render().splitlines() == [
+        "# HELP t_seconds Test latency.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{route="/ask",le="0.1"} 1',
+        't_seconds_bucket{route="/ask",le="1"} 3',
+        't_seconds_bucket{route="/ask",le="+Inf"} 4',
+        't_seconds_sum{route="/ask"} 4.25',
+        't_seconds_count{route="/ask"} 4',
+    ]
+
+
+def test_counters_and_extra_samples_escape_label_values(registry):
+    metrics.Counter("t_total", "Test count.", ("host",)).inc('a"b\\c\nd', amount=2)
+    lines = metrics.render([("t_size", "Test gauge.", "gauge", [({"cache": "answers"}, 3)])]).splitlines()
+    assert lines == [
+        "# HELP t_total Test count.",
+        "# TYPE t_total counter",
+        't_total{host="a\\"b\\\\c\\nd"} 2',
+        "# HELP t_size Test gauge.",
+        "# TYPE t_size gauge",
+        't_size{cache="answers"} 3',
+    ]
+
+
+def test_spans_in_child_tasks_and_pool_threads_count_for_the_request():
+    def in_pool():
+        with metrics.span("pool"):
+            pass
+
+    async def child():
+        with metrics.span("task"):
+            pass
+
+    async def handler():
+        timings = metrics.begin_request()
+        with metrics.span("inline"):
+            pass
+        await asyncio.create_task(child())
+        await asyncio.get_running_loop().run_in_executor(SEARCH_POOL, contextvars.copy_context().run, in_pool)
+        return timings
+
+    async def unrelated():
+        with metrics.span("elsewhere"):  # no request: observed, but recorded nowhere
+            pass
+        return metrics.current_timings()
+
+    timings = asyncio.run(handler())
+    assert set(timings.stages) == {"inline", "task", "pool"}
+    assert asyncio.run(unrelated()) is None
+
+
+def test_server_timing_and_metrics_cover_a_search(workdir, monkeypatch):
+    from app import main
+
+    (workdir / "sops" / "expenses_sop.txt").write_text("Purchases above 5,000 AED need approval.\n", encoding="utf-8")
+    sop_ingest.ingest_sops(workdir / "sops")
+    monkeypatch.setattr(coalesce, "get_embedder", sop_ingest.get_embedder)
+    for module in (main, ask):
+        monkeypatch.setattr(module, "audit_log", lambda *args, **kwargs: None)
+    client = TestClient(main.app)  # no lifespan: nothing to warm, no workers
+
+    response = client.post("/sop/search", json={"query": "approval above 5,000 AED"})
+    assert response.status_code == 200 and response.headers["X-Request-Id"]
+    timing = dict(part.split(";dur=") for part in response.headers["Server-Timing"].split(", "))
+    assert {"embed_and_search", "lexical_search", "fuse", "total"} <= set(timing)
+    assert all(float(ms) >= 0 for ms in timing.values())
+
+    exposition = client.get("/metrics")
+    assert exposition.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'pillar2_http_request_seconds_count{method="POST",route="/sop/search",status="200"}' in exposition.text
+    assert 'pillar2_stage_seconds_count{stage="lexical_search"}' in exposition.text
+    assert 'pillar2_cache_entries{cache="answers"}' in exposition.text
+
+
+def test_slow_request_profiles_are_written_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_MS", 100)
+    monkeypatch.setattr(profiler, "PROFILE_DIR", tmp_path / "profiles")
+    threads = []
+
+    class Sampler:
+        def between(self, start, end):
+            threads.append(threading.get_ident())
+            assert (start, end) == (10.0, 10.25)
+            return Tally({"MainThread;handler (ask.py)": 3, "MainThread;search (hybrid.py)": 1})
+
+    monkeypatch.setattr(profiler, "_SAMPLER", Sampler())
+
+    async def main():
+        fast = await profiler.profile_if_slow("r-fast", 10.0, 50)
+        return fast, await profiler.profile_if_slow("r-slow", 10.0, 250), threading.get_ident()
+
+    fast, path, loop_thread = asyncio.run(main())
+    assert fast is None and len(threads) == 1  # fast requests never leave the loop
+    assert threads[0] != loop_thread
+    assert open(path, encoding="utf-8").read() == (
+        "MainThread;handler (ask.py) 3\nMainThread;search (hybrid.py) 1\n"
+    )
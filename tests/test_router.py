@@ -0,0 +1,115 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from app.services.router import RuleTable, _Automaton, _tokens
+
+RULES_FILE = Path(__file__).resolve().parent.parent / "data" / "routing_rules.json"
+
+
+@pytest.fixture(scope="module")
+def table() -> RuleTable:
+    return RuleTable(json.loads(RULES_FILE.read_text(encoding="utf-8")))
+
+
+# Every keyword the original substring classifier routed to expense_purchase, alone in a message.
+# "card" is the exception: on its own it is as often a business card as a payment card.
+@pytest.mark.parametrize(
+    "message",
+    ["buy", "purchase", "invoice", "pay", "subscription", "laptop", "phone", "tablet", "amazon"],
+)
+def test_baseline_single_keywords_still_route_to_expense(table, message):
+    result = table.classify(message)
+    assert result.category == "expense_purchase"
+    assert result.needs_approval
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Please buy a new laptop for the intern",
+        "Pay the Amazon invoice with the company card",
+        "Renew the Adobe subscription",
+        "Order new monitors for the office",
+        "Can you place an order for printer paper",
+        "I need a phone",
+        "Get the cleaning supplies from noon.com",
+        "Renew the trade licence before it lapses",
+        "Charge the caterer to the corporate card",
+    ],
+)
+def test_expense_messages(table, message):
+    assert table.classify(message).category == "expense_purchase"
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "In order to finish the report, call the lawyer",
+        "Put the files in order before the audit",
+        "Remind me to call the architect tomorrow",
+        "Update the paypal contact",  # word boundaries: "pay" is not a match inside "paypal"
+        "Call the lawyer at noon",
+        "Renew my passport before the summer",
+        "Scan my driver's license for the file",
+        "Bring a business card to the meeting",
+        "Deposit the documents with the notary",
+    ],
+)
+def test_non_expense_messages(table, message):
+    assert table.classify(message).category == "general_task"
+
+
+def test_travel_and_it_rules(table):
+    assert table.classify("Book a flight to Geneva").category == "travel_booking"
+    assert table.classify("Reset password for my email account").category == "it_support"
+
+
+@pytest.mark.parametrize(
+    "message", ["Send the wire transfer to the contractor", "Transfer the security deposit for the villa"]
+)
+def test_large_amount_rule_forces_approval(table, message):
+    result = table.classify(message)
+    assert result.category == "expense_purchase"
+    assert "expense.large_amount" in result.rules
+    assert result.needs_approval
+
+
+def test_automaton_matches_phrases_and_overlaps():
+    phrases = [(_tokens("credit card"), 0), (_tokens("card"), 1), (_tokens("in order to"), 2), (_tokens("order a"), 3)]
+    automaton = _Automaton(phrases)
+    assert automaton.scan(_tokens("Pay with the credit card")) == {0, 1}
+    assert automaton.scan(_tokens("in order to order a laptop")) == {2, 3}
+    assert automaton.scan(_tokens("in order")) == set()
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Give the driver access to the villa",
+        "Arrange gate access for the caterer",
+        "Make sure the chef has access to the villa kitchen",
+        "Book the caterer for Friday",
+    ],
+)
+def test_household_and_vendor_requests_are_not_it_or_travel(table, message):
+    assert table.classify(message).category == "general_task"
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Pay the hotel invoice",
+        "Pay for the driver's flight",
+        "Buy a new printer for the office",
+        "Pay the caterer and arrange gate access",
+    ],
+)
+def test_travel_and_it_terms_do_not_take_expense_messages(table, message):
+    assert table.classify(message).category == "expense_purchase"
+
+
+@pytest.mark.parametrize("message", ["Request VPN access for the new analyst", "I need mailbox access"])
+def test_it_access_phrases(table, message):
+    assert table.classify(message).category == "it_support"
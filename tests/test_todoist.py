@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import todoist
+
+
+@pytest.fixture
+def projects(monkeypatch):
+    """REST stand-in: GET /projects returns api["projects"]; api["calls"] counts the requests."""
+    monkeypatch.setenv("TODOIST_API_TOKEN", "token")
+    api = {"projects": [{"id": "1", "name": "Inbox"}, {"id": "2", "name": "Purchases"}], "calls": 0}
+
+    def handler(request):
+        assert request.url.path.endswith("/projects")
+        api["calls"] += 1
+        return httpx.Response(200, json=api["projects"])
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(todoist, "get_async_http_client", lambda: client)
+    monkeypatch.setattr(todoist, "_PROJECTS", todoist._ProjectDirectory())
+    return api
+
+
+def _age(seconds):
+    todoist._PROJECTS._loaded_at -= seconds
+
+
+def test_names_resolve_from_one_load(projects):
+    async def main():
+        return [await todoist._PROJECTS.resolve_async(name) for name in ("Inbox", "Purchases", "Inbox")]
+
+    assert asyncio.run(main()) == ["1", "2", "1"]
+    assert projects["calls"] == 1
+
+
+def test_a_stale_directory_is_served_while_it_refreshes(projects):
+    async def main():
+        await todoist._PROJECTS.refresh_async()
+        projects["projects"] = [{"id": "9", "name": "Inbox"}]
+        _age(todoist.PROJECT_CACHE_TTL_S + 1)
+        stale = await todoist._PROJECTS.resolve_async("Inbox")  # answered before the refresh completes
+        await todoist._PROJECTS._bg_task
+        return stale, await todoist._PROJECTS.resolve_async("Inbox")
+
+    assert asyncio.run(main()) == ("1", "9")
+    assert projects["calls"] == 2
+
+
+def test_an_unknown_name_refreshes_at_most_once_per_interval(projects):
+    async def main():
+        await todoist._PROJECTS.refresh_async()
+        _age(todoist.PROJECT_MISS_REFRESH_S + 1)
+        projects["projects"].append({"id": "3", "name": "Travel"})
+        found = await todoist._PROJECTS.resolve_async("Travel")  # new since the load: one refresh finds it
+        with pytest.raises(RuntimeError, match="not found: Legal"):
+            await todoist._PROJECTS.resolve_async("Legal")  # just refreshed: fails without another call
+        return found
+
+    assert asyncio.run(main()) == "3"
+    assert projects["calls"] == 2
+
+
+def test_categories_route_to_their_configured_project(projects, monkeypatch):
+    monkeypatch.delenv("TODOIST_PROJECT_NAME", raising=False)
+    monkeypatch.setattr(todoist, "CATEGORY_PROJECTS", {"expense_purchase": "Purchases"})
+
+    async def main():
+        assert await todoist.warm_project_directory()
+        return [await todoist.get_project_id_for_category_async(c) for c in ("expense_purchase", "general_task")]
+
+    assert asyncio.run(main()) == ["2", "1"]  # unmapped categories go to TODOIST_PROJECT_NAME (Inbox)
+    assert projects["calls"] == 1
+
+
+def test_the_directory_is_usable_from_a_later_event_loop(projects):
+    asyncio.run(todoist._PROJECTS.refresh_async())
+    _age(todoist.PROJECT_CACHE_TTL_S + 1)
+    # The lock and refresh task of the first loop would hang or never run here
+    assert asyncio.run(todoist._PROJECTS.refresh_async()) is None
+    assert projects["calls"] == 2
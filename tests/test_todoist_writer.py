@@ -0,0 +1,177 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from app.services import jobs, todoist_writer
+from app.services.todoist_writer import TodoistWriteError, TodoistWriter
+
+
+@pytest.fixture
+def sync_api(monkeypatch, tmp_path):
+    """Sync API stand-in: `respond(commands)` -> httpx.Response; every request's commands are recorded."""
+    monkeypatch.setenv("TODOIST_API_TOKEN", "token")
+    monkeypatch.setattr(jobs, "JOBS_DB", tmp_path / "jobs.sqlite")
+    monkeypatch.setattr(todoist_writer, "FLUSH_INTERVAL_S", 0.05)
+    requests, sleeps = [], []
+
+    def ok(commands):
+        return httpx.Response(200, json={
+            "sync_status": {c["uuid"]: "ok" for c in commands},
+            "temp_id_mapping": {c["temp_id"]: f"id-{c['args']['content'][:5]}" for c in commands},
+        })
+
+    api = {"respond": ok, "requests": requests, "sleeps": sleeps}
+
+    def handler(request):
+        assert request.headers["Authorization"] == "Bearer token"
+        commands = json.loads(parse_qs(request.content.decode())["commands"][0])
+        requests.append(commands)
+        return api["respond"](commands)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(todoist_writer, "get_async_http_client", lambda: client)
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(todoist_writer.asyncio, "sleep", sleep)
+    return api
+
+
+def _write_two(writer):
+    first = writer.submit("Buy a laptop", project_id="p1", comment="Check the SOP")
+    second = writer.submit("Call the lawyer", comment="Before Friday")
+    return first, second
+
+
+async def _settle(writer, *futures):
+    results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 5)  # a lost write fails, not hangs
+    await writer.stop()
+    return results
+
+
+def test_writes_batch_into_one_call_with_comments_linked_by_temp_id(sync_api):
+    async def main():
+        writer = TodoistWriter()
+        (a_id, a), (b_id, b) = _write_two(writer)
+        return writer, a_id, await _settle(writer, a, b)
+
+    writer, a_id, (a, b) = asyncio.run(main())
+    (commands,) = sync_api["requests"]
+    assert [c["type"] for c in commands] == ["item_add", "note_add", "item_add", "note_add"]
+    assert commands[1]["args"]["item_id"] == commands[0]["temp_id"]
+    assert commands[3]["args"]["item_id"] == commands[2]["temp_id"]
+    assert commands[0]["args"] == {"content": "Buy a laptop", "project_id": "p1"}
+    assert a == {"task_id": "id-Buy a", "comment_id": "id-Check"}
+    assert b == {"task_id": "id-Call ", "comment_id": "id-Befor"}
+    assert writer.status(a_id) == {"state": "ok", **a}
+
+
+def test_write_states_reach_the_jobs_db_for_other_workers(sync_api):
+    async def main():
+        writer = TodoistWriter()
+        (a_id, a), _ = _write_two(writer)
+        await _settle(writer, a)
+        return writer, a_id
+
+    writer, a_id = asyncio.run(main())
+    assert jobs.get_write_status(a_id) == writer.status(a_id) == {
+        "state": "ok", "task_id": "id-Buy a", "comment_id": "id-Check",
+    }
+    assert jobs.get_write_status("unknown") is None
+
+
+def test_a_rejected_command_fails_only_its_own_write(sync_api):
+    def reject_first_note(commands):
+        status = {c["uuid"]: "ok" for c in commands}
+        status[commands[1]["uuid"]] = {"error_code": 15, "error": "Invalid temporary id"}
+        return httpx.Response(200, json={"sync_status": status, "temp_id_mapping": {commands[2]["temp_id"]: "t2"}})
+
+    sync_api["respond"] = reject_first_note
+
+    async def main():
+        writer = TodoistWriter()
+        (a_id, a), (_, b) = _write_two(writer)
+        return writer, a_id, await _settle(writer, a, b)
+
+    writer, a_id, (a, b) = asyncio.run(main())
+    assert isinstance(a, TodoistWriteError) and "Invalid temporary id" in str(a)
+    assert writer.status(a_id)["state"] == "error"
+    assert b == {"task_id": "t2", "comment_id": None}
+
+
+def test_rate_limited_batches_are_resent_with_the_same_uuids(sync_api):
+    ok = sync_api["respond"]
+    responses = iter([httpx.Response(429, headers={"Retry-After": "3"}), httpx.Response(503)])
+    sync_api["respond"] = lambda commands: next(responses, None) or ok(commands)
+
+    async def main():
+        writer = TodoistWriter()
+        (_, a), (_, b) = _write_two(writer)
+        return await _settle(writer, a, b)
+
+    a, b = asyncio.run(main())
+    assert a["task_id"] == "id-Buy a" and b["task_id"] == "id-Call "
+    assert sync_api["sleeps"] == [3.0, 2]  # Retry-After first, then exponential backoff
+    uuids = [[c["uuid"] for c in commands] for commands in sync_api["requests"]]
+    assert len(uuids) == 3 and uuids[0] == uuids[1] == uuids[2]
+
+
+def test_exhausted_retries_fail_every_write_in_the_batch(sync_api, monkeypatch):
+    monkeypatch.setattr(todoist_writer, "MAX_ATTEMPTS", 2)
+    sync_api["respond"] = lambda commands: httpx.Response(429)
+
+    async def main():
+        writer = TodoistWriter()
+        (_, a), (_, b) = _write_two(writer)
+        return await _settle(writer, a, b)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, TodoistWriteError) for r in results)
+    assert len(sync_api["requests"]) == 2
+
+
+def test_a_malformed_response_fails_its_batch_and_the_writer_keeps_going(sync_api):
+    ok = sync_api["respond"]
+    responses = iter([httpx.Response(200, json=["not", "a", "sync", "response"])])
+    sync_api["respond"] = lambda commands: next(responses, None) or ok(commands)
+
+    async def main():
+        writer = TodoistWriter()
+        (_, a), (_, b) = _write_two(writer)
+        first = await asyncio.wait_for(asyncio.gather(a, b, return_exceptions=True), 5)
+        _, c = writer.submit("Book the venue")
+        return first, await _settle(writer, c)
+
+    (a, b), (c,) = asyncio.run(main())
+    assert isinstance(a, TodoistWriteError) and isinstance(b, TodoistWriteError)
+    assert c["task_id"] == "id-Book "
+
+
+def test_writes_queued_while_the_runner_is_down_are_still_sent(sync_api):
+    async def main():
+        writer = TodoistWriter()
+        _, a = writer.submit("Buy a laptop")
+        writer._runner.cancel()  # dies before it reads the queue
+        await asyncio.wait([writer._runner])
+        _, b = writer.submit("Call the lawyer")  # restarts the runner on the same queue
+        return await _settle(writer, a, b)
+
+    a, b = asyncio.run(main())
+    assert (a["task_id"], b["task_id"]) == ("id-Buy a", "id-Call ")
+    assert len(sync_api["requests"]) == 1
+
+
+def test_stop_sends_what_a_crashed_runner_left_queued(sync_api):
+    async def main():
+        writer = TodoistWriter()
+        _, a = writer.submit("Buy a laptop")
+        writer._runner.cancel()
+        await asyncio.wait([writer._runner])
+        await writer.stop()  # no error at shutdown
+        return await asyncio.wait_for(a, 5)
+
+    assert asyncio.run(main())["task_id"] == "id-Buy a"
@@ -0,0 +1,91 @@
+import faiss
+import numpy as np
+import pytest
+
+from app.services import hybrid, vector_index
+
+
+def _flat(n, d=32, seed=0):
+    xb = np.random.default_rng(seed).normal(size=(n, d)).astype("float32")
+    faiss.normalize_L2(xb)
+    flat = faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+    flat.add_with_ids(xb, np.arange(1000, 1000 + n, dtype="int64"))
+    return flat
+
+
+@pytest.fixture
+def auto(monkeypatch):
+    monkeypatch.setattr(vector_index, "ANN_INDEX", "auto")
+    monkeypatch.setattr(vector_index, "ANN_MIN_VECTORS", 20_000)
+    monkeypatch.setattr(vector_index, "ANN_TARGET_RECALL", 0.95)
+    monkeypatch.setattr(vector_index, "ANN_RECALL_QUERIES", 100)
+
+
+@pytest.mark.parametrize(
+    "n, kind",
+    [(0, "flat"), (19_999, "flat"), (20_000, "hnsw"), (199_999, "hnsw"), (200_000, "ivfflat"), (1_000_000, "ivfpq")],
+)
+def test_choose_kind_by_corpus_size(auto, n, kind):
+    assert vector_index.choose_kind(n) == kind
+
+
+def test_a_forced_kind_ignores_corpus_size(auto, monkeypatch):
+    monkeypatch.setattr(vector_index, "ANN_INDEX", "ivfflat")
+    assert vector_index.choose_kind(10) == "ivfflat"
+
+
+def test_small_corpus_stays_flat(auto):
+    index, info = vector_index.build_search_index(_flat(500))
+    assert index is None and info == {"type": "flat"}
+
+
+def test_hnsw_is_tuned_to_the_target_recall(auto, monkeypatch):
+    monkeypatch.setattr(vector_index, "ANN_MIN_VECTORS", 1000)
+    flat = _flat(3000)
+    index, info = vector_index.build_search_index(flat)
+    assert info["type"] == "hnsw" and "rejected" not in info
+    assert info["recall_at_10"] >= 0.95
+    queries = vector_index._sample_queries(vector_index._flat_contents(flat)[0], 100)
+    assert vector_index.recall_at_k(index, flat, queries) == pytest.approx(info["recall_at_10"])
+
+
+def test_auto_mode_drops_a_kind_that_misses_the_target_recall(auto, monkeypatch):
+    # Pretend the corpus is in the ivfpq tier: 2-byte codes over 32 dims can't reach 0.95
+    monkeypatch.setattr(vector_index, "ANN_MIN_VECTORS", 1000)
+    monkeypatch.setattr(vector_index, "_AUTO_TIERS", ())
+    index, info = vector_index.build_search_index(_flat(3000))
+    assert info["type"] != "ivfpq" and info["rejected"]["ivfpq"] < 0.95
+    assert info["recall_at_10"] >= 0.95
+
+
+def test_a_forced_kind_keeps_its_measured_recall(auto, monkeypatch):
+    monkeypatch.setattr(vector_index, "ANN_INDEX", "ivfpq")
+    index, info = vector_index.build_search_index(_flat(3000))
+    assert info["type"] == "ivfpq" and info["recall_at_10"] < 0.95 and "rejected" not in info
+
+
+def _hnsw(flat, ef=16):
+    xb, ids = vector_index._flat_contents(flat)
+    index = vector_index._build("hnsw", xb, ids)
+    vector_index.set_search_param(index, "hnsw", ef)
+    return index, xb
+
+
+@pytest.mark.parametrize("exact_max", [5000, 0], ids=["exact", "widened-efsearch"])
+def test_selective_filters_on_hnsw_return_every_allowed_vector(monkeypatch, exact_max):
+    monkeypatch.setattr(vector_index, "ANN_FILTER_EXACT_MAX", exact_max)
+    flat = _flat(3000)
+    index, xb = _hnsw(flat)
+    allowed = [1005, 2500, 3900, 99999]  # the last id isn't in the index
+    hits = hybrid.vector_leg(index, "hnsw", xb[:1], 5, allowed)
+    assert sorted(vid for vid, _ in hits) == [1005, 2500, 3900]
+    # Same ranking and scores as an exact search restricted to the same ids
+    params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(allowed, dtype="int64")))
+    scores, ids = flat.search(xb[:1], 3, params=params)
+    assert [vid for vid, _ in hits] == ids[0].tolist()
+    assert [s for _, s in hits] == pytest.approx(scores[0].tolist(), abs=1e-5)
+
+
+def test_a_filter_outside_the_index_finds_nothing():
+    index, xb = _hnsw(_flat(500))
+    assert hybrid.vector_leg(index, "hnsw", xb[:1], 5, [1]) == []
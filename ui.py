@@ -1,4 +1,5 @@
 import json
+import time
 import requests
 import streamlit as st
 
@@ -20,6 +21,29 @@ def call_get(path: str, timeout: int = 20):
     r = requests.get(url, timeout=timeout)
     return r
 
+def stream_sse(path: str, payload: dict, timeout: int = 60):
+    """Yield (event, data) from a Server-Sent Events endpoint."""
+    url = f"{API_BASE}{path}"
+    with requests.post(url, json=payload, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        event = "message"
+        for line in r.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                yield event, json.loads(line[len("data: "):])
+
+def wait_for_job(job_id: str, timeout: int = 300):
+    """Poll /jobs/{job_id} until it finishes, showing progress. Returns the final job."""
+    bar = st.progress(0.0, text="queued")
+    deadline = time.time() + timeout
+    while True:
+        job = call_get(f"/jobs/{job_id}").json()
+        bar.progress(job.get("progress", 0.0), text=job.get("message") or job.get("status", ""))
+        if job.get("status") in ("succeeded", "failed") or time.time() > deadline:
+            return job
+        time.sleep(0.5)
+
 colA, colB = st.columns([2, 1])
 
 with colB:
@@ -35,10 +59,15 @@ with colB:
 
     if st.button("📥 Ingest SOP (/sop/ingest)"):
         try:
-            r = call_post("/sop/ingest", {}, timeout=120)
+            r = call_post("/sop/ingest", {}, timeout=20)
             st.write("Status:", r.status_code)
             st.write("X-Request-Id:", r.headers.get("X-Request-Id"))
-            st.json(r.json())
+            job = wait_for_job(r.json()["job_id"])
+            if job.get("status") == "failed":
+                st.error("SOP ingest job failed.")
+                st.code(job.get("error", ""))
+            else:
+                st.json(job.get("result"))
         except Exception as e:
             st.error("SOP ingest failed. Check backend logs.")
             st.exception(e)
@@ -55,8 +84,44 @@ with colA:
             height=90,
         )
         top_k = st.slider("Top-K retrieval", min_value=1, max_value=8, value=4)
+        stream = st.checkbox("Stream answer (/ask/stream)", value=True)
+
+        clicked = st.button("Ask", type="primary")
+
+        if clicked and stream:
+            try:
+                left, right = st.columns(2)
+                with right:
+                    st.subheader("Assistant Output")
+                    live = st.empty()
+                streamed = ""
+                for event, data in stream_sse("/ask/stream", {"question": q, "top_k": top_k}):
+                    if event == "retrieval":
+                        with left:
+                            if data.get("needs_escalation"):
+                                st.error("⚠️ Escalation required (low SOP confidence / insufficient coverage).")
+                            else:
+                                st.success("✅ Answered from approved SOPs (no guessing).")
+                            st.metric("Confidence", f"{data.get('confidence', 0.0):.2f}")
+                            st.subheader("Citations")
+                            st.json(data.get("citations", []))
+                    elif event == "token":
+                        streamed += data.get("delta", "")
+                        live.code(streamed)
+                    elif event == "answer":
+                        with live.container():
+                            if "result" in data:
+                                st.json({k: data.get(k) for k in ("answer", "next_steps", "risk_flags", "used_chunks")})
+                            else:
+                                st.write(data.get("answer", ""))
+                    elif event == "error":
+                        st.error(f"Stream failed: {data.get('error')}")
+
+            except Exception as e:
+                st.error("Backend not reachable. Start uvicorn and ensure API Base URL is correct.")
+                st.exception(e)
 
-        if st.button("Ask", type="primary"):
+        elif clicked:
             try:
                 r = call_post("/ask", {"question": q, "top_k": top_k}, timeout=60)
                 st.write("Status:", r.status_code)
@@ -132,8 +197,9 @@ with colA:
         if st.button("▶ Run Demo Sequence", type="primary"):
             try:
                 st.write("1) Ingest SOP...")
-                r1 = call_post("/sop/ingest", {}, timeout=120)
-                st.write("SOP ingest status:", r1.status_code)
+                r1 = call_post("/sop/ingest", {}, timeout=20)
+                job1 = wait_for_job(r1.json()["job_id"])
+                st.write("SOP ingest status:", job1.get("status"))
 
                 st.write("2) Ask SOP question...")
                 r2 = call_post("/ask", {"question": demo_q, "top_k": 4}, timeout=60)